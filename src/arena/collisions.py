@@ -0,0 +1,67 @@
+"""
+Define the collision checks between the agents and the obstacles. Every arena object is represented by its axis aligned
+bounding box (x_min, y_min, x_max, y_max) and two objects collide when their boxes overlap on both axes. All the
+agents are checked against all the obstacles with a single numpy operation.
+
+As the obstacles are always added at the right edge of the environment and scroll to the left together, they are
+already sorted by their x coordinate. The broad phase uses that order to find, with a binary search, the only obstacles
+which can overlap the agents on the x axis, so the number of checked obstacles does not grow with the obstacle density.
+"""
+import numpy as np
+
+X_MIN, Y_MIN, X_MAX, Y_MAX = 0, 1, 2, 3
+
+
+def get_bounding_boxes(arena_objects):
+    bounding_boxes = np.zeros((len(arena_objects), 4))
+    for index, arena_object in enumerate(arena_objects):
+        x, y = arena_object.get_position()
+        width, height = arena_object.get_dimensions()
+        bounding_boxes[index] = x, y, x + width, y + height
+    return bounding_boxes
+
+
+def get_sorted_window(sorted_x_min, x_min, x_max, max_width):
+    """
+    Broad phase for objects sorted by their x_min. An object can only overlap the interval [x_min, x_max] if its own
+    x_min is within [x_min - max_width, x_max], which is a contiguous window of the sorted objects.
+
+    :param sorted_x_min: The x_min of the objects in increasing order
+    :param max_width: The maximum width of the objects
+    :return: The start and end (exclusive) of the window
+    """
+    start = int(np.searchsorted(sorted_x_min, x_min - max_width, side='left'))
+    end = int(np.searchsorted(sorted_x_min, x_max, side='right'))
+    return start, max(start, end)
+
+
+def get_agents_x_interval(agent_boxes):
+    # The x interval covering all the agents. All the agents are at (almost) the same x, so it is barely larger than
+    # the interval of every single agent.
+    return agent_boxes[:, X_MIN].min(), agent_boxes[:, X_MAX].max()
+
+
+def get_overlap_matrix(agent_boxes, obstacle_boxes):
+    """
+    :return: A (number of agents, number of obstacles) boolean matrix which is True where the boxes overlap. Touching
+             boxes overlap, the same as the corner checks in Agent.collision_check.
+    """
+    agent_boxes = agent_boxes[:, np.newaxis, :]
+    obstacle_boxes = obstacle_boxes[np.newaxis, :, :]
+    return (agent_boxes[..., X_MIN] <= obstacle_boxes[..., X_MAX]) & \
+           (obstacle_boxes[..., X_MIN] <= agent_boxes[..., X_MAX]) & \
+           (agent_boxes[..., Y_MIN] <= obstacle_boxes[..., Y_MAX]) & \
+           (obstacle_boxes[..., Y_MIN] <= agent_boxes[..., Y_MAX])
+
+
+def get_crash_mask(agent_boxes, obstacle_boxes):
+    """
+    Interval overlap test of all the agents against all the obstacles. Unlike the corner checks it also finds the cross
+    shaped overlaps where no corner of either box is inside the other one (e.g. a ducking agent over a tall and narrow
+    cactus).
+
+    :return: A boolean array which is True for every agent overlapping any of the obstacles
+    """
+    if len(agent_boxes) == 0 or len(obstacle_boxes) == 0:
+        return np.zeros(len(agent_boxes), dtype=bool)
+    return np.any(get_overlap_matrix(agent_boxes, obstacle_boxes), axis=1)
@@ -0,0 +1,146 @@
+"""
+Define obstacle courses for the ChromeTRexRush environment. A course is the whole obstacle schedule of an episode
+(when each obstacle is added, its type, dimensions and height) generated up front. It is stored as a compact binary
+tape (a structured numpy array saved as .npy) which can be memory mapped and replayed by the environment with a cursor.
+Replaying the same course makes episodes repeatable and removes the obstacle spawning from the hot path.
+"""
+import numpy as np
+
+from arena_objects.obstacles import BIRD_DIMENSION, BIRD_HEIGHT_ADDITION, BIRD_ID, BIRD_LEVELS, CACTUS_DIMENSIONS, \
+    CACTUS_ID
+from utils.random_utils import get_random_state
+
+# One record (13 bytes) per obstacle. The frame is the environment frame at which the obstacle is added.
+COURSE_DTYPE = np.dtype([('frame', '<u4'), ('type', 'u1'), ('width', '<u2'), ('height', '<u2'), ('y', '<f4')])
+
+
+def save_course(course_file_path, course):
+    np.save(course_file_path, np.asarray(course, dtype=COURSE_DTYPE))
+
+
+def load_course(course_file_path, memory_map=True):
+    return np.load(course_file_path, mmap_mode='r' if memory_map else None)
+
+
+class CourseGenerator:
+    def __init__(self, environment_width=800, level_threshold=15, bird_add_threshold=1, obstacle_add_interval=45,
+                 agent_x_velocity=5.0, agent_x_acceleration=0.002, random_state=None):
+        """
+        The generator follows the same rules as ChromeTRexRush.add_obstacle. Those rules depend on the position of the
+        last obstacles, which in turn depends on how fast the agent runs, so the generator assumes an agent that keeps
+        accelerating with the given acceleration from the given velocity (the effect of jumps on the velocity is
+        negligible).
+
+        :param obstacle_add_interval: The number of frames between two updates of the environment statistics in the
+                                      game that will replay the course
+        :param random_state: The numpy random generator (or seed) used to generate the courses
+        """
+        self.__environment_width = environment_width
+        self.__level_increase_threshold = level_threshold
+        self.__bird_add_threshold = bird_add_threshold
+        self.__obstacle_add_interval = obstacle_add_interval
+        self.__agent_x_velocity = agent_x_velocity
+        self.__agent_x_acceleration = agent_x_acceleration
+        self.__random_state = get_random_state(random_state)
+
+    def get_random_state(self):
+        return self.__random_state
+
+    def should_add(self, x):
+        width = self.__environment_width
+        offset = self.__random_state.choice([50, 100, 150, 200, 250, 300])
+        if x < width - offset:
+            # The cdf of the standard exponential distribution
+            return self.__random_state.random() * 3.0 < -np.expm1(-(width - x) * 4 / width)
+        return False
+
+    def get_new_obstacle(self, frame, obstacle_type):
+        if obstacle_type == CACTUS_ID:
+            width, height = CACTUS_DIMENSIONS[self.__random_state.integers(len(CACTUS_DIMENSIONS))]
+            y = 0
+        else:
+            width, height = BIRD_DIMENSION
+            y = 50 + BIRD_LEVELS[self.__random_state.integers(len(BIRD_LEVELS))] * BIRD_HEIGHT_ADDITION
+        return frame, obstacle_type, width, height, y
+
+    def generate_course(self, num_frames):
+        """
+        :param num_frames: The number of frames covered by the course
+        :return: The course as a structured array of COURSE_DTYPE records sorted by frame
+        """
+        width = self.__environment_width
+        # Distance scrolled by the obstacles till every frame. The velocity of the agent at frame k (starting from 1)
+        # is relu(velocity + (k - 1) * acceleration), the same as Agent.update_velocity.
+        velocities = np.maximum(self.__agent_x_velocity + self.__agent_x_acceleration * np.arange(num_frames + 1), 0)
+        scrolled_distance = np.concatenate([[0], np.cumsum(velocities)])
+
+        course = []
+        last_obstacles = {CACTUS_ID: None, BIRD_ID: None}
+        score, level = 0, 0
+        # The statistics are updated after the update of the environment at frame 1, 1 + interval, ...
+        for frame in range(1, num_frames + 1, self.__obstacle_add_interval):
+            obstacle_type = CACTUS_ID
+            if level > self.__bird_add_threshold and self.__random_state.random() >= 0.8:
+                obstacle_type = BIRD_ID
+
+            last_obstacle = last_obstacles[obstacle_type]
+            if last_obstacle is not None:
+                last_frame, _, last_width, _, _ = last_obstacle
+                last_x = width - (scrolled_distance[frame] - scrolled_distance[last_frame])
+                if last_x + last_width < 0:
+                    # The last obstacle has already left the environment
+                    last_obstacle = None
+
+            add = False
+            if last_obstacle is not None:
+                # make sure that the last obstacle is at least entirely visible in the environment
+                if last_x + last_width < width:
+                    add = self.should_add(last_x + last_width if obstacle_type == CACTUS_ID else last_x)
+            else:
+                add = self.__random_state.random() < 0.95
+
+            if add:
+                new_obstacle = self.get_new_obstacle(frame, obstacle_type)
+                last_obstacles[obstacle_type] = new_obstacle
+                course.append(new_obstacle)
+
+            score += 1
+            if score >= self.__level_increase_threshold * (level + 1):
+                level += 1
+        return np.array(course, dtype=COURSE_DTYPE)
+
+    def write_course(self, course_file_path, num_frames):
+        course = self.generate_course(num_frames)
+        save_course(course_file_path, course)
+        return course
+
+
+class CourseTape:
+    def __init__(self, course):
+        """
+        Replays a course (possibly memory mapped) with a cursor pointing to the next obstacle to add.
+        """
+        self.__course = course
+        self.__frames = course['frame']
+        self.__cursor = 0
+
+    def get_course(self):
+        return self.__course
+
+    def get_cursor(self):
+        return self.__cursor
+
+    def rewind(self):
+        self.__cursor = 0
+
+    def has_ended(self):
+        return self.__cursor == len(self.__course)
+
+    def get_due_obstacles(self, frame):
+        # All the obstacles which have to be added till the given frame, moving the cursor after them
+        start = self.__cursor
+        end = start
+        while end < len(self.__frames) and self.__frames[end] <= frame:
+            end += 1
+        self.__cursor = end
+        return self.__course[start:end]
@@ -3,16 +3,25 @@ Define the environment for the game
 """
 import numpy as np
 
-from arena_objects.obstacles import Bird, Cactus
+from arena.courses import CourseTape
+from arena.obstacle_store import ObstacleStore
+from arena_objects.obstacles import Bird, Cactus, BIRD_ID, CACTUS_ID, OBSTACLE_VELOCITY
+from utils.random_utils import get_random_state
+
+OBSTACLE_TYPE_NAMES = {CACTUS_ID: 'c', BIRD_ID: 'b'}
 
 
 class ChromeTRexRush:
     def __init__(self, environment_width=800, environment_height=400,
                  level_threshold=15, high_score_file_path=f'../../data/high_score.txt',
-                 bird_add_threshold=1):
+                 bird_add_threshold=1, course=None, random_state=None):
+        """
+        :param course: An optional obstacle course (see arena.courses). If given, the obstacles are replayed from the
+                       course instead of being randomly generated while playing
+        :param random_state: The numpy random generator (or seed) used to generate the obstacles
+        """
         self.__environment_width, self.__environment_height = environment_width, environment_height
-        self.__cacti = []
-        self.__birds = []
+        self.__obstacles = ObstacleStore()
         self.__level = 0
         self.__level_increase_threshold = level_threshold
         self.__velocity_increase = 0
@@ -21,17 +30,39 @@ class ChromeTRexRush:
         self.__high_score_file_path = high_score_file_path
         self.__high_score = self.load_high_score()
         self.__bird_add_threshold = bird_add_threshold
+        self.__frame = 0
+        self.__course_tape = CourseTape(course) if course is not None else None
+        self.__random_state = get_random_state(random_state)
+
+    def get_random_state(self):
+        return self.__random_state
 
     def get_bird_add_threshold(self):
         return self.__bird_add_threshold
 
     def reset_environment(self):
-        self.__cacti = []
-        self.__birds = []
+        self.__obstacles.clear()
         self.__level = 0
         self.__velocity_increase = 0
         self.__need_to_increase_velocity = False
         self.__score = 0
+        self.__frame = 0
+        if self.__course_tape is not None:
+            self.__course_tape.rewind()
+
+    def get_course_tape(self):
+        return self.__course_tape
+
+    def set_course(self, course):
+        self.__course_tape = CourseTape(course) if course is not None else None
+
+    def is_course_exhausted(self):
+        # Whether all the obstacles of the course were added and have left the environment, after which the agents
+        # would run without any obstacle. Never the case for the randomly generated obstacles
+        return self.__course_tape is not None and self.__course_tape.has_ended() and len(self.__obstacles) == 0
+
+    def get_current_frame(self):
+        return self.__frame
 
     def get_high_score_file_path(self):
         return self.__high_score_file_path
@@ -71,29 +102,26 @@ class ChromeTRexRush:
         except FileNotFoundError:
             return
 
+    def get_obstacle_store(self):
+        return self.__obstacles
+
     def get_all_cacti(self):
-        return self.__cacti
+        return self.__obstacles.get_views(CACTUS_ID)
 
     def get_all_birds(self):
-        return self.__birds
+        return self.__obstacles.get_views(BIRD_ID)
 
     def get_last_cactus(self):
-        if self.get_all_cacti():
-            return self.get_all_cacti()[-1]
-        else:
-            return None
+        return self.__obstacles.get_last_view(CACTUS_ID)
 
     def get_last_bird(self):
-        if self.get_all_birds():
-            return self.get_all_birds()[-1]
-        else:
-            return None
+        return self.__obstacles.get_last_view(BIRD_ID)
 
     def should_add(self, x):
         from scipy.stats import expon
-        offset = np.random.choice([50, 100, 150, 200, 250, 300], 1)
+        offset = self.__random_state.choice([50, 100, 150, 200, 250, 300], 1)
         if x < self.get_environment_width() - offset:
-            return np.random.rand(1) * 3.0 < expon().cdf((self.get_environment_width() - x) * 4 /
+            return self.__random_state.random(1) * 3.0 < expon().cdf((self.get_environment_width() - x) * 4 /
                                                        self.get_environment_width())
         else:
             return False
@@ -102,42 +130,50 @@ class ChromeTRexRush:
         return self.__velocity_increase
 
     def add_cactus(self):
-        if self.get_all_cacti():
+        last_cactus = self.get_last_cactus()
+        if last_cactus is not None:
             # make sure that the last cactus is at least entirely visible in the environment
-            last_cactus = self.get_last_cactus()
             # print(last_cactus.get_x_pos())
             if last_cactus.get_x_pos() + last_cactus.get_width() < self.get_environment_width():
                 if self.should_add(last_cactus.get_x_pos() + last_cactus.get_width()):
-                    cactus = Cactus((self.get_environment_width(), 0))
-                    self.__cacti.append(cactus)
+                    cactus = Cactus((self.get_environment_width(), 0), random_state=self.__random_state)
+                    self.__obstacles.add_obstacle(cactus)
                     return True
         else:
             # 90% chance
-            if np.random.rand(1) < 0.95:
-                cactus = Cactus((self.get_environment_width(), 0))
-                self.__cacti.append(cactus)
+            if self.__random_state.random(1) < 0.95:
+                cactus = Cactus((self.get_environment_width(), 0), random_state=self.__random_state)
+                self.__obstacles.add_obstacle(cactus)
                 return True
 
     def add_bird(self):
-        if self.get_all_birds():
+        last_bird = self.get_last_bird()
+        if last_bird is not None:
             # make sure that the last cactus is at least entirely visible in the environment
-            last_bird = self.get_last_bird()
             if last_bird.get_x_pos() + last_bird.get_width() < self.get_environment_width():
                 if self.should_add(last_bird.get_x_pos()):
-                    bird = Bird((self.get_environment_width(), 50))
-                    self.__birds.append(bird)
+                    bird = Bird((self.get_environment_width(), 50), random_state=self.__random_state)
+                    self.__obstacles.add_obstacle(bird)
                     return True
         else:
             # 90% chance
-            if np.random.rand(1) < 0.95:
-                bird = Bird((self.get_environment_width(), 50))
-                self.__birds.append(bird)
+            if self.__random_state.random(1) < 0.95:
+                bird = Bird((self.get_environment_width(), 50), random_state=self.__random_state)
+                self.__obstacles.add_obstacle(bird)
                 return True
 
+    def replay_course(self):
+        # Add all the obstacles of the course which are due till the current frame
+        for frame, obstacle_type, width, height, y in self.__course_tape.get_due_obstacles(self.__frame).tolist():
+            self.__obstacles.add(obstacle_type, (self.get_environment_width(), y), OBSTACLE_VELOCITY, (0.0, 0.0),
+                                 (width, height))
+
     def add_obstacle(self):
-        if self.get_current_level() > self.get_bird_add_threshold():
+        if self.__course_tape is not None:
+            self.replay_course()
+        elif self.get_current_level() > self.get_bird_add_threshold():
             # try to add either bird or cactus
-            if np.random.rand(1) < 0.8:
+            if self.__random_state.random(1) < 0.8:
                 self.add_cactus()
             else:
                 self.add_bird()
@@ -152,74 +188,43 @@ class ChromeTRexRush:
             self.__level += 1
 
     def remove_out_of_environment_obstacles(self):
-        # Find the first cactus which is still in environment. Remove all cactus before it
-        remove_counter = 0
-        for cactus in self.get_all_cacti():
-            if cactus.get_x_pos() + cactus.get_width() < 0:
-                remove_counter += 1
-            else:
-                break
-        self.__cacti = self.__cacti[remove_counter:]
-        # Find the first bird which is still in environment. Remove all cactus before it
-        remove_counter = 0
-        for bird in self.get_all_birds():
-            if bird.get_x_pos() + bird.get_width() < 0:
-                remove_counter += 1
-            else:
-                break
-        self.__birds = self.__birds[remove_counter:]
+        # Remove all the obstacles which have completely left the environment
+        self.__obstacles.remove_out_of_environment_obstacles()
 
     def get_all_obstacle_list(self):
-        return self.get_all_cacti() + self.get_all_birds()
+        # The views of all the obstacles maintained by the store, so no new list is created on every call
+        return self.__obstacles.get_views()
+
+    def get_obstacles_by_distance(self):
+        # The distance ordered index of the obstacles. It is maintained incrementally by the obstacle store: obstacles
+        # are appended when they are added and popped from the front when they leave the environment.
+        return self.__obstacles.get_views()
 
     def get_closest_obstacle(self):
-        cacti = self.get_all_cacti()
-        birds = self.get_all_birds()
-        if len(cacti) == 0 and len(birds) == 0:
+        obstacles_by_distance = self.get_obstacles_by_distance()
+        if not obstacles_by_distance:
             return None, None
-        else:
-            if len(cacti) == 0:
-                return birds[0], 'b'
-            elif len(birds) == 0:
-                return cacti[0], 'c'
-            else:
-                if cacti[0].get_x_pos() < birds[0].get_x_pos():
-                    return cacti[0], 'c'
-                else:
-                    return birds[0], 'b'
+        closest_obstacle = obstacles_by_distance[0]
+        return closest_obstacle, OBSTACLE_TYPE_NAMES[closest_obstacle.get_id()]
+
+    def get_closest_obstacles(self, num_obstacles=1):
+        # The (type, x position, obstacle) of the closest obstacles, read from the head of the distance ordered index
+        closest_obstacles = []
+        for obstacle in self.get_obstacles_by_distance():
+            if len(closest_obstacles) == num_obstacles:
+                break
+            closest_obstacles.append((OBSTACLE_TYPE_NAMES[obstacle.get_id()], obstacle.get_x_pos(), obstacle))
+        return closest_obstacles
 
     def get_objects_sorted_by_distance(self):
-        cacti = self.get_all_cacti()
-        birds = self.get_all_birds()
-        ret = []
-        cacti_counter = 0
-        birds_counter = 0
-        while len(ret) != len(cacti) + len(birds):
-            if cacti_counter == len(cacti):
-                bird = birds[birds_counter]
-                ret.append(('b', bird.get_x_pos(), bird))
-                birds_counter += 1
-            elif birds_counter == len(birds):
-                cactus = cacti[cacti_counter]
-                ret.append(('c', cactus.get_x_pos(), cactus))
-                cacti_counter += 1
-            else:
-                cactus = cacti[cacti_counter]
-                bird = birds[birds_counter]
-                if cactus.get_x_pos() < bird.get_x_pos():
-                    ret.append(('c', cactus.get_x_pos(), cactus))
-                    cacti_counter += 1
-                else:
-                    ret.append(('b', bird.get_x_pos(), bird))
-                    birds_counter += 1
-        return ret
+        return self.get_closest_obstacles(len(self.get_obstacles_by_distance()))
 
     def update_obstacles(self, agent_x_velocity=0):
-        for obstacle in self.get_all_obstacle_list():
-            # print(obstacle.get_x_pos())
-            obstacle.update(agent_x_velocity)
+        # Update all the obstacles at once using the obstacle store
+        self.__obstacles.update(agent_x_velocity)
 
     def update_environment(self, agent_x_velocity=0):
+        self.__frame += 1
         # update the obstacles
         self.update_obstacles(agent_x_velocity)
         # Remove the obstacles which are out of the environment
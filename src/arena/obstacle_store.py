@@ -0,0 +1,252 @@
+"""
+This file defines an array backed store for the obstacles of an environment. Instead of keeping python lists of
+obstacle objects, the store keeps the state of every obstacle in contiguous numpy arrays (structure of arrays) so that
+all the obstacles can be updated with a single vectorized operation every frame.
+"""
+from collections import deque
+
+import numpy as np
+
+from arena.collisions import get_sorted_window
+
+
+class ObstacleView:
+    """
+    A lightweight view over a single obstacle in the obstacle store. It exposes the same getters as an ArenaObject so
+    that the drawing, collision and environment state code can keep treating it as an obstacle.
+
+    The view refers to the slot of the obstacle in the store, which does not change while the obstacle is in the
+    environment. The view is created once when the obstacle is added and is invalid after the obstacle is removed.
+    """
+    __slots__ = ('__store', '__index')
+
+    def __init__(self, store, index):
+        self.__store = store
+        self.__index = index
+
+    def get_index(self):
+        return self.__index
+
+    def get_id(self):
+        return int(self.__store.get_types()[self.__index])
+
+    def get_x_pos(self):
+        return float(self.__store.get_x_positions()[self.__index])
+
+    def get_y_pos(self):
+        return float(self.__store.get_y_positions()[self.__index])
+
+    def get_position(self):
+        return self.get_x_pos(), self.get_y_pos()
+
+    def get_x_vel(self):
+        return float(self.__store.get_x_velocities()[self.__index])
+
+    def get_y_vel(self):
+        return float(self.__store.get_y_velocities()[self.__index])
+
+    def get_velocity(self):
+        return self.get_x_vel(), self.get_y_vel()
+
+    def get_width(self):
+        return float(self.__store.get_widths()[self.__index])
+
+    def get_height(self):
+        return float(self.__store.get_heights()[self.__index])
+
+    def get_dimensions(self):
+        return self.get_width(), self.get_height()
+
+
+class ObstacleStore:
+    def __init__(self, initial_capacity=16):
+        """
+        The obstacles are stored in a ring buffer in the order in which they were added. As every obstacle is added at
+        the right edge of the environment and all of them scroll to the left with the same velocity, this order is also
+        the order of the obstacles by their x coordinate, and the obstacles always leave the environment from the front
+        of the ring. Adding an obstacle and removing the first one are both O(1) and never allocate arrays, unless the
+        ring is full and has to grow (which only happens until it fits the densest part of the episode).
+
+        The views of the obstacles are kept in deques next to the ring (one for all the obstacles and one for each
+        obstacle type), so reading the obstacles does not allocate anything either.
+
+        :param initial_capacity: The number of obstacles the store can hold before it needs to grow its arrays
+        """
+        self.__capacity = initial_capacity
+        self.__head = 0
+        self.__count = 0
+        self.__x = np.zeros(initial_capacity)
+        self.__y = np.zeros(initial_capacity)
+        self.__vx = np.zeros(initial_capacity)
+        self.__vy = np.zeros(initial_capacity)
+        self.__ax = np.zeros(initial_capacity)
+        self.__ay = np.zeros(initial_capacity)
+        self.__width = np.zeros(initial_capacity)
+        self.__height = np.zeros(initial_capacity)
+        self.__type = np.zeros(initial_capacity, dtype=np.int8)
+        self.__max_width = 0
+        self.__views = deque()
+        self.__type_views = {}
+
+    def __len__(self):
+        return self.__count
+
+    def __iter__(self):
+        # Iterate over the views of all the obstacles in the order of their x coordinate
+        return iter(self.__views)
+
+    def get_capacity(self):
+        return self.__capacity
+
+    def get_x_positions(self):
+        return self.__x
+
+    def get_y_positions(self):
+        return self.__y
+
+    def get_x_velocities(self):
+        return self.__vx
+
+    def get_y_velocities(self):
+        return self.__vy
+
+    def get_widths(self):
+        return self.__width
+
+    def get_heights(self):
+        return self.__height
+
+    def get_types(self):
+        return self.__type
+
+    def get_max_width(self):
+        return self.__max_width
+
+    def clear(self):
+        self.__head = 0
+        self.__count = 0
+        self.__max_width = 0
+        self.__views.clear()
+        for type_views in self.__type_views.values():
+            type_views.clear()
+
+    def get_all_arrays(self):
+        return [self.__x, self.__y, self.__vx, self.__vy, self.__ax, self.__ay, self.__width, self.__height,
+                self.__type]
+
+    def set_all_arrays(self, arrays):
+        self.__x, self.__y, self.__vx, self.__vy, self.__ax, self.__ay, self.__width, self.__height, \
+            self.__type = arrays
+
+    def get_slot_indices(self):
+        # The slots of all the obstacles in the order of their x coordinate
+        return (self.__head + np.arange(self.__count)) % self.__capacity
+
+    def get_segments(self):
+        # The ring as (at most two) contiguous ranges of slots, in the order of the x coordinate of the obstacles
+        end = self.__head + self.__count
+        if end <= self.__capacity:
+            return [(self.__head, end)]
+        return [(self.__head, self.__capacity), (0, end - self.__capacity)]
+
+    def grow(self):
+        # Unroll the ring into arrays twice as large. The slots of the obstacles change, so the views are recreated.
+        slot_indices = self.get_slot_indices()
+        new_capacity = 2 * self.__capacity
+        new_arrays = []
+        for array in self.get_all_arrays():
+            new_array = np.zeros(new_capacity, dtype=array.dtype)
+            new_array[:self.__count] = array[slot_indices]
+            new_arrays.append(new_array)
+        self.set_all_arrays(new_arrays)
+        self.__capacity = new_capacity
+        self.__head = 0
+        self.__views.clear()
+        for type_views in self.__type_views.values():
+            type_views.clear()
+        for index in range(self.__count):
+            view = ObstacleView(self, index)
+            self.__views.append(view)
+            self.get_views(view.get_id()).append(view)
+
+    def add(self, obstacle_type, position, velocity, acceleration, dimensions):
+        if self.__count == self.__capacity:
+            self.grow()
+        index = (self.__head + self.__count) % self.__capacity
+        self.__x[index], self.__y[index] = position
+        self.__vx[index], self.__vy[index] = velocity
+        self.__ax[index], self.__ay[index] = acceleration
+        self.__width[index], self.__height[index] = dimensions
+        self.__type[index] = obstacle_type
+        self.__max_width = max(self.__max_width, self.__width[index])
+        self.__count += 1
+        view = ObstacleView(self, index)
+        self.__views.append(view)
+        self.get_views(obstacle_type).append(view)
+        return index
+
+    def add_obstacle(self, obstacle):
+        return self.add(obstacle.get_id(), obstacle.get_position(), obstacle.get_velocity(),
+                        obstacle.get_acceleration(), obstacle.get_dimensions())
+
+    def update(self, agent_x_velocity=0):
+        # Same as Obstacle.update, but for all the obstacles at once. The free slots are updated as well as it is
+        # cheaper than masking them out and their values are never read.
+        self.__x -= agent_x_velocity
+        np.maximum(self.__y + self.__vy, 0, out=self.__y)
+        self.__vx += self.__ax
+        self.__vy += self.__ay
+
+    def remove_first_obstacle(self):
+        view = self.__views.popleft()
+        # The first obstacle overall is also the first obstacle of its type
+        self.__type_views[self.__type[self.__head]].popleft()
+        self.__head = (self.__head + 1) % self.__capacity
+        self.__count -= 1
+        return view
+
+    def remove_out_of_environment_obstacles(self):
+        # Find the first obstacle which is still in environment. Remove all obstacles before it
+        num_removed = 0
+        while self.__count > 0 and self.__x[self.__head] + self.__width[self.__head] < 0:
+            self.remove_first_obstacle()
+            num_removed += 1
+        return num_removed
+
+    def get_slot_bounding_boxes(self, indices):
+        x, y = self.__x[indices], self.__y[indices]
+        return np.stack([x, y, x + self.__width[indices], y + self.__height[indices]], axis=1)
+
+    def get_bounding_boxes(self, obstacle_type=None):
+        # (x_min, y_min, x_max, y_max) of all the obstacles, in the order of their x coordinate
+        indices = self.get_slot_indices()
+        if obstacle_type is not None:
+            indices = indices[self.__type[indices] == obstacle_type]
+        return self.get_slot_bounding_boxes(indices)
+
+    def get_bounding_boxes_in_x_range(self, x_min, x_max):
+        # Bounding boxes of the obstacles which can overlap [x_min, x_max] on the x axis, found by a binary search over
+        # the sorted x coordinates (of each contiguous segment of the ring) instead of a scan of all the obstacles
+        windows = []
+        for segment_start, segment_end in self.get_segments():
+            start, end = get_sorted_window(self.__x[segment_start:segment_end], x_min, x_max, self.__max_width)
+            if end > start:
+                windows.append(np.arange(segment_start + start, segment_start + end))
+        if not windows:
+            return np.zeros((0, 4))
+        return self.get_slot_bounding_boxes(windows[0] if len(windows) == 1 else np.concatenate(windows))
+
+    def get_views(self, obstacle_type=None):
+        """
+        The views of the obstacles (of the given type) in the order of their x coordinate. The returned deque is the
+        one maintained by the store, so it must not be modified.
+        """
+        if obstacle_type is None:
+            return self.__views
+        if obstacle_type not in self.__type_views:
+            self.__type_views[obstacle_type] = deque()
+        return self.__type_views[obstacle_type]
+
+    def get_last_view(self, obstacle_type=None):
+        views = self.get_views(obstacle_type)
+        return views[-1] if views else None
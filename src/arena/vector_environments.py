@@ -0,0 +1,337 @@
+"""
+Define a vectorized version of the ChromeTRexRush environment. It simulates many independent copies of the game (each
+with its own agent) in lockstep using numpy arrays, so that the cost of a step is shared by all the environments.
+"""
+import numpy as np
+
+from arena_objects.obstacles import BIRD_DIMENSION, BIRD_HEIGHT_ADDITION, BIRD_ID, BIRD_LEVELS, CACTUS_DIMENSIONS, \
+    CACTUS_ID
+from utils.random_utils import get_random_state
+
+# Agent states
+WALKING, JUMPING, DUCKING = 0, 1, 2
+# Agent actions (same as Agent.get_action_name_to_action_dict)
+NO_OP, LOW_JUMP, HIGH_JUMP, DUCK = 0, 1, 2, 3
+# Obstacle slot types. An empty slot does not contain any obstacle.
+EMPTY_SLOT = 0
+
+
+class VectorChromeTRexRush:
+    def __init__(self, agent, num_environments, environment_width=800, environment_height=400, level_threshold=15,
+                 bird_add_threshold=1, obstacle_add_interval=45, max_obstacles=8, random_state=None):
+        """
+        Every environment is the same as a ChromeTRexRush environment played by a single agent in a Game, where the
+        environment statistics are updated (obstacle added, score and level increased) every obstacle_add_interval
+        frames. An environment is done as soon as its agent has crashed, after which it is frozen until it is reset.
+
+        :param agent: A template agent. Its physics (velocity, acceleration, jump accelerations, dimensions) and its
+                      reward function are used for the agents of all the environments
+        :param num_environments: The number of environments simulated in lockstep
+        :param obstacle_add_interval: The number of frames between two updates of the environment statistics
+        :param max_obstacles: The initial number of obstacle slots per environment. The slots of all the environments
+                              grow (like the arrays of an ObstacleStore) when an obstacle is added to an environment
+                              whose slots are all taken
+        :param random_state: The numpy random generator (or seed) used to generate the obstacles
+        """
+        self.__num_environments = num_environments
+        self.__environment_width, self.__environment_height = environment_width, environment_height
+        self.__level_increase_threshold = level_threshold
+        self.__bird_add_threshold = bird_add_threshold
+        self.__obstacle_add_interval = obstacle_add_interval
+        self.__max_obstacles = max_obstacles
+        self.__random_state = get_random_state(random_state)
+
+        # Agent physics taken from the template agent
+        self.__initial_x_velocity, self.__initial_y_velocity = agent.get_initial_velocity()
+        self.__x_acceleration, self.__y_acceleration = agent.get_initial_acceleration()
+        self.__low_jump_acceleration = tuple(agent.get_jump_acceleration('l'))
+        self.__high_jump_acceleration = tuple(agent.get_jump_acceleration('h'))
+        self.__walking_dimensions = agent.get_walking_dimensions()
+        self.__ducking_dimensions = agent.get_ducking_dimensions()
+        # Agent rewards taken from the template agent
+        action_rewards = agent.get_action_rewards()
+        self.__action_rewards = np.array([action_rewards[action] for action in range(len(action_rewards))])
+        self.__crash_reward = agent.get_crash_reward()
+
+        shape = (num_environments,)
+        # Agent state
+        self.__y = np.zeros(shape)
+        self.__vx = np.zeros(shape)
+        self.__vy = np.zeros(shape)
+        self.__jump_x_acceleration = np.zeros(shape)
+        self.__agent_state = np.zeros(shape, dtype=np.int8)
+        self.__agent_width = np.zeros(shape)
+        self.__agent_height = np.zeros(shape)
+        self.__current_action = np.zeros(shape, dtype=np.int64)
+        self.__crashed = np.zeros(shape, dtype=bool)
+        self.__total_reward = np.zeros(shape)
+        # Environment state
+        self.__frame_counter = np.zeros(shape, dtype=np.int64)
+        self.__score = np.zeros(shape, dtype=np.int64)
+        self.__level = np.zeros(shape, dtype=np.int64)
+        # Obstacle state: one row of obstacle slots per environment
+        obstacles_shape = (num_environments, max_obstacles)
+        self.__obstacle_x = np.zeros(obstacles_shape)
+        self.__obstacle_y = np.zeros(obstacles_shape)
+        self.__obstacle_width = np.zeros(obstacles_shape)
+        self.__obstacle_height = np.zeros(obstacles_shape)
+        self.__obstacle_type = np.zeros(obstacles_shape, dtype=np.int8)
+        self.__last_cactus_slot = np.full(shape, -1, dtype=np.int64)
+        self.__last_bird_slot = np.full(shape, -1, dtype=np.int64)
+
+        self.reset()
+
+    def get_random_state(self):
+        return self.__random_state
+
+    def get_num_environments(self):
+        return self.__num_environments
+
+    def get_environment_width(self):
+        return self.__environment_width
+
+    def get_environment_height(self):
+        return self.__environment_height
+
+    def get_current_levels(self):
+        return self.__level
+
+    def get_current_scores(self):
+        return self.__score
+
+    def get_total_rewards(self):
+        return self.__total_reward
+
+    def get_crashed(self):
+        return self.__crashed
+
+    def get_current_actions(self):
+        return self.__current_action
+
+    def get_frame_counters(self):
+        return self.__frame_counter
+
+    def get_agent_y_positions(self):
+        return self.__y
+
+    def get_agent_x_velocities(self):
+        return self.__vx
+
+    def get_agent_states(self):
+        return self.__agent_state
+
+    def get_agent_dimensions(self):
+        return self.__agent_width, self.__agent_height
+
+    def get_max_obstacles(self):
+        # The current number of obstacle slots per environment
+        return self.__max_obstacles
+
+    def get_obstacles(self):
+        return self.__obstacle_x, self.__obstacle_y, self.__obstacle_width, self.__obstacle_height, \
+               self.__obstacle_type
+
+    def reset(self, environment_indices=None):
+        """
+        Reset the given environments (all of them by default) and return the observations of all the environments
+        """
+        if environment_indices is None:
+            environment_indices = np.arange(self.__num_environments)
+        self.__y[environment_indices] = 0
+        self.__vx[environment_indices] = self.__initial_x_velocity
+        self.__vy[environment_indices] = self.__initial_y_velocity
+        self.__jump_x_acceleration[environment_indices] = self.__low_jump_acceleration[0]
+        self.__agent_state[environment_indices] = WALKING
+        self.__agent_width[environment_indices], self.__agent_height[environment_indices] = self.__walking_dimensions
+        self.__current_action[environment_indices] = NO_OP
+        self.__crashed[environment_indices] = False
+        self.__total_reward[environment_indices] = 0
+        self.__frame_counter[environment_indices] = 0
+        self.__score[environment_indices] = 0
+        self.__level[environment_indices] = 0
+        self.__obstacle_type[environment_indices] = EMPTY_SLOT
+        self.__last_cactus_slot[environment_indices] = -1
+        self.__last_bird_slot[environment_indices] = -1
+        return self.get_observations()
+
+    def get_closest_obstacle_slots(self, obstacle_type):
+        # Closest obstacle of the given type in every environment (-1 if the environment does not have one)
+        x = np.where(self.__obstacle_type == obstacle_type, self.__obstacle_x, np.inf)
+        closest_slots = np.argmin(x, axis=1)
+        rows = np.arange(self.__num_environments)
+        return np.where(np.isfinite(x[rows, closest_slots]), closest_slots, -1)
+
+    def get_observations(self):
+        """
+        The observations are the same as the environment states of GeneticAlgorithmGame.get_environment_state, one row
+        per environment.
+        """
+        width, height = self.__environment_width, self.__environment_height
+        rows = np.arange(self.__num_environments)
+
+        cactus_slots = self.get_closest_obstacle_slots(CACTUS_ID)
+        has_cactus = cactus_slots >= 0
+        closest_cactus_x = np.where(has_cactus, self.__obstacle_x[rows, cactus_slots], width)
+        closest_cactus_width = np.where(has_cactus, self.__obstacle_width[rows, cactus_slots], 0)
+
+        bird_slots = self.get_closest_obstacle_slots(BIRD_ID)
+        has_bird = bird_slots >= 0
+        closest_bird_x = np.where(has_bird, self.__obstacle_x[rows, bird_slots], width)
+        closest_bird_y = np.where(has_bird, self.__obstacle_y[rows, bird_slots], height)
+
+        observations = np.zeros((self.__num_environments, 7))
+        observations[:, 0] = 1
+        observations[:, 1] = self.__current_action / 4
+        observations[:, 3] = 1 - closest_cactus_x / width
+        observations[:, 4] = closest_cactus_width / width
+        observations[:, 5] = 1 - closest_bird_x / width
+        observations[:, 6] = 1 - closest_bird_y / height
+        return observations
+
+    def update_obstacles(self, active):
+        # Scroll the obstacles of the active environments with the velocity of their agent
+        self.__obstacle_x[active] -= self.__vx[active, np.newaxis]
+        # Remove the obstacles which are out of the environment
+        out_of_environment = (self.__obstacle_x + self.__obstacle_width < 0) & active[:, np.newaxis]
+        self.__obstacle_type[out_of_environment] = EMPTY_SLOT
+
+    def update_agents(self, actions, active):
+        on_ground = self.__y == 0
+        jumping = self.__agent_state == JUMPING
+        # Jump if not already in air (or at ground after the previous jump)
+        start_jump = active & ((actions == LOW_JUMP) | (actions == HIGH_JUMP)) & (~jumping | on_ground)
+        self.__vx[start_jump] += self.__jump_x_acceleration[start_jump]
+        self.__vy[start_jump] += np.where(actions[start_jump] == LOW_JUMP, self.__low_jump_acceleration[1],
+                                          self.__high_jump_acceleration[1])
+        self.__agent_state[start_jump] = JUMPING
+        # Duck only when not in the jumping state
+        self.__agent_state[active & (actions == DUCK) & ~jumping] = DUCKING
+        # No-op means walking if not in air
+        self.__agent_state[active & (actions == NO_OP) & (~jumping | on_ground)] = WALKING
+
+        # Update the position and then the velocity (same as Agent.update_position and Agent.update_velocity)
+        self.__y[active] = np.maximum(self.__y[active] + self.__vy[active], 0)
+        self.__vx[active] = np.maximum(self.__vx[active] + self.__x_acceleration, 0)
+        self.__vy[active] += self.__y_acceleration
+        self.__vy[active & (self.__y == 0)] = 0
+
+        # Finish the jump of the agents which are back on the ground
+        self.__agent_state[active & (self.__agent_state == JUMPING) & (self.__y == 0)] = WALKING
+        ducking = self.__agent_state == DUCKING
+        self.__agent_width[active] = np.where(ducking[active], self.__ducking_dimensions[0],
+                                              self.__walking_dimensions[0])
+        self.__agent_height[active] = np.where(ducking[active], self.__ducking_dimensions[1],
+                                               self.__walking_dimensions[1])
+        self.__current_action[active] = actions[active]
+
+    def get_collisions(self):
+        # Axis aligned bounding box overlap between every agent and all the obstacles of its environment. The agent is
+        # always at x = 0.
+        overlap = (self.__obstacle_type != EMPTY_SLOT) & \
+                  (self.__obstacle_x <= self.__agent_width[:, np.newaxis]) & \
+                  (self.__obstacle_x + self.__obstacle_width >= 0) & \
+                  (self.__obstacle_y <= (self.__y + self.__agent_height)[:, np.newaxis]) & \
+                  (self.__obstacle_y + self.__obstacle_height >= self.__y[:, np.newaxis])
+        return np.any(overlap, axis=1)
+
+    def should_add(self, x):
+        # Vectorized version of ChromeTRexRush.should_add
+        width = self.__environment_width
+        offset = self.__random_state.choice([50, 100, 150, 200, 250, 300], len(x))
+        # The cdf of the standard exponential distribution
+        add_probability = -np.expm1(-np.maximum(width - x, 0) * 4 / width)
+        return (x < width - offset) & (self.__random_state.random(len(x)) * 3.0 < add_probability)
+
+    def can_add_obstacle(self, environment_indices, last_slots, obstacle_type, use_right_edge):
+        # Same rules as ChromeTRexRush.add_cactus and ChromeTRexRush.add_bird
+        last_slots = last_slots[environment_indices]
+        safe_slots = np.maximum(last_slots, 0)
+        has_last = (last_slots >= 0) & (self.__obstacle_type[environment_indices, safe_slots] == obstacle_type)
+        last_x = self.__obstacle_x[environment_indices, safe_slots]
+        last_right_edge = last_x + self.__obstacle_width[environment_indices, safe_slots]
+        can_add = self.__random_state.random(len(environment_indices)) < 0.95
+        can_add[has_last] = (last_right_edge[has_last] < self.__environment_width) & \
+            self.should_add((last_right_edge if use_right_edge else last_x)[has_last])
+        return environment_indices[can_add]
+
+    def grow_obstacle_slots(self):
+        # Double the obstacle slots of all the environments. The obstacles keep their slots, the new ones are empty
+        num_slots = self.__max_obstacles
+        self.__obstacle_x, self.__obstacle_y, self.__obstacle_width, self.__obstacle_height, self.__obstacle_type = \
+            [np.concatenate([array, np.zeros_like(array)], axis=1) for array in self.get_obstacles()]
+        self.__max_obstacles = 2 * num_slots
+
+    def get_free_obstacle_slots(self, environment_indices):
+        # The first empty slot of every given environment, after growing the slots if an environment has none left
+        free_slots = self.__obstacle_type[environment_indices] == EMPTY_SLOT
+        if not np.all(np.any(free_slots, axis=1)):
+            self.grow_obstacle_slots()
+            free_slots = self.__obstacle_type[environment_indices] == EMPTY_SLOT
+        return np.argmax(free_slots, axis=1)
+
+    def place_obstacles(self, environment_indices, obstacle_type):
+        slots = self.get_free_obstacle_slots(environment_indices)
+        num_obstacles = len(environment_indices)
+        self.__obstacle_x[environment_indices, slots] = self.__environment_width
+        if obstacle_type == CACTUS_ID:
+            dimensions = np.array(CACTUS_DIMENSIONS)[self.__random_state.integers(len(CACTUS_DIMENSIONS),
+                                                                                   size=num_obstacles)]
+            self.__obstacle_y[environment_indices, slots] = 0
+            self.__obstacle_width[environment_indices, slots] = dimensions[:, 0]
+            self.__obstacle_height[environment_indices, slots] = dimensions[:, 1]
+            self.__last_cactus_slot[environment_indices] = slots
+        else:
+            levels = np.array(BIRD_LEVELS)[self.__random_state.integers(len(BIRD_LEVELS), size=num_obstacles)]
+            self.__obstacle_y[environment_indices, slots] = 50 + levels * BIRD_HEIGHT_ADDITION
+            self.__obstacle_width[environment_indices, slots] = BIRD_DIMENSION[0]
+            self.__obstacle_height[environment_indices, slots] = BIRD_DIMENSION[1]
+            self.__last_bird_slot[environment_indices] = slots
+        self.__obstacle_type[environment_indices, slots] = obstacle_type
+
+    def add_obstacles(self, environment_indices):
+        # Same as ChromeTRexRush.add_obstacle: after the bird threshold level, 20% of the obstacles are birds
+        add_bird = self.__level[environment_indices] > self.__bird_add_threshold
+        add_bird[add_bird] = self.__random_state.random(np.count_nonzero(add_bird)) >= 0.8
+        cactus_indices = self.can_add_obstacle(environment_indices[~add_bird], self.__last_cactus_slot, CACTUS_ID,
+                                               True)
+        self.place_obstacles(cactus_indices, CACTUS_ID)
+        bird_indices = self.can_add_obstacle(environment_indices[add_bird], self.__last_bird_slot, BIRD_ID, False)
+        self.place_obstacles(bird_indices, BIRD_ID)
+
+    def update_environment_statistics(self, active):
+        # Update the statistics of the environments (add obstacle, increase score and level) at the given interval
+        environment_indices = np.flatnonzero(active & (self.__frame_counter % self.__obstacle_add_interval == 0))
+        self.add_obstacles(environment_indices)
+        self.__score[environment_indices] += 1
+        level_up = self.__score[environment_indices] >= \
+            self.__level_increase_threshold * (self.__level[environment_indices] + 1)
+        self.__level[environment_indices[level_up]] += 1
+
+    def step(self, actions):
+        """
+        Simulate a single frame in every environment which is not done yet.
+
+        :param actions: The action of the agent in every environment
+        :return: The observations, the rewards of the actions (crash reward if the agent crashed in this frame, 0 if
+                 the environment was already done) and the done flags of all the environments
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        active = ~self.__crashed
+        # Same order as Game.update_game followed by Game.update_environment_statistics
+        self.update_obstacles(active)
+        self.update_agents(actions, active)
+        crashed_now = active & self.get_collisions()
+        self.__crashed |= crashed_now
+        alive = active & ~crashed_now
+
+        rewards = np.zeros(self.__num_environments)
+        rewards[alive] = self.__action_rewards[actions[alive]]
+        rewards[crashed_now] = self.__crash_reward
+        # Just like Game.update_game_agents_reward, the crash reward is not part of the total reward of the agent
+        self.__total_reward += rewards * alive
+        # Same as Agent.update_agent_acceleration
+        self.__jump_x_acceleration[active] = self.__level[active] * 0.000002
+
+        self.update_environment_statistics(active)
+        self.__frame_counter[active] += 1
+        return self.get_observations(), rewards, self.__crashed.copy()
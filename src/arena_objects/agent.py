@@ -5,9 +5,15 @@ This file defines the Dinosaur class that will help in drawing the dinosaur in t
 import numpy as np
 
 from arena_object import ArenaObject
+from utils.random_utils import get_random_state
 
 
 class Agent(ArenaObject):
+    # __ax is only written by update_agent_acceleration and is separate from the acceleration of the ArenaObject
+    __slots__ = ('__old_initial_velocity', '__old_acceleration', '__walking', '__jumping', '__ducking', '__crashed',
+                 '__walk_dims', '__duck_dims', '__high_jump_acc', '__low_jump_acc', '__current_action',
+                 '__total_reward', '__action_counts', '__truncated', '__ax')
+
     def __init__(self, object_id, init_pos, initial_velocity, object_acceleration, object_dimension,
                  walking_dimensions=(40, 80), ducking_dimensions=(80, 40), low_jump_acceleration=[0.0, 11.5],
                  high_jump_acceleration=[0.0, 15.0]):
@@ -18,10 +24,13 @@ class Agent(ArenaObject):
         self.__jumping = False
         self.__ducking = False
         self.__crashed = False
+        # Whether the episode of the agent was stopped by a frame or time limit before it crashed
+        self.__truncated = False
         self.__walk_dims = walking_dimensions
         self.__duck_dims = ducking_dimensions
-        self.__high_jump_acc = high_jump_acceleration
-        self.__low_jump_acc = low_jump_acceleration
+        # Copy the jump accelerations as they are updated with the level (and the defaults are shared by all agents)
+        self.__high_jump_acc = list(high_jump_acceleration)
+        self.__low_jump_acc = list(low_jump_acceleration)
         self.__current_action = 0
         self.__total_reward = 0
         self.__action_counts = [0 for _ in range(len(self.get_action_name_to_action_dict()))]
@@ -38,6 +47,7 @@ class Agent(ArenaObject):
     def reset_agent(self):
         self.walk()
         self.set_crashed(False)
+        self.set_truncated(False)
         self.__current_action = 0
         self.__total_reward = 0
         self.__action_counts = [0 for _ in range(len(self.get_action_name_to_action_dict()))]
@@ -57,6 +67,18 @@ class Agent(ArenaObject):
         self.__walking, self.__jumping, self.__ducking = False, True, False
         self.set_dims(self.__walk_dims)
 
+    def get_walking_dimensions(self):
+        return self.__walk_dims
+
+    def get_ducking_dimensions(self):
+        return self.__duck_dims
+
+    def get_initial_velocity(self):
+        return self.__old_initial_velocity
+
+    def get_initial_acceleration(self):
+        return self.__old_acceleration
+
     def update_dimensions(self):
         if self.__walking or self.__jumping:
             self.set_dims(self.__walk_dims)
@@ -75,6 +97,16 @@ class Agent(ArenaObject):
     def set_crashed(self, crash):
         self.__crashed = crash
 
+    def is_truncated(self):
+        return self.__truncated
+
+    def set_truncated(self, truncated):
+        self.__truncated = truncated
+
+    def is_done(self):
+        # The episode of the agent is over, either because it crashed or because it was truncated
+        return self.__crashed or self.__truncated
+
     def get_total_reward(self):
         # if self.reward_adjustment():
         #     return -30
@@ -132,27 +164,37 @@ class Agent(ArenaObject):
             return True
         return False
 
+    @staticmethod
+    def overlap_check(arena_object_1, arena_object_2):
+        # The objects collide if their intervals overlap on both the axes. Unlike the corner checks of collision_check
+        # this also finds the overlaps where no corner of either object is inside the other one
+        (ao_1_x, ao_1_y), (ao_1_w, ao_1_h) = arena_object_1.get_position(), arena_object_1.get_dimensions()
+        (ao_2_x, ao_2_y), (ao_2_w, ao_2_h) = arena_object_2.get_position(), arena_object_2.get_dimensions()
+        return ao_1_x <= ao_2_x + ao_2_w and ao_2_x <= ao_1_x + ao_1_w and \
+            ao_1_y <= ao_2_y + ao_2_h and ao_2_y <= ao_1_y + ao_1_h
+
     def has_collided_with_obstacle(self, obstacles: list):
         # Implement the algorithm that checks whether the object has crashed or not
         for obstacle in obstacles:
-            if self.collision_check(self, obstacle) or self.collision_check(obstacle, self):
+            if self.overlap_check(self, obstacle):
                 return True
         return False
 
+    @staticmethod
+    def get_crash_reward():
+        return -100
+
+    @staticmethod
+    def get_action_rewards():
+        return {0: 0, 1: -3, 2: -5, 3: -1}
+
     def get_current_action_reward(self):
         # If the agent has crashed then return negative reward
         if self.has_crashed():
-            return -100
+            return self.get_crash_reward()
         else:
             # Else return reward based on the action
-            if self.get_current_action() == 1:
-                return -3
-            elif self.get_current_action() == 2:
-                return -5
-            elif self.get_current_action() == 3:
-                return -1
-            else:
-                return 0
+            return self.get_action_rewards().get(self.get_current_action(), 0)
 
     def get_jump_acceleration(self, jump_type):
         if jump_type == 'l':
@@ -164,13 +206,12 @@ class Agent(ArenaObject):
 
     def process_jump_action(self, action_name):
         if action_name.lower() == 'low_jump':
-            # Set the initial y velocity for the dinosaur based upon the jump type
-            self.set_vel((self.get_x_vel() + self.get_jump_acceleration('l')[0],
-                          self.get_y_vel() + self.get_jump_acceleration('l')[1]))
+            jump_acceleration = self.__low_jump_acc
         else:
-            # Set the initial y velocity for the dinosaur based upon the jump type
-            self.set_vel((self.get_x_vel() + self.get_jump_acceleration('h')[0],
-                          self.get_y_vel() + self.get_jump_acceleration('h')[1]))
+            jump_acceleration = self.__high_jump_acc
+        # Set the initial y velocity for the dinosaur based upon the jump type
+        self.set_x_vel(self.get_x_vel() + jump_acceleration[0])
+        self.set_y_vel(self.get_y_vel() + jump_acceleration[1])
         # Change the jump variables accordingly so we can show in jump state
         self.jump()
 
@@ -192,16 +233,17 @@ class Agent(ArenaObject):
     def update_position(self):
         # Dinosaur always stay at the same x coordinate. However The y position should be changed based on whether
         # the dinosaur is jumping or not
-        x_pos, y_pos = 0, Dinosaur.relu(self.get_y_pos() + self.get_y_vel())
-        self.set_pos((x_pos, y_pos))
+        self.set_x_pos(0)
+        self.set_y_pos(Dinosaur.relu(self.get_y_pos() + self.get_y_vel()))
 
     def update_velocity(self):
         # Update the velocity based upon the acceleration
-        x_vel, y_vel = Dinosaur.relu(self.get_x_vel() + self.get_x_acc()), self.get_y_vel() + self.get_y_acc()
+        self.set_x_vel(Dinosaur.relu(self.get_x_vel() + self.get_x_acc()))
         # Make sure the y velocity is 0 if the object is on ground (y == 0)
         if self.get_y_pos() == 0:
-            y_vel = 0
-        self.set_vel((x_vel, y_vel))
+            self.set_y_vel(0)
+        else:
+            self.set_y_vel(self.get_y_vel() + self.get_y_acc())
 
     def update_agent(self):
         # get the current action for the agent
@@ -259,6 +301,8 @@ class Agent(ArenaObject):
 
 
 class Dinosaur(Agent):
+    __slots__ = ()
+
     def __init__(self, initial_position=(0, 0), initial_velocity=(5.0, 0), object_acceleration=(0.002, -0.5),
                  walking_dimensions=(25, 80), ducking_dimensions=(80, 25), low_jump_acceleration=[0.0, 11.5],
                  high_jump_acceleration=[0.0, 15.0]):
@@ -285,6 +329,8 @@ class Dinosaur(Agent):
 
 
 class GeneticAlgorithmAgent(Agent):
+    __slots__ = ('__weights', '__environment_state')
+
     def __init__(self, agent_weights, initial_position=(0, 0), initial_velocity=(5.0, 0),
                  object_acceleration=(0.002, -0.5), walking_dimensions=(30, 80), ducking_dimensions=(80, 30),
                  low_jump_acceleration=[0.002, 11.5], high_jump_acceleration=[0.002, 15.0]):
@@ -310,43 +356,39 @@ class GeneticAlgorithmAgent(Agent):
 
     @staticmethod
     def softmax_activation(vector):
-        return np.exp(vector) / np.sum(np.exp(vector))
+        # Shifted by the maximum so that large (or all very negative) values do not overflow to nan
+        exponentials = np.exp(vector - np.max(vector))
+        return exponentials / np.sum(exponentials)
 
     def get_best_action(self):
         # Make sure the weight matrix dimensions match the environment state length
         assert self.get_weights().shape[1] == len(self.get_current_environment_state())
-        # Get the probabilities for each action using the softmax activation
-        action_probabilities = GeneticAlgorithmAgent.softmax_activation(np.matmul(self.get_weights(),
-                                                                                  self.get_current_environment_state()))
-        # Return the index of the best action: maximum probability
-        return np.argmax(action_probabilities)
+        # Return the index of the best action. The softmax activation does not change which action has the maximum
+        # probability, so the action scores are compared directly
+        return np.argmax(np.matmul(self.get_weights(), self.get_current_environment_state()))
 
     def update(self):
         best_action = self.get_best_action()
         self.set_current_action(best_action)
         self.update_agent()
 
-    def get_current_action_reward(self):
-        # If the agent has crashed then return negative reward
-        if self.has_crashed():
-            return -1
-        else:
-            # Else return reward based on the action
-            if self.get_current_action() == 1:
-                return 0.000005
-            elif self.get_current_action() == 2:
-                return 0.000001
-            elif self.get_current_action() == 3:
-                return 0.00001
-            else:
-                return 0.00015
+    @staticmethod
+    def get_crash_reward():
+        return -1
+
+    @staticmethod
+    def get_action_rewards():
+        return {0: 0.00015, 1: 0.000005, 2: 0.000001, 3: 0.00001}
 
 
 class QLearningAgent(Agent):
+    __slots__ = ('__environment_state', '__random_state')
+
     def __init__(self, environment_state=None, initial_position=(0, 0), initial_velocity=(5.0, 0),
                  object_acceleration=(0.00002, -0.5), walking_dimensions=(30, 80), ducking_dimensions=(80, 30),
-                 low_jump_acceleration=[0.00002, 11.5], high_jump_acceleration=[0.00002, 15.0]):
+                 low_jump_acceleration=[0.00002, 11.5], high_jump_acceleration=[0.00002, 15.0], random_state=None):
         self.__environment_state = environment_state
+        self.__random_state = get_random_state(random_state)
         super(QLearningAgent, self).__init__(0, initial_position, initial_velocity, object_acceleration,
                                              walking_dimensions, walking_dimensions, ducking_dimensions,
                                              low_jump_acceleration, high_jump_acceleration)
@@ -357,11 +399,14 @@ class QLearningAgent(Agent):
     def set_environment_state(self, new_environment_state):
         self.__environment_state = new_environment_state
 
+    def get_random_state(self):
+        return self.__random_state
+
     def get_best_action(self, q_function=None):
-        if np.random.rand(1) < 0.99:
+        if self.__random_state.random(1) < 0.99:
             return np.argmax(q_function[self.get_environment_state()])
         else:
-            return np.random.choice([0, 1, 2, 3], 1)[0]
+            return self.__random_state.choice([0, 1, 2, 3], 1)[0]
 
     def update(self, q_function=None):
         best_action = self.get_best_action(q_function)
@@ -5,6 +5,10 @@ implement all the methods required.
 
 
 class ArenaObject:
+    # The fields are kept in slots instead of a per object __dict__, which makes the objects smaller and the field
+    # accesses faster
+    __slots__ = ('__id', '__x', '__y', '__vx', '__vy', '__ax', '__ay', '__width', '__height')
+
     def __init__(self, object_id, init_pos, initial_velocity, object_acceleration, dimensions):
         """
         The coordinate system will be defined from the bottom left as (0, 0) and upper right as (inf, inf)
@@ -65,28 +69,45 @@ class ArenaObject:
     def set_pos(self, position):
         self.__x, self.__y = position
 
+    def set_x_pos(self, x_pos):
+        self.__x = x_pos
+
+    def set_y_pos(self, y_pos):
+        self.__y = y_pos
+
     def set_vel(self, velocity):
         self.__vx, self.__vy = velocity
 
+    def set_x_vel(self, x_vel):
+        self.__vx = x_vel
+
+    def set_y_vel(self, y_vel):
+        self.__vy = y_vel
+
     def set_acc(self, acceleration):
         self.__ax, self.__ay = acceleration
 
     def set_dims(self, dims):
         self.__width, self.__height = dims
 
+    def state(self):
+        # All the physical fields of the object at once: x, y, vx, vy, ax, ay, width, height
+        return self.__x, self.__y, self.__vx, self.__vy, self.__ax, self.__ay, self.__width, self.__height
+
+    def load_state(self, state):
+        self.__x, self.__y, self.__vx, self.__vy, self.__ax, self.__ay, self.__width, self.__height = state
+
     @staticmethod
     def relu(val):
         return max(0, val)
 
     def update_position(self):
-        x_pos = self.get_x_pos() + self.get_x_vel()
-        y_pos = ArenaObject.relu(self.get_y_pos() + self.get_y_vel())
-        self.set_pos((x_pos, y_pos))
+        self.__x += self.__vx
+        self.__y = ArenaObject.relu(self.__y + self.__vy)
 
     def update_velocity(self):
-        x_vel = self.get_x_vel() + self.get_x_acc()
-        y_vel = self.get_y_vel() + self.get_y_acc()
-        self.set_vel((x_vel, y_vel))
+        self.__vx += self.__ax
+        self.__vy += self.__ay
 
     def update(self):
         self.update_position()
@@ -2,19 +2,30 @@
 This file defines the various obstacle classes that will help in drawing the dinosaur in the arena.
 """
 
-import random
-
 from arena_object import ArenaObject
+from utils.random_utils import get_random_state
+
+CACTUS_ID = 1
+BIRD_ID = 2
+
+CACTUS_DIMENSIONS = [(20, 40), (20, 50), (20, 60), (20, 70), (30, 50), (30, 60), (30, 80), (40, 50), (40, 65),
+                     (40, 80), (50, 30), (50, 60), (60, 30), (60, 60), (70, 30), (70, 50), (70, 60), (80, 60),
+                     (80, 30), (100, 30), (100, 30)]
+BIRD_DIMENSION = (40, 30)
+BIRD_LEVELS = [i*0.2 for i in range(0, 36)]
+BIRD_HEIGHT_ADDITION = 20
+OBSTACLE_VELOCITY = (-3, 0)
 
 
 class Obstacle(ArenaObject):
+    __slots__ = ()
+
     def __init__(self, object_id, init_pos, initial_velocity, object_acceleration, dimensions):
         super(Obstacle, self).__init__(object_id, init_pos, initial_velocity, object_acceleration, dimensions)
 
     def update_position(self, agent_x_velocity=0):
-        x_pos = self.get_x_pos() - agent_x_velocity
-        y_pos = ArenaObject.relu(self.get_y_pos() + self.get_y_vel())
-        self.set_pos((x_pos, y_pos))
+        self.set_x_pos(self.get_x_pos() - agent_x_velocity)
+        self.set_y_pos(ArenaObject.relu(self.get_y_pos() + self.get_y_vel()))
 
     def update(self, agent_x_velocity=0):
         self.update_position(agent_x_velocity)
@@ -22,21 +33,25 @@ class Obstacle(ArenaObject):
 
 
 class Cactus(Obstacle):
-    def __init__(self, initial_position, initial_velocity=(-3, 0), object_acceleration=(0.0, 0.0),
-                 cactus_dimensions=[(20, 40), (20, 50), (20, 60), (20, 70), (30, 50), (30, 60),
-                                    (30, 80), (40, 50), (40, 65), (40, 80), (50, 30), (50, 60),
-                                    (60, 30), (60, 60), (70, 30), (70, 50), (70, 60), (80, 60),
-                                    (80, 30), (100, 30), (100, 30)]):
-        cactus_dimension = random.sample(cactus_dimensions, 1)[0]
-        super(Cactus, self).__init__(1, initial_position, initial_velocity, object_acceleration, cactus_dimension)
+    __slots__ = ()
+
+    def __init__(self, initial_position, initial_velocity=OBSTACLE_VELOCITY, object_acceleration=(0.0, 0.0),
+                 cactus_dimensions=CACTUS_DIMENSIONS, random_state=None):
+        random_state = get_random_state(random_state)
+        cactus_dimension = cactus_dimensions[random_state.integers(len(cactus_dimensions))]
+        super(Cactus, self).__init__(CACTUS_ID, initial_position, initial_velocity, object_acceleration,
+                                     cactus_dimension)
 
 
 class Bird(Obstacle):
-    def __init__(self, base_position, initial_velocity=(-3, 0), object_acceleration=(0.0, 0.0),
-                 bird_dimension=(40, 30), height_addition=20):
-        level = random.sample([i*0.2 for i in range(0, 36)], 1)[0]
+    __slots__ = ()
+
+    def __init__(self, base_position, initial_velocity=OBSTACLE_VELOCITY, object_acceleration=(0.0, 0.0),
+                 bird_dimension=BIRD_DIMENSION, height_addition=BIRD_HEIGHT_ADDITION, random_state=None):
+        random_state = get_random_state(random_state)
+        level = BIRD_LEVELS[random_state.integers(len(BIRD_LEVELS))]
         initial_position = base_position[0], base_position[1] + level * height_addition
-        super(Bird, self).__init__(2, initial_position, initial_velocity, object_acceleration, bird_dimension)
+        super(Bird, self).__init__(BIRD_ID, initial_position, initial_velocity, object_acceleration, bird_dimension)
 
     def update(self, agent_x_velocity=0):
         self.update_position(agent_x_velocity)
@@ -0,0 +1,47 @@
+"""
+Microbenchmarks of the arena objects: the memory used by every object and the time of one physics step.
+"""
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from arena_objects.agent import GeneticAlgorithmAgent
+from arena_objects.obstacles import Cactus
+
+
+def get_object_memory(create_object, num_objects=2000):
+    # The average number of bytes allocated for one object (including its attributes)
+    tracemalloc.start()
+    arena_objects = [create_object() for _ in range(num_objects)]
+    allocated_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return allocated_memory / len(arena_objects)
+
+
+def get_step_time(step, num_steps=100000):
+    # The average time of one step in microseconds
+    return timeit.timeit(step, number=num_steps) / num_steps * 1e6
+
+
+def benchmark_arena_objects(num_steps=100000):
+    weights = np.zeros((4, 7))
+    agent = GeneticAlgorithmAgent(weights)
+    cactus = Cactus((800, 0), random_state=0)
+
+    def agent_step():
+        # Alternate between jumping and walking so that both physics paths are taken
+        agent.set_current_action(agent.get_current_action() ^ 1)
+        agent.update_agent()
+
+    return {
+        'agent_bytes': get_object_memory(lambda: GeneticAlgorithmAgent(weights)),
+        'obstacle_bytes': get_object_memory(lambda: Cactus((800, 0), random_state=0)),
+        'agent_step_us': get_step_time(agent_step, num_steps),
+        'obstacle_step_us': get_step_time(lambda: cactus.update(5.0), num_steps),
+    }
+
+
+if __name__ == '__main__':
+    for name, value in benchmark_arena_objects().items():
+        print(f'{name}: {value:.3f}')
@@ -0,0 +1,153 @@
+"""
+This file defines the simulation engine of the game. It contains everything needed to simulate the game (updating the
+environment, the agents and the environment statistics) and nothing related to drawing it, so that it never imports
+pygame. The agents can therefore be trained on machines without a display.
+"""
+import time
+
+from arena.collisions import get_agents_x_interval, get_bounding_boxes, get_crash_mask
+from arena.environments import ChromeTRexRush
+
+
+class Engine:
+    def __init__(self, environment: ChromeTRexRush):
+        self.__environment = environment
+        self.__simulated_frames = 0
+        self.__simulation_time = 0.0
+        self.__truncated = False
+
+    def get_environment(self):
+        return self.__environment
+
+    def set_environment(self, new_environment):
+        self.__environment = new_environment
+
+    def get_simulated_frames(self):
+        return self.__simulated_frames
+
+    def get_simulation_time(self):
+        return self.__simulation_time
+
+    def get_frames_per_second(self):
+        if self.__simulation_time == 0:
+            return 0.0
+        return self.__simulated_frames / self.__simulation_time
+
+    def was_truncated(self):
+        # Whether the last simulation was stopped by its frame or time limit
+        return self.__truncated
+
+    def reset_simulation_statistics(self):
+        self.__simulated_frames = 0
+        self.__simulation_time = 0.0
+
+    def increase_simulation_statistics(self, simulated_frames, simulation_time):
+        self.__simulated_frames += simulated_frames
+        self.__simulation_time += simulation_time
+
+    @staticmethod
+    def update_agent_state(agent, agent_type, *args):
+        assert len(args) == 1
+        if agent_type.lower() == 'human':
+            # If the type of the agent is human, *args represent the action of the agent
+            agent.set_current_action(*args)
+        elif agent_type.lower() == 'genetic':
+            # If the type of the agent is genetic, *args represent the environment state
+            agent.set_current_environment_state(*args)
+        elif agent_type.lower() == 'q':
+            agent.set_environment_state(*args)
+
+    def update_game_agents_state(self, agent_list):
+        for agent_information in agent_list:
+            agent = agent_information[0]
+            if not agent.is_done():
+                self.update_agent_state(*agent_information)
+                agent.update()
+
+    def update_game_agents_collision_status(self, agent_list):
+        agents = [agent_information[0] for agent_information in agent_list if not agent_information[0].is_done()]
+        if not agents:
+            return
+        agent_boxes = get_bounding_boxes(agents)
+        # Get the bounding boxes of the obstacles which can overlap the agents on the x axis (broad phase)
+        obstacle_boxes = self.get_environment().get_obstacle_store().get_bounding_boxes_in_x_range(
+            *get_agents_x_interval(agent_boxes))
+        # Check all the agents which have not crashed yet against those obstacles at once
+        crash_mask = get_crash_mask(agent_boxes, obstacle_boxes)
+        for agent, crashed in zip(agents, crash_mask):
+            if crashed:
+                # Set the crashed status accordingly
+                agent.set_crashed(True)
+
+    def update_game_agents_acceleration(self, agent_list):
+        current_level = self.get_environment().get_current_level()
+        for agent_information in agent_list:
+            agent = agent_information[0]
+            agent.update_agent_acceleration(current_level)
+
+    @staticmethod
+    def update_game_agents_reward(agent_list):
+        for agent_information in agent_list:
+            agent = agent_information[0]
+            if not agent.is_done():
+                agent.increase_reward(agent.get_current_action_reward())
+
+    def update_game_agents(self, agent_list):
+        self.update_game_agents_state(agent_list)
+        self.update_game_agents_collision_status(agent_list)
+        self.update_game_agents_reward(agent_list)
+        self.update_game_agents_acceleration(agent_list)
+
+    def update_game(self, agent_list):
+        sample_agent = agent_list[0][0]
+        # Update the Environment
+        self.get_environment().update_environment(sample_agent.get_x_vel())
+        # Update the agents. It does not matter that we are updating the environment first and then the agent,
+        # because the first thing we do in the agent update is update its position and then check for collision and
+        # then for rewards so everything works out fine
+        self.update_game_agents(agent_list)
+
+    def update_environment_statistics(self):
+        # Add an obstacle
+        self.get_environment().add_obstacle()
+        # Increase the Score
+        self.get_environment().increase_score()
+        # Increase the level if needed
+        self.get_environment().increase_level()
+
+    @staticmethod
+    def truncate_agents(agents):
+        # Flag the agents still running when the simulation was stopped by a limit (or the end of the course). They have
+        # not crashed, so they do not get the crash reward and their last state is not terminal.
+        for agent in agents:
+            if not agent.has_crashed():
+                agent.set_truncated(True)
+
+    def run_simulation(self, simulate_frame, should_stop, statistics_update_interval, max_frames=None, max_time=None):
+        """
+        Run the game as fast as possible without any clock or display.
+
+        :param simulate_frame: Function called once per frame. It should update the game (update_game) for the agents
+        :param should_stop: Function returning whether the simulation should stop
+        :param statistics_update_interval: The number of frames between two updates of the environment statistics
+        :param max_frames: The maximum number of frames of the simulation (no limit if None)
+        :param max_time: The maximum wall clock time of the simulation in seconds (no limit if None)
+        :return: The number of simulated frames. Whether the simulation was stopped by a limit (or by the end of the
+                 course of the environment, see ChromeTRexRush.is_course_exhausted) is given by was_truncated
+        """
+        counter = 0
+        self.__truncated = False
+        start_time = time.perf_counter()
+        while not should_stop():
+            if (max_frames is not None and counter >= max_frames) or \
+                    (max_time is not None and time.perf_counter() - start_time >= max_time) or \
+                    self.__environment.is_course_exhausted():
+                self.__truncated = True
+                break
+            simulate_frame()
+            if counter % statistics_update_interval == 0:
+                # Update the environment statistics (add obstacles, increase level, increase score)
+                self.update_environment_statistics()
+            counter += 1
+        self.increase_simulation_statistics(counter, time.perf_counter() - start_time)
+        return counter
@@ -1,75 +1,35 @@
-import pygame
-
 from arena.environments import ChromeTRexRush
 from arena_objects.agent import *
-from visualizer import GUI
+from engine import Engine
+from genetic_algorithm.checkpoints import load_checkpoint, save_checkpoint, set_random_state_data
+from genetic_algorithm.fitness import get_environment_parameters
+from genetic_algorithm.population import get_next_generation_weights
+from genetic_algorithm.telemetry import TelemetryWriter, get_fitness_distribution
+from q_learning.q_stores import QStore, create_q_store, get_flat_q_values, load_q_store
+from q_learning.replay_buffers import apply_td_updates
+from q_learning.state_encoders import StateEncoder
 from utils.directory_utils import *
+from utils.random_utils import get_random_state, split_seed
 import heapq
+import time
 
 
-class Game:
+class Game(Engine):
     def __init__(self, environment: ChromeTRexRush):
-        self.__environment = environment
-        self.__environment_gui = GUI(self.get_environment().get_environment_height())
-
-    def get_environment(self):
-        return self.__environment
+        super(Game, self).__init__(environment)
+        # The GUI (and pygame with it) is only loaded when the game is drawn
+        self.__environment_gui = None
 
     def set_environment(self, new_environment):
-        self.__environment = new_environment
-        self.__environment_gui = GUI(self.get_environment().get_environment_height())
+        super(Game, self).set_environment(new_environment)
+        self.__environment_gui = None
 
     def get_environment_gui(self):
+        if self.__environment_gui is None:
+            from visualizer import GUI
+            self.__environment_gui = GUI(self.get_environment().get_environment_height())
         return self.__environment_gui
 
-    @staticmethod
-    def update_agent_state(agent, agent_type, *args):
-        assert len(args) == 1
-        if agent_type.lower() == 'human':
-            # If the type of the agent is human, *args represent the action of the agent
-            agent.set_current_action(*args)
-        elif agent_type.lower() == 'genetic':
-            # If the type of the agent is genetic, *args represent the environment state
-            agent.set_current_environment_state(*args)
-        elif agent_type.lower() == 'q':
-            agent.set_environment_state(*args)
-
-    def update_game_agents_state(self, agent_list):
-        for agent_information in agent_list:
-            agent = agent_information[0]
-            if not agent.has_crashed():
-                self.update_agent_state(*agent_information)
-                agent.update()
-
-    def update_game_agents_collision_status(self, agent_list):
-        # Get all the obstacles
-        all_obstacles = self.get_environment().get_all_obstacle_list()
-        # For each agent update its collision status using the obstacles
-        for agent_information in agent_list:
-            agent = agent_information[0]
-            if agent.has_collided_with_obstacle(all_obstacles):
-                # Set the crashed status accordingly
-                agent.set_crashed(True)
-
-    def update_game_agents_acceleration(self, agent_list):
-        current_level = self.get_environment().get_current_level()
-        for agent_information in agent_list:
-            agent = agent_information[0]
-            agent.update_agent_acceleration(current_level)
-
-    @staticmethod
-    def update_game_agents_reward(agent_list):
-        for agent_information in agent_list:
-            agent = agent_information[0]
-            if not agent.has_crashed():
-                agent.increase_reward(agent.get_current_action_reward())
-
-    def update_game_agents(self, agent_list):
-        self.update_game_agents_state(agent_list)
-        self.update_game_agents_collision_status(agent_list)
-        self.update_game_agents_reward(agent_list)
-        self.update_game_agents_acceleration(agent_list)
-
     def draw_game_agent(self, screen, agent):
         self.get_environment_gui().draw_agent(screen, agent)
 
@@ -83,15 +43,6 @@ class Game:
         # Get all the obstacles in the environment and then draw them
         self.get_environment_gui().draw_obstacles(screen, self.get_environment().get_all_obstacle_list())
 
-    def update_game(self, agent_list):
-        sample_agent = agent_list[0][0]
-        # Update the Environment
-        self.get_environment().update_environment(sample_agent.get_x_vel())
-        # Update the agents. It does not matter that we are updating the environment first and then the agent,
-        # because the first thing we do in the agent update is update its position and then check for collision and
-        # then for rewards so everything works out fine
-        self.update_game_agents(agent_list)
-
     def draw_game(self, screen, agent_list):
         # Draw the agents
         self.draw_game_agents(screen, agent_list)
@@ -99,6 +50,7 @@ class Game:
         self.draw_game_obstacles(screen)
 
     def init_game(self):
+        import pygame
         # initialize the pygame module and font
         pygame.init()
 
@@ -134,16 +86,9 @@ class Game:
                     (self.get_environment().get_environment_width() / 2 - 50,
                      self.get_environment().get_environment_height() / 2 - 20))
 
-    def update_environment_statistics(self):
-        # Add an obstacle
-        self.get_environment().add_obstacle()
-        # Increase the Score
-        self.get_environment().increase_score()
-        # Increase the level if needed
-        self.get_environment().increase_level()
-
     @staticmethod
     def handle_game_over():
+        import pygame
         while True:
             # Wait for the user to exit the game
             for event in pygame.event.get():
@@ -153,6 +98,7 @@ class Game:
 
     @staticmethod
     def update_game_display():
+        import pygame
         pygame.display.update()
 
 
@@ -166,6 +112,7 @@ class HumanGame(Game):
 
     @staticmethod
     def get_key_map():
+        import pygame
         return {pygame.K_UP: 'high_jump', pygame.K_SPACE: 'high_jump', pygame.K_DOWN: 'duck',
                 pygame.K_d: 'duck', pygame.K_l: 'low_jump', pygame.K_s: 'low_jump'}
 
@@ -176,6 +123,7 @@ class HumanGame(Game):
             return 'no_op'
 
     def handle_user_action(self):
+        import pygame
         # Stores which key is pressed
         key_pressed = ''
         # Check for any event
@@ -242,17 +190,65 @@ class HumanGame(Game):
 
 
 class GeneticAlgorithmGame(Game):
-    def __init__(self, agents, max_iterations, environment, num_best_agents=10):
+    def __init__(self, agents, max_iterations, environment, num_best_agents=10, random_state=None,
+                 fitness_evaluator=None, course_seed=None, max_episode_frames=None, max_episode_time=None):
+        """
+        :param fitness_evaluator: An optional genetic_algorithm.fitness.FitnessEvaluator (or SuccessiveHalvingEvaluator
+                                  for a multi course fitness). If given, the population is evaluated by it (possibly in
+                                  parallel) when the game is not visualized, on new courses drawn from the random
+                                  generator of the environment every iteration. It is closed (its worker pool shut
+                                  down) at the end of play_game
+        :param course_seed: If given, the fitness evaluator evaluates every iteration on the courses of this seed
+                            instead, so that the rewards of the iterations are comparable and the cached rewards of the
+                            best agents (see genetic_algorithm.fitness.CachedFitnessEvaluator) are reused
+        :param max_episode_frames: The maximum number of frames of a headless iteration. The agents still running at
+                                   the limit are truncated (not crashed) and keep the rewards they have collected
+        :param max_episode_time: The maximum wall clock time of a headless iteration in seconds. With a fitness
+                                 evaluator, the episode limits are the ones of the evaluator instead (see
+                                 genetic_algorithm.fitness.FitnessEvaluator), so they cannot be given to the game too
+        """
+        if fitness_evaluator is not None and (max_episode_frames is not None or max_episode_time is not None):
+            raise ValueError('The episode limits of a game with a fitness evaluator are given to the evaluator')
         super(GeneticAlgorithmGame, self).__init__(environment)
+        self.__random_state = get_random_state(random_state)
+        self.__fitness_evaluator = fitness_evaluator
+        self.__course_seed = course_seed
+        self.__max_episode_frames = max_episode_frames
+        self.__max_episode_time = max_episode_time
+        # The number of agents alive at every simulated frame of the current iteration
+        self.__alive_agents_counts = []
         self.__agents = agents
+        # The weights of all the agents stacked together, built when the population is first evaluated
+        self.__population_weights = None
         self.__population_size = len(self.get_agents())
         self.__max_iterations = max_iterations
         self.__best_agents = list([(-1000, agent) for agent in self.__agents[:num_best_agents]])
         # self.__best_agents = []
 
+    def get_random_state(self):
+        return self.__random_state
+
     def get_best_agents(self):
         return self.__best_agents
 
+    def get_fitness_evaluator(self):
+        return self.__fitness_evaluator
+
+    def get_course_seed(self):
+        return self.__course_seed
+
+    def get_max_episode_frames(self):
+        return self.__max_episode_frames
+
+    def get_max_episode_time(self):
+        return self.__max_episode_time
+
+    def get_alive_agents_counts(self):
+        return self.__alive_agents_counts
+
+    def reset_alive_agents_counts(self):
+        self.__alive_agents_counts = []
+
     def set_best_agents(self, new_best_agents):
         self.__best_agents = new_best_agents
 
@@ -261,6 +257,13 @@ class GeneticAlgorithmGame(Game):
 
     def set_agents(self, agents):
         self.__agents = agents
+        self.__population_weights = None
+
+    def get_population_weights(self):
+        # The weights of all the agents as a (population size, number of actions, number of features) tensor
+        if self.__population_weights is None:
+            self.__population_weights = np.stack([agent.get_weights() for agent in self.get_agents()])
+        return self.__population_weights
 
     def get_population_size(self):
         return self.__population_size
@@ -275,38 +278,42 @@ class GeneticAlgorithmGame(Game):
         self.__max_iterations = max_iterations
 
     @staticmethod
-    def mutate_weights(weight_array: np.ndarray):
+    def mutate_weights(weight_array: np.ndarray, random_state=None):
+        random_state = get_random_state(random_state)
         mutated_weights = np.array(weight_array)
         shape_x, shape_y = mutated_weights.shape
-        mask = np.random.choice([True, False], size=shape_x*shape_y, p=[0.3, 0.7]).reshape(shape_x, shape_y)
-        mutated_weights[mask] = np.random.randn(np.sum(mask))
+        mask = random_state.choice([True, False], size=shape_x*shape_y, p=[0.3, 0.7]).reshape(shape_x, shape_y)
+        mutated_weights[mask] = random_state.standard_normal(np.sum(mask))
         return mutated_weights
 
     @staticmethod
-    def row_reproduction(weights_1_array: np.ndarray, weights_2_array: np.ndarray):
+    def row_reproduction(weights_1_array: np.ndarray, weights_2_array: np.ndarray, random_state=None):
+        random_state = get_random_state(random_state)
         num_rows = weights_1_array.shape[0]
-        row_order = np.random.permutation(range(num_rows))
-        weights_1_num_rows = np.random.choice(range(1, num_rows))
+        row_order = random_state.permutation(num_rows)
+        weights_1_num_rows = random_state.integers(1, num_rows)
         new_weights = np.zeros(weights_1_array.shape)
         new_weights[row_order[:weights_1_num_rows]] = weights_1_array[row_order[:weights_1_num_rows]]
         new_weights[row_order[weights_1_num_rows:]] = weights_2_array[row_order[weights_1_num_rows:]]
         return new_weights
 
     @staticmethod
-    def column_reproduction(weights_1_array: np.ndarray, weights_2_array: np.ndarray):
+    def column_reproduction(weights_1_array: np.ndarray, weights_2_array: np.ndarray, random_state=None):
+        random_state = get_random_state(random_state)
         num_columns = weights_1_array.shape[1]
-        column_order = np.random.permutation(range(num_columns))
-        weights_1_num_columns = np.random.choice(range(1, num_columns))
+        column_order = random_state.permutation(num_columns)
+        weights_1_num_columns = random_state.integers(1, num_columns)
         new_weights = np.zeros(weights_1_array.shape)
         new_weights[:, column_order[:weights_1_num_columns]] = weights_1_array[:, column_order[:weights_1_num_columns]]
         new_weights[:, column_order[weights_1_num_columns:]] = weights_2_array[:, column_order[weights_1_num_columns:]]
         return new_weights
 
     @staticmethod
-    def element_reproduction(weights_1_array: np.ndarray, weights_2_array: np.ndarray):
+    def element_reproduction(weights_1_array: np.ndarray, weights_2_array: np.ndarray, random_state=None):
+        random_state = get_random_state(random_state)
         shape_x, shape_y = weights_1_array.shape
-        mask_prob = np.random.rand(1)[0]
-        mask = np.random.choice([True, False], size=shape_x * shape_y,
+        mask_prob = random_state.random()
+        mask = random_state.choice([True, False], size=shape_x * shape_y,
                                 p=[mask_prob, 1-mask_prob]).reshape(shape_x, shape_y)
         new_weights = np.zeros(weights_1_array.shape)
         new_weights[mask] = weights_1_array[mask]
@@ -314,57 +321,33 @@ class GeneticAlgorithmGame(Game):
         return new_weights
 
     @staticmethod
-    def addition_reproduction(weights_1_array: np.ndarray, weights_2_array: np.ndarray):
-        weights_1_coeff, weights_2_coeff = np.random.choice([1, -1], 1), np.random.choice([1, -1], 1)
+    def addition_reproduction(weights_1_array: np.ndarray, weights_2_array: np.ndarray, random_state=None):
+        random_state = get_random_state(random_state)
+        weights_1_coeff, weights_2_coeff = random_state.choice([1, -1], 1), random_state.choice([1, -1], 1)
         return (weights_1_coeff * weights_1_array) + (weights_2_coeff * weights_2_array)
 
     @staticmethod
     def should_stop_game(agents):
-        return all([agent.has_crashed() for agent in agents])
-
-    def get_all_reproduction_functions(self):
-        return [self.row_reproduction, self.column_reproduction,
-                self.element_reproduction, self.addition_reproduction]
-
-    def get_child(self, agent_1: GeneticAlgorithmAgent, agent_2: GeneticAlgorithmAgent, mutation_prob=0.3):
-        all_reproduction_function = self.get_all_reproduction_functions()
-        reproduction_function = np.random.choice(all_reproduction_function, 1)[0]
-        new_agent = GeneticAlgorithmAgent(reproduction_function(agent_1.get_weights(), agent_2.get_weights()))
-        if np.random.rand(1) < mutation_prob:
-            new_agent.set_weights(self.mutate_weights(new_agent.get_weights()))
-        return new_agent
+        return all([agent.is_done() for agent in agents])
 
     def get_top_k_agents(self, agents, k=10):
         agents_rewards = np.array([agent.get_total_reward() for agent in agents])
         top_k_agents = list(np.array(agents)[np.argsort(agents_rewards)[:k]])
         return top_k_agents
 
-    def get_reproduction_population(self, agents, reproduction_population_size):
-        k = len(agents)//3
-        reproduced_agents = []
-        agents_rewards = np.array([agent.get_total_reward() for agent in agents])
-        top_k_agents = list(np.array(agents)[np.argsort(agents_rewards)[:k]])
-        top_k_agents_rewards = agents_rewards[np.argsort(agents_rewards)[:k]]
-        top_k_agents_probabilities = GeneticAlgorithmAgent.softmax_activation(top_k_agents_rewards)
-        # print(top_k_agents_rewards)
-        for _ in range(reproduction_population_size):
-            reproduced_agents.append(self.get_child(*np.random.choice(top_k_agents, size=2,
-                                                                      p=top_k_agents_probabilities,
-                                                                      replace=False)))
-        return reproduced_agents
-
     def get_new_population(self, agents, reproduction_factor=0.90):
-        sample_agent = agents[0]
         best_agents = [agent for _, agent in self.get_best_agents()]
         # best_agents = []
         reproduction_population = len(agents) - len(best_agents)
-        reproduced_population = \
-            self.get_reproduction_population(agents, int(reproduction_factor*reproduction_population))
-
-        random_population = [GeneticAlgorithmAgent(np.random.randn(*sample_agent.get_weights().shape)) for _ in
-                             range(reproduction_population - len(reproduced_population))]
+        num_children = int(reproduction_factor*reproduction_population)
+        # Reproduce the whole generation at once from the stacked weights of the population
+        population_weights = np.stack([agent.get_weights() for agent in agents])
+        agents_rewards = np.array([agent.get_total_reward() for agent in agents])
+        new_weights = get_next_generation_weights(population_weights, agents_rewards, num_children,
+                                                  reproduction_population - num_children,
+                                                  random_state=self.__random_state)
 
-        new_population = best_agents + reproduced_population + random_population
+        new_population = best_agents + [GeneticAlgorithmAgent(weights) for weights in new_weights]
         return new_population
 
     def get_environment_state(self, agent):
@@ -386,8 +369,39 @@ class GeneticAlgorithmGame(Game):
                          closest_cactus_distance, closest_cactus_width,
                          closest_bird_distance, closest_bird_height])
 
+    def get_environment_states(self, agents):
+        # The environment states of all the agents as one (number of agents, number of features) matrix. Only the
+        # current action differs between the agents, so the obstacles are looked up once for the whole population.
+        environment_states = np.empty((len(agents), 7))
+        environment_states[:] = self.get_environment_state(agents[0])
+        environment_states[:, 1] = np.fromiter((agent.get_current_action() for agent in agents), dtype=float,
+                                               count=len(agents)) / 4
+        return environment_states
+
     def get_agent_list(self, agents):
-        return [[agent, 'genetic', self.get_environment_state(agent)] for agent in agents]
+        return [[agent, 'genetic', environment_state]
+                for agent, environment_state in zip(agents, self.get_environment_states(agents))]
+
+    @staticmethod
+    def get_population_actions(population_weights, environment_states):
+        # The best action of every agent with a single batched matrix product. The softmax in
+        # GeneticAlgorithmAgent.softmax_activation does not change which action is the best one, so it is skipped.
+        return np.argmax(np.einsum('paf,pf->pa', population_weights, environment_states), axis=1)
+
+    def update_game_agents_state(self, agent_list):
+        # The agent list always holds the whole population, in the same order as the population weights
+        population_weights = self.get_population_weights()
+        assert len(agent_list) == len(population_weights)
+        environment_states = np.array([environment_state for _, _, environment_state in agent_list])
+        actions = self.get_population_actions(population_weights, environment_states)
+        num_alive_agents = 0
+        for (agent, _, environment_state), action in zip(agent_list, actions.tolist()):
+            if not agent.is_done():
+                agent.set_current_environment_state(environment_state)
+                agent.set_current_action(action)
+                agent.update_agent()
+                num_alive_agents += 1
+        self.__alive_agents_counts.append(num_alive_agents)
 
     def update_best_agents(self, agents):
         k = len(self.get_best_agents())
@@ -407,79 +421,222 @@ class GeneticAlgorithmGame(Game):
                                            f'agent_{k}_reward_{agent.get_total_reward()}_weights.npy')
                 np.save(file_name, agent.get_weights())
 
+    def save_generation_checkpoint(self, checkpoint_file_path, iteration_num):
+        agents = self.get_agents()
+        population_weights = np.stack([agent.get_weights() for agent in agents])
+        best_agents = [agent for _, agent in self.get_best_agents()]
+        best_agents_weights = np.array([agent.get_weights() for agent in best_agents]).reshape(
+            (len(best_agents),) + population_weights.shape[1:])
+        save_checkpoint(checkpoint_file_path, iteration_num, population_weights,
+                        np.array([agent.get_total_reward() for agent in agents]), best_agents_weights,
+                        np.array([agent_reward for agent_reward, _ in self.get_best_agents()]),
+                        np.array([agent.state() for agent in best_agents]).reshape((len(best_agents), 8)),
+                        {'game': self.__random_state, 'environment': self.get_environment().get_random_state()})
+
+    def resume_from_checkpoint(self, checkpoint_file_path):
+        """
+        Restore the population, the best agents and the random generators as they were after the iteration of the
+        checkpoint. All the agents are restored as crashed agents with their total rewards, so the best agents keep
+        their rewards (and their states, as the first one sets the speed of the environment) like in an uninterrupted
+        run.
+
+        :return: The iteration number of the checkpoint
+        """
+        checkpoint = load_checkpoint(checkpoint_file_path)
+        agents = []
+        for weights, agent_reward in zip(checkpoint['population_weights'], checkpoint['population_rewards'].tolist()):
+            agent = GeneticAlgorithmAgent(weights)
+            agent.increase_reward(agent_reward)
+            agent.set_crashed(True)
+            agents.append(agent)
+        self.set_agents(agents)
+
+        best_agents = []
+        for weights, agent_reward, agent_state in zip(checkpoint['best_agents_weights'],
+                                                      checkpoint['best_agents_rewards'].tolist(),
+                                                      checkpoint['best_agents_states'].tolist()):
+            agent = GeneticAlgorithmAgent(weights)
+            agent.load_state(agent_state)
+            agent.increase_reward(agent_reward)
+            agent.set_crashed(True)
+            best_agents.append((agent_reward, agent))
+        self.set_best_agents(best_agents)
+
+        set_random_state_data(self.__random_state, checkpoint['random_states']['game'])
+        set_random_state_data(self.get_environment().get_random_state(), checkpoint['random_states']['environment'])
+        return checkpoint['generation']
+
+    def simulate_frame(self):
+        # handle the user action and update the agent/game accordingly
+        agent_list = self.get_agent_list(self.get_agents())
+        # Updating the game based on what was returned after processing the user action
+        self.update_game(agent_list)
+        return agent_list
+
+    def run_headless_iteration(self):
+        # Simulate the game as fast as possible, without pygame, till all the agents have crashed (or a limit is hit)
+        num_frames = self.run_simulation(self.simulate_frame, lambda: self.should_stop_game(self.get_agents()), 45,
+                                         self.__max_episode_frames, self.__max_episode_time)
+        if self.was_truncated():
+            self.truncate_agents(self.get_agents())
+        return num_frames
+
+    def run_evaluator_iteration(self):
+        start_time = time.perf_counter()
+        environment = self.get_environment()
+        course_seed = self.get_course_seed()
+        if course_seed is None:
+            course_seed = int(environment.get_random_state().integers(2 ** 32))
+        rewards, num_frames, score, truncated = self.get_fitness_evaluator().evaluate(
+            self.get_population_weights(), get_environment_parameters(environment), course_seed)
+        # Every agent ends the iteration crashed or truncated with the reward of its episode, as after
+        # run_headless_iteration
+        for agent, reward, agent_truncated in zip(self.get_agents(), rewards.tolist(), truncated.tolist()):
+            agent.reset_agent()
+            agent.increase_reward(reward)
+            if agent_truncated:
+                agent.set_truncated(True)
+            else:
+                agent.set_crashed(True)
+        environment.increase_score(score)
+        self.increase_simulation_statistics(num_frames, time.perf_counter() - start_time)
+        return num_frames
+
     def run_iteration(self, visualize):
-        white = [255, 255, 255]
-        screen, clock, font = None, None, None
+        # The agents alive over time are the ones of this iteration only
+        self.reset_alive_agents_counts()
+        if not visualize:
+            if self.get_fitness_evaluator() is not None:
+                self.run_evaluator_iteration()
+            else:
+                self.run_headless_iteration()
+            return
 
-        if visualize:
-            screen, clock, font = self.init_game()
+        white = [255, 255, 255]
+        screen, clock, font = self.init_game()
         # Counter to represent the seconds
         counter = 0
 
-        if visualize:
-            # Draw all the environment objects
-            self.draw_game(screen, self.get_agent_list(self.get_agents()))
-            # Update the screen to reflect the changes
-            self.update_game_display()
+        # Draw all the environment objects
+        self.draw_game(screen, self.get_agent_list(self.get_agents()))
+        # Update the screen to reflect the changes
+        self.update_game_display()
 
         # Have the game run till all the agents have not crashed
         while not self.should_stop_game(self.get_agents()):
-            if visualize:
-                # Reset the screen
-                screen.fill(white)
-            # handle the user action and update the agent/game accordingly
-            agent_list = self.get_agent_list(self.get_agents())
-            # Updating the game based on what was returned after processing the user action
-            self.update_game(agent_list)
+            # Reset the screen
+            screen.fill(white)
+            agent_list = self.simulate_frame()
             # Print elapsed time
             if counter % 45 == 0:
                 # print('Seconds Elapsed:', counter // 60)
                 # Update the environment statistics (add obstacles, increase level, increase score)
                 self.update_environment_statistics()
             counter += 1
-            if visualize:
-                # Draw all the environment objects
-                self.draw_game(screen, agent_list)
-                # Display the updated game statistics
-                self.display_game_statistics(screen, font)
-                # Update the game display
-                self.update_game_display()
-                # Tick the clock
-                clock.tick(60)
-
-        # If the agent has crashed Update the screen
-        if visualize:
-            # Reset the screen
-            screen.fill(white)
-            # Display game statistics
+            # Draw all the environment objects
+            self.draw_game(screen, agent_list)
+            # Display the updated game statistics
             self.display_game_statistics(screen, font)
-            # Display game over message
-            self.display_game_over_message(screen, font)
             # Update the game display
             self.update_game_display()
+            # Tick the clock
+            clock.tick(60)
+
+        # If the agent has crashed Update the screen
+        # Reset the screen
+        screen.fill(white)
+        # Display game statistics
+        self.display_game_statistics(screen, font)
+        # Display game over message
+        self.display_game_over_message(screen, font)
+        # Update the game display
+        self.update_game_display()
         # # Handle the game over
         # self.handle_game_over()
 
-    def play_game(self, visualize=False, weights_parent_directory=f'../data/genetic_algorithm_weights/'):
-        iteration_num = 0
-        for iteration_num in range(self.get_maximum_iterations()):
-            self.get_environment().reset_environment()
-            print(f'Iteration: {iteration_num}')
-            self.run_iteration(visualize)
-            print(f'Score: {self.get_environment().get_current_score()}')
-            self.update_best_agents(self.get_agents())
-            print([agent_reward for agent_reward, _ in self.get_best_agents()])
+    def get_iteration_telemetry(self, iteration_num, agents_rewards, simulation_time, reproduction_time,
+                                checkpoint_time, iteration_time, alive_agents_interval=45):
+        telemetry = {'iteration': iteration_num, 'population_size': len(agents_rewards),
+                     'score': self.get_environment().get_current_score(),
+                     'simulated_frames': self.get_simulated_frames(),
+                     'frames_per_second': self.get_frames_per_second(),
+                     'iteration_time': iteration_time, 'simulation_time': simulation_time,
+                     'reproduction_time': reproduction_time, 'checkpoint_time': checkpoint_time}
+        telemetry.update(get_fitness_distribution(agents_rewards))
+        telemetry['truncated_agents'] = sum(agent.is_truncated() for agent in self.get_agents())
+        telemetry['best_agents_reward'] = max([agent_reward for agent_reward, _ in self.get_best_agents()], default=0)
+        # The number of agents alive every alive_agents_interval frames (empty when a fitness evaluator simulated the
+        # iteration in other environments)
+        telemetry['alive_agents'] = self.get_alive_agents_counts()[::alive_agents_interval]
+        return telemetry
+
+    def play_game(self, visualize=False, weights_parent_directory=f'../data/genetic_algorithm_weights/',
+                  checkpoint_file_path=None, telemetry_file_path=None):
+        """
+        :param checkpoint_file_path: If given, a checkpoint (see genetic_algorithm.checkpoints) is written to this file
+                                     after every iteration, and the game resumes from it if it already exists
+        :param telemetry_file_path: If given, the telemetry of every iteration (see genetic_algorithm.telemetry) is
+                                    appended to this JSON lines (or .csv) file
+        """
+        telemetry_writer = TelemetryWriter(telemetry_file_path) if telemetry_file_path is not None else None
+        start_iteration = 0
+        if checkpoint_file_path is not None and exist_file(checkpoint_file_path):
+            start_iteration = self.resume_from_checkpoint(checkpoint_file_path) + 1
+            print(f'Resuming from iteration: {start_iteration}')
             if self.get_maximum_iterations() > 1:
-                if iteration_num % 10 == 0:
-                    weights_save_directory_path = construct_path(weights_parent_directory, f'iteration_{iteration_num}')
-                    self.save_top_k_agent_weights(self.get_agents(), weights_save_directory_path)
-                new_population = self.get_new_population(self.get_agents())
-                self.set_agents(new_population)
+                self.set_agents(self.get_new_population(self.get_agents()))
+        iteration_num = start_iteration
+        try:
+            for iteration_num in range(start_iteration, self.get_maximum_iterations()):
+                iteration_start_time = time.perf_counter()
+                self.get_environment().reset_environment()
+                self.reset_simulation_statistics()
+                print(f'Iteration: {iteration_num}')
+                self.run_iteration(visualize)
+                simulation_time = time.perf_counter() - iteration_start_time
+                print(f'Score: {self.get_environment().get_current_score()}')
+                if not visualize:
+                    print(f'Simulated frames per second: {self.get_frames_per_second():.0f}')
+                agents_rewards = [agent.get_total_reward() for agent in self.get_agents()]
+
+                reproduction_start_time = time.perf_counter()
+                self.update_best_agents(self.get_agents())
+                reproduction_time = time.perf_counter() - reproduction_start_time
+                print([agent_reward for agent_reward, _ in self.get_best_agents()])
+                checkpoint_time = 0.0
+                if checkpoint_file_path is not None:
+                    checkpoint_start_time = time.perf_counter()
+                    self.save_generation_checkpoint(checkpoint_file_path, iteration_num)
+                    checkpoint_time += time.perf_counter() - checkpoint_start_time
+                if self.get_maximum_iterations() > 1:
+                    if iteration_num % 10 == 0:
+                        checkpoint_start_time = time.perf_counter()
+                        weights_save_directory_path = construct_path(weights_parent_directory,
+                                                                     f'iteration_{iteration_num}')
+                        self.save_top_k_agent_weights(self.get_agents(), weights_save_directory_path)
+                        checkpoint_time += time.perf_counter() - checkpoint_start_time
+                    reproduction_start_time = time.perf_counter()
+                    new_population = self.get_new_population(self.get_agents())
+                    self.set_agents(new_population)
+                    reproduction_time += time.perf_counter() - reproduction_start_time
+
+                if telemetry_writer is not None:
+                    telemetry_writer.write(self.get_iteration_telemetry(
+                        iteration_num, agents_rewards, simulation_time, reproduction_time, checkpoint_time,
+                        time.perf_counter() - iteration_start_time))
+        finally:
+            # The telemetry of the iterations done so far is kept even when the run fails
+            if telemetry_writer is not None:
+                telemetry_writer.close()
+            # The worker pool of the fitness evaluator is not needed anymore
+            if self.get_fitness_evaluator() is not None:
+                self.get_fitness_evaluator().close()
 
         weights_save_directory_path = construct_path(weights_parent_directory, f'iteration_{iteration_num}')
         self.save_top_k_agent_weights(self.get_agents(), weights_save_directory_path)
 
         if visualize:
+            import pygame
             pygame.quit()
 
         best_agents_weights_save_directory_path = construct_path(weights_parent_directory, f'best_agents')
@@ -488,9 +645,34 @@ class GeneticAlgorithmGame(Game):
 
 
 class QLearningGame(Game):
-    def __init__(self, agent: QLearningAgent, environment, q_function, max_iterations=100, gamma=0.9, alpha=0.2):
+    def __init__(self, agent: QLearningAgent, environment, q_function, max_iterations=100, gamma=0.9, alpha=0.2,
+                 max_episode_frames=None, max_episode_time=None, state_encoder=None, replay_buffer=None,
+                 replay_batch_size=64, replay_interval=16):
+        """
+        :param q_function: The Q values, either a dense array or a q_learning.q_stores.QStore of the state shape of the
+                           state encoder and the number of actions
+        :param state_encoder: The q_learning.state_encoders.StateEncoder giving the environment states. The default one
+                              has the state shape (3, 3, 7, 3, 3, 4) of the Q function
+        :param max_episode_frames: The maximum number of frames of a headless episode. An episode stopped by the limit
+                                   is truncated: unlike a crash, its last state is not terminal, so the value of the
+                                   next state is still bootstrapped
+        :param max_episode_time: The maximum wall clock time of a headless episode in seconds
+        :param replay_buffer: If given (a q_learning.replay_buffers.ReplayBuffer), the transitions are stored in it
+                              instead of being learnt right away, and the Q function learns from minibatches sampled
+                              from it
+        :param replay_batch_size: The number of transitions of a minibatch
+        :param replay_interval: The number of frames between two minibatches. Every transition is learnt about
+                                replay_batch_size / replay_interval times on average
+        """
         super(QLearningGame, self).__init__(environment)
         self.__agent = agent
+        self.__replay_buffer = replay_buffer
+        self.__replay_batch_size = replay_batch_size
+        self.__replay_interval = replay_interval
+        self.__num_new_transitions = 0
+        self.__max_episode_frames = max_episode_frames
+        self.__max_episode_time = max_episode_time
+        self.__state_encoder = state_encoder if state_encoder is not None else StateEncoder()
         self.__max_iterations = max_iterations
         self.__gamma = gamma
         self.__alpha = alpha
@@ -499,6 +681,23 @@ class QLearningGame(Game):
     def get_maximum_iterations(self):
         return self.__max_iterations
 
+    def get_max_episode_frames(self):
+        return self.__max_episode_frames
+
+    def get_max_episode_time(self):
+        return self.__max_episode_time
+
+    def get_state_encoder(self):
+        return self.__state_encoder
+
+    @staticmethod
+    def get_statistics_update_interval():
+        # The number of frames between two updates of the environment statistics of a headless episode
+        return 1000
+
+    def get_replay_buffer(self):
+        return self.__replay_buffer
+
     def get_q_function(self):
         return self.__q_function
 
@@ -523,60 +722,13 @@ class QLearningGame(Game):
         agent_action_reward = self.get_agent().get_current_action_reward()
         new_state_best_action = self.get_best_action(new_environment_state)
         new_state_best_action_q_value = self.get_q_function()[(*new_environment_state, new_state_best_action)]
+        if self.get_agent().has_crashed():
+            # A crash ends the episode, so there is no future reward to bootstrap. (An episode truncated by a limit is
+            # not over for the agent, so its transitions are always bootstrapped.)
+            new_state_best_action_q_value = 0
         self.__q_function[(*old_environment_state, agent_action)] = old_state_current_action_q_value + \
                 self.get_alpha()*(agent_action_reward + self.get_gamma()*new_state_best_action_q_value - old_state_current_action_q_value)
 
-    @staticmethod
-    def discretize_agent_speed(speed):
-        if speed < 8:
-            return 0 # Low speed
-        elif speed < 14:
-            return 1 # medium speed
-        else:
-            return 2 # high speed
-
-    @staticmethod
-    def discretize_y_coordinate(y_cor):
-        if y_cor < 10:
-            return 0
-        elif y_cor < 90:
-            return 1
-        elif y_cor < 200:
-            return 2
-        else:
-            return 3
-
-    @staticmethod
-    def discretize_x_coordinate_wrt_agent(agent, closest_obstacle):
-        agent_end_x_coordinate = agent.get_x_pos() + agent.get_width()
-        obstacle_x_coordinate = closest_obstacle.get_x_pos()
-        if obstacle_x_coordinate < agent_end_x_coordinate:
-            return 0
-        elif obstacle_x_coordinate < agent_end_x_coordinate + 100:
-            return 0
-        elif obstacle_x_coordinate < agent_end_x_coordinate + 200:
-            return 1
-        else:
-            return 2
-
-    @staticmethod
-    def discretize_obstacle_width(obstacle_width):
-        if obstacle_width <= 50:
-            return 0
-        elif obstacle_width <= 100:
-            return 1
-        else:
-            return 2
-
-    @staticmethod
-    def discretize_agent_state(agent):
-        if agent.is_walking():
-            return 0
-        elif agent.is_jumping():
-            return 1
-        else:
-            return 2
-
     def get_environment_state(self):
         """
         The environment state is a tuple representing the state of the environment and current value of the agent.
@@ -590,41 +742,24 @@ class QLearningGame(Game):
             * Index 3: Distance between the two closest obstacles (very near, ok, just not there) - 3
             * Index 4: The length of the obstacle (small, medium, large) - 3
             * Index 5: The y_position of the obstacle (ground, low, medium, high) - 4
+        No obstacle in sight and a single obstacle are the last values of their indices (see
+        q_learning.state_encoders.StateEncoder, the bins are looked up instead of being compared one by one).
         :return:
         """
-        agent = self.get_agent()
-        agent_speed = self.discretize_agent_speed(agent.get_x_vel())
-        # agent_height = self.discretize_y_coordinate(agent.get_y_pos())
-        agent_state = self.discretize_agent_state(agent)
-
-        environment = self.get_environment()
-        sorted_obstacles = environment.get_objects_sorted_by_distance()
-        closest_obstacle_distance = -1      # essentially acting as not in sight
-        within_obstacle_distance = -1
-        closest_obstacle_width = 0
-        closest_obstacle_y_cor = 0
-        if len(sorted_obstacles) > 0:
-            closest_obstacle_type, closest_obstacle_x_cor, closest_obstacle = sorted_obstacles[0]
-            closest_obstacle_distance = self.discretize_x_coordinate_wrt_agent(agent, closest_obstacle)
-            if closest_obstacle_type == 'b':
-                closest_obstacle_distance += 3
-            closest_obstacle_width = self.discretize_obstacle_width(closest_obstacle.get_width())
-            closest_obstacle_y_cor = self.discretize_y_coordinate(closest_obstacle.get_y_pos())
-            # Check for within distance
-            if len(sorted_obstacles) > 1:
-                _, second_closest_obstacle_x_cor, _ = sorted_obstacles[1]
-                if second_closest_obstacle_x_cor - (closest_obstacle_x_cor + closest_obstacle.get_width()) < 200:
-                    within_obstacle_distance = 0
-                else:
-                    within_obstacle_distance = 1
-
-        return agent_speed, agent_state, closest_obstacle_distance, within_obstacle_distance, \
-               closest_obstacle_width, closest_obstacle_y_cor
+        return self.get_state_encoder().get_environment_state_indices(self.get_environment(), self.get_agent())
 
     def save_q_function(self, weight_save_directory_path, iteration_num):
+        q_function = self.get_q_function()
+        if isinstance(q_function, QStore) and q_function.is_memory_mapped():
+            # The Q function already lives in its file, only the changed values are written back
+            q_function.flush()
+            return
         if check_output_directory(weight_save_directory_path, False):
             file_name = construct_path(weight_save_directory_path, f'q_func_{iteration_num}.npy')
-            np.save(file_name, self.get_q_function())
+            if isinstance(q_function, QStore):
+                q_function.save(file_name)
+            else:
+                np.save(file_name, q_function)
 
     def get_agent_list(self):
         return [(self.get_agent(), 'q', self.get_environment_state())]
@@ -632,67 +767,95 @@ class QLearningGame(Game):
     def update_game_agents_state(self, agent_list):
         for agent_information in agent_list:
             agent = agent_information[0]
-            if not agent.has_crashed():
+            if not agent.is_done():
                 self.update_agent_state(*agent_information)
                 agent.update(self.get_q_function())
 
+    def simulate_frame(self):
+        # Get the old environment state before letting the agent do the action
+        old_environment_state = self.get_environment_state()
+        # handle the user action and update the agent/game accordingly
+        agent_list = self.get_agent_list()
+        # Updating the game based on what was returned after processing the user action
+        self.update_game(agent_list)
+        # Get the new environment state after the agent has taken action
+        new_environment_state = self.get_environment_state()
+        if self.__replay_buffer is None:
+            self.update_q_function(old_environment_state, new_environment_state)
+        else:
+            self.store_transition(old_environment_state, new_environment_state)
+        return agent_list
+
+    def store_transition(self, old_environment_state, new_environment_state):
+        agent = self.get_agent()
+        state_encoder = self.get_state_encoder()
+        self.__replay_buffer.add(state_encoder.get_state_id(old_environment_state), agent.get_current_action(),
+                                 agent.get_current_action_reward(), state_encoder.get_state_id(new_environment_state),
+                                 agent.has_crashed())
+        self.__num_new_transitions += 1
+        if self.__num_new_transitions == self.__replay_interval:
+            self.__num_new_transitions = 0
+            self.replay()
+
+    def replay(self):
+        # Learn from a minibatch of the stored transitions, with all the updates applied at once
+        transitions = self.__replay_buffer.sample(self.__replay_batch_size)
+        apply_td_updates(get_flat_q_values(self.get_q_function()), *transitions, self.get_alpha(), self.get_gamma())
+
+    def run_headless_iteration(self):
+        # Simulate the game as fast as possible, without pygame, till the agent has crashed (or a limit is hit)
+        num_frames = self.run_simulation(self.simulate_frame, self.get_agent().has_crashed,
+                                         self.get_statistics_update_interval(),
+                                         self.__max_episode_frames, self.__max_episode_time)
+        if self.was_truncated():
+            self.truncate_agents([self.get_agent()])
+        return num_frames
+
     def run_iteration(self, visualize):
-        white = [255, 255, 255]
-        screen, clock, font = None, None, None
+        if not visualize:
+            self.run_headless_iteration()
+            return
 
-        if visualize:
-            screen, clock, font = self.init_game()
+        white = [255, 255, 255]
+        screen, clock, font = self.init_game()
         # Counter to represent the seconds
         counter = 0
 
-        if visualize:
-            # Draw all the environment objects
-            self.draw_game(screen, self.get_agent_list())
-            # Update the screen to reflect the changes
-            self.update_game_display()
+        # Draw all the environment objects
+        self.draw_game(screen, self.get_agent_list())
+        # Update the screen to reflect the changes
+        self.update_game_display()
 
         # Have the game run till all the agents have not crashed
         while not self.get_agent().has_crashed():
-            if visualize:
-                # Reset the screen
-                screen.fill(white)
-            # Get the old environment state before letting the agent do the action
-            old_environment_state = self.get_environment_state()
-            # handle the user action and update the agent/game accordingly
-            agent_list = self.get_agent_list()
-            # Updating the game based on what was returned after processing the user action
-            self.update_game(agent_list)
-            # Get the new environment state after the agent has taken action
-            new_environment_state = self.get_environment_state()
-            self.update_q_function(old_environment_state, new_environment_state)
+            # Reset the screen
+            screen.fill(white)
+            agent_list = self.simulate_frame()
             # Print elapsed time
-            division = 60 if visualize else 1000
-            if counter % division == 0:
+            if counter % 60 == 0:
                 # print('Seconds Elapsed:', counter // 60)
                 # Update the environment statistics (add obstacles, increase level, increase score)
                 self.update_environment_statistics()
                 # print(self.get_agent().get_x_acc(), self.get_agent().get_x_vel())
             counter += 1
-            if visualize:
-                # Draw all the environment objects
-                self.draw_game(screen, agent_list)
-                # Display the updated game statistics
-                self.display_game_statistics(screen, font)
-                # Update the game display
-                self.update_game_display()
-                # Tick the clock
-                clock.tick(60)
-
-        # If the agent has crashed Update the screen
-        if visualize:
-            # Reset the screen
-            screen.fill(white)
-            # Display game statistics
+            # Draw all the environment objects
+            self.draw_game(screen, agent_list)
+            # Display the updated game statistics
             self.display_game_statistics(screen, font)
-            # Display game over message
-            self.display_game_over_message(screen, font)
             # Update the game display
             self.update_game_display()
+            # Tick the clock
+            clock.tick(60)
+
+        # If the agent has crashed Update the screen
+        # Reset the screen
+        screen.fill(white)
+        # Display game statistics
+        self.display_game_statistics(screen, font)
+        # Display game over message
+        self.display_game_over_message(screen, font)
+        # Update the game display
+        self.update_game_display()
         # # Handle the game over
         # self.handle_game_over()
 
@@ -701,14 +864,19 @@ class QLearningGame(Game):
         for iteration_num in range(self.get_maximum_iterations()):
             self.get_environment().reset_environment()
             self.get_agent().reset_agent()
+            self.reset_simulation_statistics()
             self.run_iteration(visualize)
-            print(f'Iteration: {iteration_num+1}', f'Score: {self.get_environment().get_current_score()}')
+            print(f'Iteration: {iteration_num+1}', f'Score: {self.get_environment().get_current_score()}',
+                  *(['(truncated)'] if self.get_agent().is_truncated() else []))
+            if not visualize:
+                print(f'Simulated frames per second: {self.get_frames_per_second():.0f}')
             if iteration_num % 50 == 0:
                 self.save_q_function(weights_parent_directory, iteration_num)
 
         self.save_q_function(weights_parent_directory, iteration_num)
 
         if visualize:
+            import pygame
             pygame.quit()
 
 
@@ -724,16 +892,27 @@ if __name__ == '__main__':
     #                       GENETIC ALGORITHM                     #
     ###############################################################
     # population_size = 50
-    # init_agents = [GeneticAlgorithmAgent(np.random.randn(4, 7), initial_velocity=(5, 0)) for _ in range(
-    #     population_size)]
-    # my_game = GeneticAlgorithmGame(init_agents, 31, ChromeTRexRush(bird_add_threshold=1))
+    # environment_seed, agents_seed, game_seed = split_seed(0, 3)
+    # agents_random_state = get_random_state(agents_seed)
+    # init_agents = [GeneticAlgorithmAgent(agents_random_state.standard_normal((4, 7)), initial_velocity=(5, 0))
+    #                for _ in range(population_size)]
+    # my_game = GeneticAlgorithmGame(init_agents, 31, ChromeTRexRush(bird_add_threshold=1, random_state=environment_seed),
+    #                                random_state=game_seed)
     # my_game.play_game(True)
 
     ###############################################################
     #                           Q LEARNING                        #
     ###############################################################
-    init_agent = QLearningAgent()
-    my_game = QLearningGame(init_agent, ChromeTRexRush(bird_add_threshold=-1), np.zeros((3, 3, 7, 3, 3, 4, 4)),
-                            max_iterations=1000)
+    environment_seed, agent_seed = split_seed(0, 2)
+    init_agent = QLearningAgent(random_state=agent_seed)
+    # Keep training the Q function of the previous runs
+    q_store_file_path = '../data/q_learning/q_store.npy'
+    if exist_file(q_store_file_path):
+        init_q_function = load_q_store(q_store_file_path, writable=True)
+    else:
+        init_q_function = create_q_store(StateEncoder().get_state_shape(),
+                                         len(init_agent.get_action_name_to_action_dict()), q_store_file_path)
+    my_game = QLearningGame(init_agent, ChromeTRexRush(bird_add_threshold=-1, random_state=environment_seed),
+                            init_q_function, max_iterations=1000)
     my_game.play_game(True)
     print('End of Main!')
@@ -0,0 +1,54 @@
+"""
+This file defines the checkpoints of the genetic algorithm. A checkpoint is a single uncompressed .npz file holding
+everything needed to resume a run after a generation: the weights and rewards of the whole population, the best agents,
+the generation number and the states of the random generators. It is written to a temporary file first and then moved
+in place, so a run stopped while writing it never leaves a broken checkpoint behind.
+"""
+import json
+import os
+
+import numpy as np
+
+RANDOM_STATE_PREFIX = 'random_state_'
+
+
+def get_random_state_data(random_state):
+    # The state of a numpy random generator as a string array, so that it can be stored next to the weights
+    return np.array(json.dumps(random_state.bit_generator.state))
+
+
+def set_random_state_data(random_state, random_state_data):
+    random_state.bit_generator.state = json.loads(str(random_state_data))
+
+
+def save_checkpoint(checkpoint_file_path, generation, population_weights, population_rewards, best_agents_weights,
+                    best_agents_rewards, best_agents_states, random_states):
+    """
+    :param generation: The number of the generation which was just evaluated
+    :param best_agents_states: The (number of best agents, 8) states of the best agents (see ArenaObject.state)
+    :param random_states: A dictionary of the numpy random generators of the run by their names
+    """
+    checkpoint_directory_path = os.path.dirname(checkpoint_file_path)
+    if checkpoint_directory_path:
+        os.makedirs(checkpoint_directory_path, exist_ok=True)
+    random_states_data = {f'{RANDOM_STATE_PREFIX}{name}': get_random_state_data(random_state)
+                          for name, random_state in random_states.items()}
+    temporary_file_path = f'{checkpoint_file_path}.tmp'
+    with open(temporary_file_path, 'wb') as checkpoint_file:
+        np.savez(checkpoint_file, generation=generation, population_weights=population_weights,
+                 population_rewards=population_rewards, best_agents_weights=best_agents_weights,
+                 best_agents_rewards=best_agents_rewards, best_agents_states=best_agents_states, **random_states_data)
+    os.replace(temporary_file_path, checkpoint_file_path)
+
+
+def load_checkpoint(checkpoint_file_path):
+    """
+    :return: A dictionary with the arrays of the checkpoint. The states of the random generators are gathered in a
+             dictionary under the 'random_states' key
+    """
+    with np.load(checkpoint_file_path) as checkpoint_file:
+        checkpoint = {key: checkpoint_file[key] for key in checkpoint_file.files}
+    checkpoint['random_states'] = {key[len(RANDOM_STATE_PREFIX):]: checkpoint.pop(key) for key in list(checkpoint)
+                                   if key.startswith(RANDOM_STATE_PREFIX)}
+    checkpoint['generation'] = int(checkpoint['generation'])
+    return checkpoint
@@ -0,0 +1,135 @@
+"""
+This file defines an evolution strategies trainer (OpenAI-ES) for the linear policy of the GeneticAlgorithmAgent.
+Instead of a population of independent genomes, it keeps a single mean weight matrix and estimates the gradient of the
+reward from random perturbations around it:
+
+    * the perturbations are sampled in antithetic pairs (+epsilon and -epsilon), which cancels most of the noise of the
+      estimate
+    * the rewards are replaced by their centered ranks, so the update does not depend on the (tiny) scale of the
+      rewards and is not dominated by a few lucky episodes
+    * all the perturbed policies are generated, evaluated (as one population) and combined with batched array operations
+
+The mean policy is evaluated with the perturbed ones, as the first agent of the population, so it is also the pace agent
+setting the speed of the environment (see genetic_algorithm.fitness).
+"""
+import time
+
+import numpy as np
+
+from arena_objects.agent import GeneticAlgorithmAgent
+from genetic_algorithm.fitness import FitnessEvaluator
+from utils.random_utils import get_random_state
+
+
+def get_centered_ranks(rewards):
+    # The ranks of the rewards scaled to [-0.5, 0.5]
+    ranks = np.empty(len(rewards))
+    ranks[np.argsort(rewards, kind='stable')] = np.arange(len(rewards))
+    return ranks / max(len(rewards) - 1, 1) - 0.5
+
+
+class EvolutionStrategiesTrainer:
+    def __init__(self, initial_weights=None, weights_shape=(4, 7), num_perturbations=50, sigma=0.1, learning_rate=0.05,
+                 weight_decay=0.0, fitness_evaluator=None, environment_parameters=None, course_seed=None,
+                 random_state=None):
+        """
+        :param initial_weights: The initial mean weights. Random normal weights of the given shape by default
+        :param num_perturbations: The number of perturbed policies evaluated every generation (rounded up to an even
+                                  number for the antithetic pairs)
+        :param sigma: The standard deviation of the perturbations
+        :param weight_decay: The L2 penalty on the mean weights
+        :param fitness_evaluator: An evaluator of genetic_algorithm.fitness (serial FitnessEvaluator by default)
+        :param environment_parameters: Keyword arguments of the ChromeTRexRush of the episodes
+        :param course_seed: If given, every generation is evaluated on the course of this seed. Otherwise a new course
+                            is drawn from the random generator of the trainer every generation
+        """
+        self.__random_state = get_random_state(random_state)
+        if initial_weights is None:
+            initial_weights = self.__random_state.standard_normal(weights_shape)
+        self.__weights = np.array(initial_weights, dtype=float)
+        self.__num_pairs = (num_perturbations + 1) // 2
+        self.__sigma = sigma
+        self.__learning_rate = learning_rate
+        self.__weight_decay = weight_decay
+        self.__fitness_evaluator = fitness_evaluator if fitness_evaluator is not None else FitnessEvaluator()
+        self.__environment_parameters = environment_parameters if environment_parameters is not None else {}
+        self.__course_seed = course_seed
+        self.__generation = 0
+        self.__simulated_frames = 0
+        self.__statistics = []
+
+    def get_weights(self):
+        return self.__weights
+
+    def set_weights(self, weights):
+        self.__weights = weights
+
+    def get_agent(self):
+        return GeneticAlgorithmAgent(np.array(self.__weights))
+
+    def get_random_state(self):
+        return self.__random_state
+
+    def get_fitness_evaluator(self):
+        return self.__fitness_evaluator
+
+    def get_generation(self):
+        return self.__generation
+
+    def get_simulated_frames(self):
+        return self.__simulated_frames
+
+    def get_statistics(self):
+        return self.__statistics
+
+    def get_perturbations(self):
+        # The (2 * number of pairs, number of actions, number of features) antithetic perturbations
+        epsilon = self.__random_state.standard_normal((self.__num_pairs,) + self.__weights.shape)
+        return np.concatenate([epsilon, -epsilon])
+
+    def get_gradient(self, perturbations, rewards):
+        shaped_rewards = get_centered_ranks(rewards)
+        return np.einsum('p,paf->af', shaped_rewards, perturbations) / (len(perturbations) * self.__sigma)
+
+    def step(self):
+        """
+        Evaluate the mean policy and its perturbations on one course and move the mean policy along the estimated
+        gradient.
+
+        :return: The statistics of the generation
+        """
+        start_time = time.perf_counter()
+        perturbations = self.get_perturbations()
+        population_weights = np.concatenate([self.__weights[np.newaxis],
+                                             self.__weights + self.__sigma * perturbations])
+        course_seed = self.__course_seed
+        if course_seed is None:
+            course_seed = int(self.__random_state.integers(2 ** 32))
+        rewards, num_frames, score, _ = self.__fitness_evaluator.evaluate(population_weights,
+                                                                          self.__environment_parameters, course_seed)
+        gradient = self.get_gradient(perturbations, rewards[1:])
+        self.__weights = self.__weights + self.__learning_rate * (gradient - self.__weight_decay * self.__weights)
+
+        self.__simulated_frames += num_frames
+        statistics = {'generation': self.__generation, 'mean_policy_reward': float(rewards[0]),
+                      'best_reward': float(rewards.max()), 'mean_reward': float(rewards[1:].mean()), 'score': score,
+                      'simulated_frames': num_frames, 'total_simulated_frames': self.__simulated_frames,
+                      'generation_time': time.perf_counter() - start_time}
+        self.__statistics.append(statistics)
+        self.__generation += 1
+        return statistics
+
+    def train(self, num_generations, target_reward=None, verbose=True):
+        """
+        :param target_reward: If given, the training stops as soon as the mean policy reaches this reward
+        :return: The mean weights after the training
+        """
+        for _ in range(num_generations):
+            statistics = self.step()
+            if verbose:
+                print(f'Generation: {statistics["generation"]}, Score: {statistics["score"]}, '
+                      f'Mean policy reward: {statistics["mean_policy_reward"]}, '
+                      f'Total simulated frames: {statistics["total_simulated_frames"]}')
+            if target_reward is not None and statistics['mean_policy_reward'] >= target_reward:
+                break
+        return self.__weights
@@ -0,0 +1,332 @@
+"""
+This file defines the fitness evaluation of a genetic algorithm population. The population is given as its stacked
+weight tensor and can be split into shards which are simulated in parallel by a pool of worker processes.
+
+Every shard is simulated in its own environment built from the same course seed. The obstacles of an environment
+scroll with the velocity of the first agent of its game (see Engine.update_game), so the first agent of the population
+is added in front of every shard as the pace agent. All the shards therefore see exactly the same course, and the
+rewards do not depend on the number of workers.
+
+As the fitness of a single episode is noisy, the SuccessiveHalvingEvaluator plays several courses per agent and drops
+the worst agents after every round so that the extra episodes are only spent on the promising ones. The
+CachedFitnessEvaluator remembers the rewards of the (genome, course) pairs it has already simulated, so that the elites
+and the duplicate children are not simulated again.
+"""
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+
+import numpy as np
+
+from arena.environments import ChromeTRexRush
+from arena_objects.agent import GeneticAlgorithmAgent
+from utils.random_utils import split_seed
+
+
+def get_environment_parameters(environment: ChromeTRexRush):
+    # The parameters needed to build a copy of the environment in another process
+    course_tape = environment.get_course_tape()
+    return {'environment_width': environment.get_environment_width(),
+            'environment_height': environment.get_environment_height(),
+            'level_threshold': environment.get_level_increase_threshold(),
+            'bird_add_threshold': environment.get_bird_add_threshold(),
+            'course': np.asarray(course_tape.get_course()) if course_tape is not None else None}
+
+
+def evaluate_population_shard(pace_weights, shard_weights, environment_parameters, agent_parameters, course_seed,
+                              episode_limits=None):
+    """
+    Play one episode with the agents of a shard of the population. This is a module level function so that it can be
+    sent to the worker processes.
+
+    :param pace_weights: The weights of the pace agent (the first agent of the population)
+    :param shard_weights: The (shard size, number of actions, number of features) weights of the agents of the shard
+    :param episode_limits: Keyword arguments (max_episode_frames, max_episode_time) of the GeneticAlgorithmGame
+    :return: The total rewards of the agents of the shard, the number of simulated frames, the score of the episode and
+             whether every agent of the shard was truncated by a limit (instead of crashing)
+    """
+    # Imported here as the games module is the one using the fitness evaluators
+    from games import GeneticAlgorithmGame
+    agents = [GeneticAlgorithmAgent(np.array(weights), **agent_parameters)
+              for weights in [pace_weights, *shard_weights]]
+    environment = ChromeTRexRush(random_state=course_seed, **environment_parameters)
+    game = GeneticAlgorithmGame(agents, 1, environment, num_best_agents=0, **(episode_limits or {}))
+    num_frames = game.run_headless_iteration()
+    rewards = np.array([agent.get_total_reward() for agent in agents[1:]])
+    truncated = np.array([agent.is_truncated() for agent in agents[1:]])
+    return rewards, num_frames, environment.get_current_score(), truncated
+
+
+class FitnessEvaluator:
+    def __init__(self, num_workers=1, agent_parameters=None, max_episode_frames=None, max_episode_time=None):
+        """
+        :param num_workers: The number of worker processes. With a single worker the population is simulated serially
+                            in this process, without any pool
+        :param agent_parameters: Keyword arguments used to build the GeneticAlgorithmAgent of every genome
+        :param max_episode_frames: The maximum number of frames of the episode of a shard, so that a single very good
+                                   agent cannot hold up the generation. The frame limit is the same for all the shards,
+                                   so it keeps the rewards independent of the number of workers
+        :param max_episode_time: The maximum wall clock time of the episode of a shard in seconds
+        """
+        assert num_workers >= 1
+        self.__num_workers = num_workers
+        self.__agent_parameters = agent_parameters if agent_parameters is not None else {}
+        self.__episode_limits = {'max_episode_frames': max_episode_frames, 'max_episode_time': max_episode_time}
+        self.__executor = None
+
+    def get_num_workers(self):
+        return self.__num_workers
+
+    def get_agent_parameters(self):
+        return self.__agent_parameters
+
+    def get_episode_limits(self):
+        return self.__episode_limits
+
+    def get_executor(self):
+        # The pool is started once and reused by all the generations
+        if self.__executor is None:
+            self.__executor = ProcessPoolExecutor(max_workers=self.__num_workers)
+        return self.__executor
+
+    def close(self):
+        # Shut down the worker pool. It is started again if the evaluator is used after that
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+
+    def evaluate(self, population_weights, environment_parameters, course_seed, pace_weights=None):
+        """
+        :param population_weights: The (population size, number of actions, number of features) weight tensor
+        :param environment_parameters: See get_environment_parameters
+        :param course_seed: The seed of the environment of every shard
+        :param pace_weights: The weights of the pace agent. By default it is the first agent of the population, but it
+                             can be given to evaluate a part of a population on the course of the whole population
+        :return: The total rewards of the population (in the order of the population), the number of frames simulated
+                 over all the shards, the score of the longest episode and the truncated flags of the population
+        """
+        pace_weights = population_weights[0] if pace_weights is None else pace_weights
+        if self.__num_workers == 1:
+            return evaluate_population_shard(pace_weights, population_weights, environment_parameters,
+                                             self.__agent_parameters, course_seed, self.__episode_limits)
+
+        shards = np.array_split(population_weights, min(self.__num_workers, len(population_weights)))
+        futures = [self.get_executor().submit(evaluate_population_shard, pace_weights, shard_weights,
+                                              environment_parameters, self.__agent_parameters, course_seed,
+                                              self.__episode_limits)
+                   for shard_weights in shards]
+        # Gather the results in the order of the shards, which is the order of the population
+        results = [future.result() for future in futures]
+        rewards = np.concatenate([shard_rewards for shard_rewards, _, _, _ in results])
+        num_frames = sum(shard_num_frames for _, shard_num_frames, _, _ in results)
+        score = max(shard_score for _, _, shard_score, _ in results)
+        truncated = np.concatenate([shard_truncated for _, _, _, shard_truncated in results])
+        return rewards, num_frames, score, truncated
+
+
+class SuccessiveHalvingEvaluator:
+    def __init__(self, fitness_evaluator: FitnessEvaluator, num_rounds=3, courses_per_round=2,
+                 elimination_fraction=0.5, min_survivors=10):
+        """
+        Multi course fitness with early elimination (racing). In every round the remaining agents play a few courses,
+        then the bottom fraction of them (by their mean reward so far) is eliminated, so only the promising agents are
+        evaluated on more courses. The agents are ranked by the number of rounds they survived first: the fitness of an
+        agent is its mean reward over the courses it played, shifted below the worst fitness of the agents which
+        survived longer when needed, so an agent eliminated early never outranks an agent evaluated on more courses.
+
+        It has the same evaluate method as the FitnessEvaluator, so it can be given to a GeneticAlgorithmGame instead.
+        An agent is truncated if any of its episodes was truncated.
+
+        :param fitness_evaluator: The evaluator playing the episodes (serially or in parallel)
+        :param elimination_fraction: The fraction of the remaining agents eliminated after every round but the last one
+        :param min_survivors: The minimum number of agents kept after an elimination (e.g. the number of best agents)
+        """
+        assert 0 <= elimination_fraction < 1
+        self.__fitness_evaluator = fitness_evaluator
+        self.__num_rounds = num_rounds
+        self.__courses_per_round = courses_per_round
+        self.__elimination_fraction = elimination_fraction
+        self.__min_survivors = min_survivors
+        self.__num_episodes = None
+
+    def get_fitness_evaluator(self):
+        return self.__fitness_evaluator
+
+    def get_episode_limits(self):
+        return self.__fitness_evaluator.get_episode_limits()
+
+    def close(self):
+        self.__fitness_evaluator.close()
+
+    def get_num_episodes(self):
+        # The number of courses played by every agent in the last evaluation
+        return self.__num_episodes
+
+    def get_course_seeds(self, course_seed):
+        # One independent seed for every course of every round, all derived from the given course seed
+        num_courses = self.__num_rounds * self.__courses_per_round
+        return [int(seed.generate_state(1)[0]) for seed in split_seed(course_seed, num_courses)]
+
+    def get_survivors(self, survivors, mean_rewards):
+        num_survivors = max(self.__min_survivors, int(np.ceil(len(survivors) * (1 - self.__elimination_fraction))))
+        if num_survivors >= len(survivors):
+            return survivors
+        # Keep the agents with the highest mean rewards, in the order of the population
+        return np.sort(survivors[np.argsort(-mean_rewards[survivors], kind='stable')[:num_survivors]])
+
+    @staticmethod
+    def get_ranked_fitness(mean_rewards, num_rounds):
+        """
+        :param mean_rewards: The mean rewards of the agents over the courses they played
+        :param num_rounds: The number of rounds played by every agent
+        :return: The mean rewards, where the agents of every round are shifted strictly below the agents of the later
+                 rounds (keeping their order within the round)
+        """
+        fitness = np.array(mean_rewards, dtype=float)
+        for round_num in range(int(num_rounds.max()) - 1, 0, -1):
+            round_agents = num_rounds == round_num
+            if not np.any(round_agents):
+                continue
+            worst_later_fitness = fitness[num_rounds > round_num].min()
+            shift = max(fitness[round_agents].max() - worst_later_fitness, 0)
+            fitness[round_agents] = np.minimum(fitness[round_agents] - shift,
+                                               np.nextafter(worst_later_fitness, -np.inf))
+        return fitness
+
+    def evaluate(self, population_weights, environment_parameters, course_seed, pace_weights=None):
+        population_size = len(population_weights)
+        # The remaining agents keep the pace agent of the whole population
+        pace_weights = population_weights[0] if pace_weights is None else pace_weights
+        total_rewards = np.zeros(population_size)
+        num_episodes = np.zeros(population_size, dtype=int)
+        num_rounds = np.zeros(population_size, dtype=int)
+        truncated = np.zeros(population_size, dtype=bool)
+        survivors = np.arange(population_size)
+        total_num_frames, score = 0, 0
+        course_seeds = self.get_course_seeds(course_seed)
+        for round_num in range(self.__num_rounds):
+            round_course_seeds = course_seeds[round_num * self.__courses_per_round:
+                                              (round_num + 1) * self.__courses_per_round]
+            for round_course_seed in round_course_seeds:
+                rewards, num_frames, course_score, course_truncated = self.__fitness_evaluator.evaluate(
+                    population_weights[survivors], environment_parameters, round_course_seed, pace_weights)
+                total_rewards[survivors] += rewards
+                truncated[survivors] |= course_truncated
+                num_episodes[survivors] += 1
+                total_num_frames += num_frames
+                score = max(score, course_score)
+            num_rounds[survivors] += 1
+            if round_num < self.__num_rounds - 1:
+                survivors = self.get_survivors(survivors, total_rewards / num_episodes)
+        self.__num_episodes = num_episodes
+        return self.get_ranked_fitness(total_rewards / num_episodes, num_rounds), total_num_frames, score, truncated
+
+
+def get_weights_digest(weights):
+    # A short hash of the bytes of the weights of an agent
+    return hashlib.blake2b(np.ascontiguousarray(weights, dtype=np.float64).tobytes(), digest_size=16).digest()
+
+
+class FitnessCache:
+    def __init__(self, max_size=100000):
+        """
+        A bounded map from (genome, course) keys to (reward, truncated) results, evicting the least recently used key
+        when it is full.
+        """
+        self.__max_size = max_size
+        self.__rewards = OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+
+    def __len__(self):
+        return len(self.__rewards)
+
+    def get_max_size(self):
+        return self.__max_size
+
+    def get_hits(self):
+        return self.__hits
+
+    def get_misses(self):
+        return self.__misses
+
+    def clear(self):
+        self.__rewards.clear()
+
+    def get(self, key):
+        reward = self.__rewards.get(key)
+        if reward is None:
+            self.__misses += 1
+            return None
+        self.__hits += 1
+        self.__rewards.move_to_end(key)
+        return reward
+
+    def put(self, key, reward):
+        self.__rewards[key] = reward
+        self.__rewards.move_to_end(key)
+        if len(self.__rewards) > self.__max_size:
+            self.__rewards.popitem(last=False)
+
+
+class CachedFitnessEvaluator:
+    def __init__(self, fitness_evaluator: FitnessEvaluator, max_size=100000):
+        """
+        Evaluates only the genomes whose reward on the course is not cached yet (each distinct genome once), with the
+        wrapped evaluator. A course is identified by its seed and the weights of its pace agent, which sets the speed of
+        the obstacles. The cache assumes that the environment parameters do not change between the evaluations.
+        The truncated rewards are not cached when the episodes have a wall clock time limit, as they depend on the load
+        of the machine.
+
+        It has the same evaluate method as the FitnessEvaluator, so it can be given to a GeneticAlgorithmGame (or a
+        SuccessiveHalvingEvaluator) instead.
+        """
+        self.__fitness_evaluator = fitness_evaluator
+        self.__cache = FitnessCache(max_size)
+
+    def get_fitness_evaluator(self):
+        return self.__fitness_evaluator
+
+    def get_cache(self):
+        return self.__cache
+
+    def get_episode_limits(self):
+        return self.__fitness_evaluator.get_episode_limits()
+
+    def close(self):
+        self.__fitness_evaluator.close()
+
+    def evaluate(self, population_weights, environment_parameters, course_seed, pace_weights=None):
+        """
+        :return: The total rewards of the population, the number of frames and the score of the simulated episodes (0 if
+                 all the rewards were cached) and the truncated flags of the population
+        """
+        pace_weights = population_weights[0] if pace_weights is None else pace_weights
+        course_key = (course_seed, get_weights_digest(pace_weights))
+        keys = [(get_weights_digest(weights), course_key) for weights in population_weights]
+
+        rewards = np.zeros(len(population_weights))
+        truncated = np.zeros(len(population_weights), dtype=bool)
+        # The population index of the first agent of every genome which has to be simulated
+        uncached_indices = {}
+        for index, key in enumerate(keys):
+            result = self.__cache.get(key) if key not in uncached_indices else None
+            if result is not None:
+                rewards[index], truncated[index] = result
+            elif key not in uncached_indices:
+                uncached_indices[key] = index
+        if not uncached_indices:
+            return rewards, 0, 0, truncated
+
+        uncached_rewards, num_frames, score, uncached_truncated = self.__fitness_evaluator.evaluate(
+            population_weights[list(uncached_indices.values())], environment_parameters, course_seed, pace_weights)
+        simulated_results = dict(zip(uncached_indices, zip(uncached_rewards.tolist(), uncached_truncated.tolist())))
+        # Only the frame limit (and the end of the course) truncate an episode the same way every time
+        cache_truncated = self.get_episode_limits()['max_episode_time'] is None
+        for key, (reward, agent_truncated) in simulated_results.items():
+            if cache_truncated or not agent_truncated:
+                self.__cache.put(key, (reward, agent_truncated))
+        for index, key in enumerate(keys):
+            if key in simulated_results:
+                rewards[index], truncated[index] = simulated_results[key]
+        return rewards, num_frames, score, truncated
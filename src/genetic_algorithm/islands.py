@@ -0,0 +1,238 @@
+"""
+This file defines the island model of the genetic algorithm. The population is split into several islands, each
+evolving with its own GeneticAlgorithmGame in its own process. Every few generations the islands send copies of their
+best genomes to their neighbours (a ring or all the other islands), where they join the best agents. An island only
+waits for the migrants of its own neighbours, so there is no global synchronization between the generations, and the
+islands keep more diversity than a single population of the same size.
+
+The migrants are tagged with the generation they were sent after: an island buffers the migrants of the later
+generations (sent by a faster neighbour) until it reaches them, and the migrants of a generation are ordered by the
+island they come from, so a run is reproduced from its seed.
+"""
+import heapq
+import multiprocessing
+import queue
+import time
+import traceback
+
+import numpy as np
+
+from arena.environments import ChromeTRexRush
+from arena_objects.agent import GeneticAlgorithmAgent
+from genetic_algorithm.fitness import get_weights_digest
+from utils.random_utils import get_random_state, split_seed
+
+RING_TOPOLOGY, FULLY_CONNECTED_TOPOLOGY = 'ring', 'fully_connected'
+
+
+def get_neighbours(island_index, num_islands, topology):
+    # The islands receiving the migrants of the given island
+    if num_islands == 1:
+        return []
+    if topology == RING_TOPOLOGY:
+        return [(island_index + 1) % num_islands]
+    elif topology == FULLY_CONNECTED_TOPOLOGY:
+        return [index for index in range(num_islands) if index != island_index]
+    else:
+        raise ValueError(f'Invalid Topology: {topology}')
+
+
+def get_num_incoming_islands(num_islands, topology):
+    # The number of islands sending their migrants to every island (both topologies are symmetric)
+    return len(get_neighbours(0, num_islands, topology))
+
+
+def get_migrants(game, num_migrants):
+    # The weights and rewards of the best agents of the island
+    best_agents = heapq.nlargest(num_migrants, game.get_best_agents(), key=lambda x: x[0])
+    return [(agent_reward, np.array(agent.get_weights())) for agent_reward, agent in best_agents]
+
+
+def add_migrants(game, migrants):
+    # The migrants join the best agents of the island, as crashed agents with the rewards of their home islands
+    migrant_agents = []
+    for agent_reward, weights in migrants:
+        agent = GeneticAlgorithmAgent(weights)
+        agent.increase_reward(agent_reward)
+        agent.set_crashed(True)
+        migrant_agents.append(agent)
+    if migrant_agents:
+        game.update_best_agents(migrant_agents)
+
+
+def receive_migrants(inbox, generation, num_incoming_islands, pending_migrants):
+    """
+    :param pending_migrants: The received migrants by generation, where the migrants of the later generations are kept
+    :return: The (island index, migrants) sent by the incoming islands after the given generation, ordered by island
+    """
+    generation_migrants = pending_migrants.setdefault(generation, [])
+    while len(generation_migrants) < num_incoming_islands:
+        migrants_generation, island_index, migrants = inbox.get()
+        pending_migrants.setdefault(migrants_generation, []).append((island_index, migrants))
+    return sorted(pending_migrants.pop(generation), key=lambda x: x[0])
+
+
+def run_island(island_index, island_seed, island_parameters, inbox, neighbour_inboxes, result_queue):
+    """
+    Evolve one island. This is a module level function so that it can be run in a worker process.
+
+    :param inbox: The queue receiving the migrants of the other islands
+    :param neighbour_inboxes: The inboxes of the islands receiving the migrants of this island
+    :param result_queue: The queue receiving (island index, (statistics, best agents of the island), None) at the end,
+                         or (island index, None, traceback) if the island failed
+    """
+    # Imported here as the games module is the one using the genetic algorithm modules
+    from games import GeneticAlgorithmGame
+    try:
+        agents_seed, environment_seed, game_seed = split_seed(island_seed, 3)
+        agents_random_state = get_random_state(agents_seed)
+        agents = [GeneticAlgorithmAgent(agents_random_state.standard_normal(island_parameters['weights_shape']))
+                  for _ in range(island_parameters['population_size'])]
+        environment = ChromeTRexRush(random_state=environment_seed, **island_parameters['environment_parameters'])
+        game = GeneticAlgorithmGame(agents, island_parameters['num_generations'], environment,
+                                    num_best_agents=island_parameters['num_best_agents'], random_state=game_seed)
+
+        island_statistics = []
+        pending_migrants = {}
+        num_generations = island_parameters['num_generations']
+        migration_interval = island_parameters['migration_interval']
+        for generation in range(num_generations):
+            start_time = time.perf_counter()
+            environment.reset_environment()
+            game.reset_simulation_statistics()
+            game.run_iteration(False)
+            game.update_best_agents(game.get_agents())
+            agents_rewards = np.array([agent.get_total_reward() for agent in game.get_agents()])
+            island_statistics.append({'island': island_index, 'generation': generation,
+                                      'score': environment.get_current_score(),
+                                      'best_reward': float(agents_rewards.max()),
+                                      'mean_reward': float(agents_rewards.mean()),
+                                      'best_agents_reward': max(agent_reward
+                                                                for agent_reward, _ in game.get_best_agents()),
+                                      'simulated_frames': game.get_simulated_frames(),
+                                      'frames_per_second': game.get_frames_per_second(),
+                                      'generation_time': time.perf_counter() - start_time})
+            if generation == num_generations - 1:
+                break
+            if (generation + 1) % migration_interval == 0 and neighbour_inboxes:
+                migrants = get_migrants(game, island_parameters['num_migrants'])
+                for neighbour_inbox in neighbour_inboxes:
+                    neighbour_inbox.put((generation, island_index, migrants))
+                # Only wait for the migrants of this generation of the islands sending to this one
+                received_migrants = receive_migrants(inbox, generation, island_parameters['num_incoming_islands'],
+                                                     pending_migrants)
+                for _, migrants in received_migrants:
+                    add_migrants(game, migrants)
+            game.set_agents(game.get_new_population(game.get_agents()))
+
+        best_agents = [(agent_reward, np.array(agent.get_weights())) for agent_reward, agent in game.get_best_agents()]
+        result = (island_index, (island_statistics, best_agents), None)
+    except Exception:
+        result = (island_index, None, traceback.format_exc())
+    result_queue.put(result)
+
+class IslandModel:
+    def __init__(self, num_islands, population_size, num_generations, migration_interval=5, num_migrants=2,
+                 topology=RING_TOPOLOGY, num_best_agents=10, weights_shape=(4, 7), environment_parameters=None,
+                 random_state=None):
+        """
+        :param num_islands: The number of islands, each one evolving in its own process
+        :param population_size: The population size of every island
+        :param migration_interval: The number of generations between two migrations
+        :param num_migrants: The number of best genomes sent by an island to each of its neighbours
+        :param topology: 'ring' (to the next island) or 'fully_connected' (to all the other islands)
+        :param environment_parameters: Keyword arguments of the ChromeTRexRush of every island
+        :param random_state: The seed of the run, split into one seed for every island
+        """
+        if topology not in (RING_TOPOLOGY, FULLY_CONNECTED_TOPOLOGY):
+            raise ValueError(f'Invalid Topology: {topology}')
+        self.__num_islands = num_islands
+        self.__topology = topology
+        self.__island_parameters = {'population_size': population_size, 'num_generations': num_generations,
+                                    'migration_interval': migration_interval, 'num_migrants': num_migrants,
+                                    'num_best_agents': num_best_agents, 'weights_shape': weights_shape,
+                                    'environment_parameters': environment_parameters or {},
+                                    'num_incoming_islands': get_num_incoming_islands(num_islands, topology)}
+        self.__seed = random_state if random_state is not None else np.random.SeedSequence()
+        self.__island_statistics = []
+        self.__hall_of_fame = []
+
+    def get_num_islands(self):
+        return self.__num_islands
+
+    def get_topology(self):
+        return self.__topology
+
+    def get_island_statistics(self):
+        # The statistics of every generation of every island, ordered by island and generation
+        return self.__island_statistics
+
+    def get_hall_of_fame(self):
+        # The (reward, weights) of the best genomes of all the islands, best first
+        return self.__hall_of_fame
+
+    def get_hall_of_fame_agents(self):
+        return [GeneticAlgorithmAgent(weights) for _, weights in self.__hall_of_fame]
+
+    @staticmethod
+    def merge_best_agents(islands_best_agents, hall_of_fame_size):
+        # The best genomes of all the islands without the duplicates (the migrants are in several islands)
+        best_agents = {}
+        for agent_reward, weights in sorted(islands_best_agents, key=lambda x: -x[0]):
+            best_agents.setdefault(get_weights_digest(weights), (agent_reward, weights))
+        return list(best_agents.values())[:hall_of_fame_size]
+
+    @staticmethod
+    def get_results(islands, result_queue, poll_interval=1.0):
+        """
+        Wait for the results of all the islands. The results are read before joining the processes, as a process does
+        not end while its queued data is not read.
+
+        :raises RuntimeError: If an island failed, or ended without sending its results
+        """
+        results = {}
+        while len(results) < len(islands):
+            try:
+                island_index, island_result, error = result_queue.get(timeout=poll_interval)
+            except queue.Empty:
+                for island_index, island in enumerate(islands):
+                    # An island which ended without results was killed (its exceptions are sent with the results)
+                    if island_index not in results and island.exitcode is not None:
+                        raise RuntimeError(f'Island {island_index} ended with exit code {island.exitcode} without '
+                                           f'sending its results')
+                continue
+            if error is not None:
+                raise RuntimeError(f'Island {island_index} failed:\n{error}')
+            results[island_index] = island_result
+        return [results[island_index] for island_index in range(len(islands))]
+
+    def run(self, hall_of_fame_size=None):
+        num_islands = self.__num_islands
+        island_seeds = split_seed(self.__seed, num_islands)
+        inboxes = [multiprocessing.Queue() for _ in range(num_islands)]
+        result_queue = multiprocessing.Queue()
+        islands = [multiprocessing.Process(target=run_island,
+                                           args=(index, island_seeds[index], self.__island_parameters, inboxes[index],
+                                                 [inboxes[neighbour] for neighbour in
+                                                  get_neighbours(index, num_islands, self.__topology)],
+                                                 result_queue))
+                   for index in range(num_islands)]
+        try:
+            for island in islands:
+                island.start()
+            results = self.get_results(islands, result_queue)
+            for island in islands:
+                island.join()
+        finally:
+            # The other islands are stopped when one of them failed (their neighbours would wait for its migrants)
+            for island in islands:
+                if island.is_alive():
+                    island.terminate()
+                    island.join()
+
+        self.__island_statistics = [statistics for island_statistics, _ in results for statistics in island_statistics]
+        islands_best_agents = [best_agent for _, best_agents in results for best_agent in best_agents]
+        if hall_of_fame_size is None:
+            hall_of_fame_size = self.__island_parameters['num_best_agents']
+        self.__hall_of_fame = self.merge_best_agents(islands_best_agents, hall_of_fame_size)
+        return self.__hall_of_fame
@@ -0,0 +1,106 @@
+"""
+This file defines the genetic operators on a whole population at once. The population is the stacked
+(population size, number of actions, number of features) weight tensor of its agents, and the selection, crossover and
+mutation of all the children are done with a few batched array operations instead of one function call per child. The
+operators are the same as the per pair ones of GeneticAlgorithmGame (row, column, element and addition reproduction and
+mutate_weights).
+"""
+import numpy as np
+
+from arena_objects.agent import GeneticAlgorithmAgent
+from utils.random_utils import get_random_state
+
+ROW_REPRODUCTION, COLUMN_REPRODUCTION, ELEMENT_REPRODUCTION, ADDITION_REPRODUCTION = 0, 1, 2, 3
+NUM_REPRODUCTION_FUNCTIONS = 4
+
+
+def get_random_subset_masks(num_masks, num_elements, random_state):
+    # For every mask, a uniformly random subset of between 1 and num_elements - 1 elements (the permutation and the
+    # number of rows taken from the first parent in row_reproduction)
+    subset_sizes = random_state.integers(1, num_elements, size=num_masks)
+    ranks = np.argsort(np.argsort(random_state.random((num_masks, num_elements)), axis=1), axis=1)
+    return ranks < subset_sizes[:, np.newaxis]
+
+
+def select_parents(rewards, num_children, num_parents=None, random_state=None):
+    """
+    Select the two (different) parents of every child among the first num_parents agents in the order of their rewards,
+    with softmax probabilities of their rewards. The second parents are drawn with rejection of the first ones, which is
+    the same as drawing the pairs without replacement.
+
+    :raises ValueError: If fewer than two parents have a non zero probability, no pair can be drawn
+
+    :return: Two (number of children,) arrays with the population indices of the first and the second parents
+    """
+    random_state = get_random_state(random_state)
+    num_parents = len(rewards) // 3 if num_parents is None else num_parents
+    assert num_parents >= 2
+    parent_indices = np.argsort(rewards)[:num_parents]
+    parent_probabilities = GeneticAlgorithmAgent.softmax_activation(rewards[parent_indices])
+    if np.count_nonzero(parent_probabilities) < 2:
+        raise ValueError('Fewer than two parents have a non zero selection probability')
+    first_parents = random_state.choice(num_parents, size=num_children, p=parent_probabilities)
+    second_parents = random_state.choice(num_parents, size=num_children, p=parent_probabilities)
+    same_parents = np.flatnonzero(first_parents == second_parents)
+    while len(same_parents) > 0:
+        second_parents[same_parents] = random_state.choice(num_parents, size=len(same_parents), p=parent_probabilities)
+        same_parents = same_parents[first_parents[same_parents] == second_parents[same_parents]]
+    return parent_indices[first_parents], parent_indices[second_parents]
+
+
+def crossover(weights_1, weights_2, random_state=None):
+    """
+    Cross over every pair of parents with one of the reproduction functions chosen at random for each pair.
+
+    :param weights_1: The (number of children, number of actions, number of features) weights of the first parents
+    :param weights_2: The weights of the second parents
+    """
+    random_state = get_random_state(random_state)
+    num_children, num_rows, num_columns = weights_1.shape
+    reproduction_functions = random_state.integers(NUM_REPRODUCTION_FUNCTIONS, size=num_children)
+
+    # The elements taken from the first parent for the row, column and element reproductions
+    row_masks = get_random_subset_masks(num_children, num_rows, random_state)[:, :, np.newaxis]
+    column_masks = get_random_subset_masks(num_children, num_columns, random_state)[:, np.newaxis, :]
+    mask_probabilities = random_state.random(num_children)[:, np.newaxis, np.newaxis]
+    element_masks = random_state.random(weights_1.shape) < mask_probabilities
+    reproduction_function = reproduction_functions[:, np.newaxis, np.newaxis]
+    masks = np.where(reproduction_function == ROW_REPRODUCTION, row_masks,
+                     np.where(reproduction_function == COLUMN_REPRODUCTION, column_masks, element_masks))
+    children = np.where(masks, weights_1, weights_2)
+
+    # The addition reproduction adds (or subtracts) the parents
+    addition = reproduction_functions == ADDITION_REPRODUCTION
+    coefficients = random_state.choice([1, -1], size=(2, np.sum(addition)))[:, :, np.newaxis, np.newaxis]
+    children[addition] = coefficients[0] * weights_1[addition] + coefficients[1] * weights_2[addition]
+    return children
+
+
+def mutate(weights, mutation_prob=0.3, element_mutation_prob=0.3, random_state=None):
+    """
+    Mutate every agent with the probability mutation_prob, replacing each of its weights with a new random one with
+    the probability element_mutation_prob (as in GeneticAlgorithmGame.mutate_weights).
+    """
+    random_state = get_random_state(random_state)
+    mutated_weights = np.array(weights)
+    mutated_agents = random_state.random(len(weights)) < mutation_prob
+    mask = (random_state.random(weights.shape) < element_mutation_prob) & mutated_agents[:, np.newaxis, np.newaxis]
+    mutated_weights[mask] = random_state.standard_normal(np.sum(mask))
+    return mutated_weights
+
+
+def get_next_generation_weights(population_weights, rewards, num_children, num_random_agents, mutation_prob=0.3,
+                                random_state=None):
+    """
+    :param population_weights: The (population size, number of actions, number of features) weights of the population
+    :param rewards: The total rewards of the population
+    :param num_children: The number of agents reproduced from the population
+    :param num_random_agents: The number of new random agents
+    :return: The (num_children + num_random_agents, number of actions, number of features) weights of the new agents
+    """
+    random_state = get_random_state(random_state)
+    first_parents, second_parents = select_parents(rewards, num_children, random_state=random_state)
+    children = crossover(population_weights[first_parents], population_weights[second_parents], random_state)
+    children = mutate(children, mutation_prob, random_state=random_state)
+    random_agents = random_state.standard_normal((num_random_agents,) + population_weights.shape[1:])
+    return np.concatenate([children, random_agents])
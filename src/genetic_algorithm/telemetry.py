@@ -0,0 +1,87 @@
+"""
+This file defines the telemetry of the genetic algorithm: one record per generation (where the time of the generation
+went, how many frames were simulated and how fast, the distribution of the fitness of the population and the number of
+agents alive over time) appended to a JSON lines or CSV file. The file is kept open and every record is a single write,
+so the telemetry costs almost nothing compared to a generation.
+"""
+import csv
+import json
+import os
+
+import numpy as np
+
+
+def get_fitness_distribution(rewards, prefix='reward'):
+    rewards = np.asarray(rewards, dtype=float)
+    minimum, first_quartile, median, third_quartile, maximum = np.percentile(rewards, [0, 25, 50, 75, 100])
+    return {f'{prefix}_min': minimum, f'{prefix}_p25': first_quartile, f'{prefix}_median': median,
+            f'{prefix}_p75': third_quartile, f'{prefix}_max': maximum, f'{prefix}_mean': float(rewards.mean()),
+            f'{prefix}_std': float(rewards.std())}
+
+
+def get_serializable_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+class TelemetryWriter:
+    def __init__(self, telemetry_file_path, file_format=None):
+        """
+        :param telemetry_file_path: The file the records are appended to. Records of a resumed run are appended after
+                                    the existing ones
+        :param file_format: 'jsonl' or 'csv'. By default it is taken from the extension of the file ('jsonl' unless
+                            the extension is .csv)
+        """
+        if file_format is None:
+            file_format = 'csv' if telemetry_file_path.lower().endswith('.csv') else 'jsonl'
+        assert file_format in ('jsonl', 'csv')
+        self.__telemetry_file_path = telemetry_file_path
+        self.__file_format = file_format
+        self.__telemetry_file = None
+        self.__csv_writer = None
+
+    def get_telemetry_file_path(self):
+        return self.__telemetry_file_path
+
+    def get_file_format(self):
+        return self.__file_format
+
+    def open(self):
+        telemetry_directory_path = os.path.dirname(self.__telemetry_file_path)
+        if telemetry_directory_path:
+            os.makedirs(telemetry_directory_path, exist_ok=True)
+        self.__telemetry_file = open(self.__telemetry_file_path, 'a', newline='')
+
+    def close(self):
+        if self.__telemetry_file is not None:
+            self.__telemetry_file.close()
+            self.__telemetry_file = None
+            self.__csv_writer = None
+
+    def get_csv_writer(self, record):
+        if self.__csv_writer is None:
+            # The columns are the ones of the header of the file, or of the first record written to a new file
+            field_names = list(record)
+            has_header = os.path.getsize(self.__telemetry_file_path) > 0
+            if has_header:
+                with open(self.__telemetry_file_path, 'r', newline='') as telemetry_file:
+                    field_names = next(csv.reader(telemetry_file))
+            self.__csv_writer = csv.DictWriter(self.__telemetry_file, field_names, extrasaction='ignore')
+            if not has_header:
+                self.__csv_writer.writeheader()
+        return self.__csv_writer
+
+    def write(self, record):
+        if self.__telemetry_file is None:
+            self.open()
+        record = {key: get_serializable_value(value) for key, value in record.items()}
+        if self.__file_format == 'jsonl':
+            self.__telemetry_file.write(json.dumps(record) + '\n')
+        else:
+            # The lists (e.g. the agents alive over time) are stored as JSON strings in a single column
+            self.get_csv_writer(record).writerow({key: json.dumps(value) if isinstance(value, list) else value
+                                                 for key, value in record.items()})
+        self.__telemetry_file.flush()
@@ -0,0 +1,188 @@
+"""
+This file defines the parallel actors of the tabular Q learning. Several worker processes, each one with its own
+ChromeTRexRush environment and QLearningAgent, play episodes with a single Q function held in shared memory
+(multiprocessing.shared_memory). Every worker applies its Q learning updates directly to the shared values without any
+lock (Hogwild): an update may now and then be lost to a concurrent write of another worker, which does not matter for
+the learning, and the workers never wait for each other, so the collection of experience scales with the number of
+cores. The statistics of the episodes of every worker are sent back to the parent at the end of the run.
+"""
+import multiprocessing
+import queue
+import time
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from arena.environments import ChromeTRexRush
+from arena_objects.agent import QLearningAgent
+from q_learning.q_stores import QStore, create_q_store
+from q_learning.state_encoders import StateEncoder
+from utils.random_utils import split_seed
+
+
+def run_actor(worker_index, worker_seed, q_values_memory, q_table_shape, q_values_dtype, actor_parameters,
+              result_queue):
+    """
+    Play the episodes of one worker. This is a module level function so that it can be run in a worker process.
+
+    :param q_values_memory: The SharedMemory of the Q values, shared by all the workers
+    :param q_table_shape: The (state shape + number of actions) shape of the Q values
+    :param result_queue: The queue receiving (worker index, statistics of the episodes, None) at the end, or
+                         (worker index, None, traceback) if the worker failed
+    """
+    # Imported here as the games module is the one using the Q learning modules
+    from games import QLearningGame
+    q_function = game = None
+    try:
+        environment_seed, agent_seed = split_seed(worker_seed, 2)
+        q_function = np.ndarray(q_table_shape, dtype=q_values_dtype, buffer=q_values_memory.buf)
+        environment = ChromeTRexRush(random_state=environment_seed, **actor_parameters['environment_parameters'])
+        game = QLearningGame(QLearningAgent(random_state=agent_seed), environment, q_function,
+                             max_iterations=actor_parameters['num_episodes'], gamma=actor_parameters['gamma'],
+                             alpha=actor_parameters['alpha'], max_episode_frames=actor_parameters['max_episode_frames'],
+                             max_episode_time=actor_parameters['max_episode_time'])
+
+        episode_statistics = []
+        for episode in range(actor_parameters['num_episodes']):
+            start_time = time.perf_counter()
+            environment.reset_environment()
+            game.get_agent().reset_agent()
+            game.reset_simulation_statistics()
+            game.run_iteration(False)
+            episode_statistics.append({'worker': worker_index, 'episode': episode,
+                                       'score': environment.get_current_score(),
+                                       'total_reward': game.get_agent().get_total_reward(),
+                                       'truncated': game.get_agent().is_truncated(),
+                                       'simulated_frames': game.get_simulated_frames(),
+                                       'episode_time': time.perf_counter() - start_time})
+        result = (worker_index, episode_statistics, None)
+    except Exception:
+        result = (worker_index, None, traceback.format_exc())
+    finally:
+        # The views have to be released before the shared memory is closed
+        del game, q_function
+        q_values_memory.close()
+    result_queue.put(result)
+
+
+class ParallelQLearning:
+    def __init__(self, num_workers, num_episodes, q_function=None, gamma=0.9, alpha=0.2, environment_parameters=None,
+                 max_episode_frames=None, max_episode_time=None, random_state=None):
+        """
+        :param num_workers: The number of worker processes, each one playing in its own environment
+        :param num_episodes: The number of episodes played by every worker
+        :param q_function: The initial Q values, a dense array or a q_learning.q_stores.QStore (of the state shape of
+                           the default StateEncoder and 4 actions). The learnt values are written back to it at the end
+                           of a run, so a memory mapped store only has to be flushed. A new zero QStore by default
+        :param environment_parameters: Keyword arguments of the ChromeTRexRush of every worker
+        :param max_episode_frames: The maximum number of frames of an episode (see QLearningGame)
+        :param max_episode_time: The maximum wall clock time of an episode in seconds
+        :param random_state: The seed of the run, split into one seed for every worker
+        """
+        if q_function is None:
+            q_function = create_q_store(StateEncoder().get_state_shape(),
+                                        len(QLearningAgent.get_action_name_to_action_dict()))
+        self.__num_workers = num_workers
+        self.__q_function = q_function
+        self.__actor_parameters = {'num_episodes': num_episodes, 'gamma': gamma, 'alpha': alpha,
+                                   'environment_parameters': environment_parameters or {},
+                                   'max_episode_frames': max_episode_frames, 'max_episode_time': max_episode_time}
+        self.__seed = random_state if random_state is not None else np.random.SeedSequence()
+        self.__episode_statistics = []
+        self.__run_time = 0
+
+    def get_num_workers(self):
+        return self.__num_workers
+
+    def get_q_function(self):
+        return self.__q_function
+
+    def get_episode_statistics(self):
+        # The statistics of every episode of every worker, ordered by worker and episode
+        return self.__episode_statistics
+
+    def get_run_time(self):
+        return self.__run_time
+
+    def get_worker_statistics(self):
+        # The statistics of the episodes of every worker aggregated by worker
+        worker_statistics = []
+        for worker_index in range(self.__num_workers):
+            statistics = [episode for episode in self.__episode_statistics if episode['worker'] == worker_index]
+            if not statistics:
+                continue
+            scores = [episode['score'] for episode in statistics]
+            simulated_frames = sum(episode['simulated_frames'] for episode in statistics)
+            episodes_time = sum(episode['episode_time'] for episode in statistics)
+            worker_statistics.append({'worker': worker_index, 'episodes': len(statistics),
+                                      'mean_score': float(np.mean(scores)), 'best_score': max(scores),
+                                      'simulated_frames': simulated_frames,
+                                      'frames_per_second': simulated_frames / episodes_time if episodes_time else 0})
+        return worker_statistics
+
+    def get_frames_per_second(self):
+        # The frames simulated by all the workers per second of the whole run
+        simulated_frames = sum(episode['simulated_frames'] for episode in self.__episode_statistics)
+        return simulated_frames / self.__run_time if self.__run_time else 0
+
+    @staticmethod
+    def get_results(workers, result_queue, poll_interval=1.0):
+        """
+        Wait for the results of all the workers. The results are read before joining the processes, as a process does
+        not end while its queued data is not read.
+
+        :raises RuntimeError: If a worker failed, or ended without sending its results
+        """
+        results = {}
+        while len(results) < len(workers):
+            try:
+                worker_index, episode_statistics, error = result_queue.get(timeout=poll_interval)
+            except queue.Empty:
+                for worker_index, worker in enumerate(workers):
+                    # A worker which ended without results was killed (its exceptions are sent with the results)
+                    if worker_index not in results and worker.exitcode is not None:
+                        raise RuntimeError(f'Worker {worker_index} ended with exit code {worker.exitcode} without '
+                                           f'sending its results')
+                continue
+            if error is not None:
+                raise RuntimeError(f'Worker {worker_index} failed:\n{error}')
+            results[worker_index] = episode_statistics
+        return [results[worker_index] for worker_index in range(len(workers))]
+
+    def run(self):
+        start_time = time.perf_counter()
+        q_function = self.__q_function
+        q_table = q_function.get_q_table() if isinstance(q_function, QStore) else q_function
+        q_values_memory = shared_memory.SharedMemory(create=True, size=q_table.nbytes)
+        try:
+            shared_q_table = np.ndarray(q_table.shape, dtype=q_table.dtype, buffer=q_values_memory.buf)
+            workers = []
+            try:
+                shared_q_table[:] = q_table
+                worker_seeds = split_seed(self.__seed, self.__num_workers)
+                result_queue = multiprocessing.Queue()
+                workers = [multiprocessing.Process(target=run_actor,
+                                                   args=(index, worker_seeds[index], q_values_memory, q_table.shape,
+                                                         q_table.dtype, self.__actor_parameters, result_queue))
+                           for index in range(self.__num_workers)]
+                for worker in workers:
+                    worker.start()
+                results = self.get_results(workers, result_queue)
+                for worker in workers:
+                    worker.join()
+                q_table[:] = shared_q_table
+            finally:
+                # The other workers are stopped when one of them failed
+                for worker in workers:
+                    if worker.is_alive():
+                        worker.terminate()
+                        worker.join()
+                # The view has to be released before the shared memory is closed
+                del shared_q_table
+                q_values_memory.close()
+        finally:
+            q_values_memory.unlink()
+        self.__episode_statistics = [statistics for episode_statistics in results for statistics in episode_statistics]
+        self.__run_time = time.perf_counter() - start_time
+        return q_function
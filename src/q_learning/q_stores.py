@@ -0,0 +1,118 @@
+"""
+This file defines the Q store of the tabular Q learning: the Q values in a single float32 array of (number of states,
+number of actions), which can live in a memory mapped .npy file. The file is an ordinary .npy file of the full
+(state shape + number of actions) table, so it can still be opened with np.load, and:
+
+    * a checkpoint of a memory mapped store only flushes the changed pages to the file instead of writing a new copy
+      of the table
+    * a store is loaded without copying (and without reading the pages which are never used), e.g. for an evaluation
+    * the float32 values take half the memory of the float64 tables
+
+The values are indexed either with a tuple of the indices of the state (and action), like the dense Q function, or with
+flat state ids (see q_learning.state_encoders.StateEncoder and QStore.get_state_ids).
+"""
+import os
+
+import numpy as np
+
+from utils.directory_utils import check_output_directory
+
+Q_VALUES_DTYPE = np.float32
+
+
+class QStore:
+    def __init__(self, q_table, file_path=None):
+        """
+        :param q_table: The (state shape + number of actions) array of the Q values. It is used as is (not copied), so
+                        it can be a memory mapped array
+        :param file_path: The file the array is memory mapped to, None for an array in memory
+        """
+        self.__memory_map = q_table if file_path is not None else None
+        # A plain array view of a memory mapped array, the indexing of the np.memmap subclass is much slower
+        self.__q_table = np.asarray(q_table)
+        self.__file_path = file_path
+        self.__state_shape = tuple(q_table.shape[:-1])
+        self.__num_actions = q_table.shape[-1]
+        # A flat view of the same memory, one row per state
+        self.__q_values = self.__q_table.reshape(-1, self.__num_actions)
+
+    def get_q_table(self):
+        return self.__q_table
+
+    def get_q_values(self):
+        return self.__q_values
+
+    def get_file_path(self):
+        return self.__file_path
+
+    def is_memory_mapped(self):
+        return self.__file_path is not None
+
+    def get_state_shape(self):
+        return self.__state_shape
+
+    def get_num_states(self):
+        return len(self.__q_values)
+
+    def get_num_actions(self):
+        return self.__num_actions
+
+    def get_state_ids(self, state_indices):
+        # The flat state ids of the indices of the states (a tuple with one index, or one array of indices, per
+        # dimension of the state shape)
+        return np.ravel_multi_index(state_indices, self.__state_shape)
+
+    def get_best_actions(self, state_ids):
+        return np.argmax(self.__q_values[state_ids], axis=-1)
+
+    def __getitem__(self, key):
+        # Tuples index the full table (with the indices of a state, and optionally an action), anything else the rows
+        # of the flat state ids
+        if isinstance(key, tuple):
+            return self.__q_table[key]
+        return self.__q_values[key]
+
+    def __setitem__(self, key, value):
+        if isinstance(key, tuple):
+            self.__q_table[key] = value
+        else:
+            self.__q_values[key] = value
+
+    def flush(self):
+        # Write the changed values of a memory mapped store to its file
+        if self.is_memory_mapped():
+            self.__memory_map.flush()
+
+    def save(self, file_path):
+        # A copy of the store in a new .npy file
+        np.save(file_path, self.__q_table)
+
+
+def create_q_store(state_shape, num_actions, file_path=None):
+    """
+    :param state_shape: The number of values of every feature of the state (see StateEncoder.get_state_shape)
+    :param file_path: If given, the (zero) Q values are memory mapped to this .npy file, which is overwritten
+    """
+    shape = tuple(state_shape) + (num_actions,)
+    if file_path is None:
+        return QStore(np.zeros(shape, dtype=Q_VALUES_DTYPE))
+    check_output_directory(os.path.dirname(file_path) or '.')
+    return QStore(np.lib.format.open_memmap(file_path, mode='w+', dtype=Q_VALUES_DTYPE, shape=shape), file_path)
+
+
+def load_q_store(file_path, writable=False):
+    """
+    Load a store (or any Q function saved with np.save) without copying it: the values are memory mapped and only read
+    from the file when they are used.
+
+    :param writable: If True, the changes to the values are written back to the file (on flush). Otherwise the values
+                     are read only, e.g. for an evaluation
+    """
+    return QStore(np.load(file_path, mmap_mode='r+' if writable else 'r'), file_path)
+
+
+def get_flat_q_values(q_function):
+    # The (number of states, number of actions) view of the values of a QStore or of a dense Q function
+    if isinstance(q_function, QStore):
+        return q_function.get_q_values()
+    return q_function.reshape(-1, q_function.shape[-1])
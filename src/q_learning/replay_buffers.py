@@ -0,0 +1,94 @@
+"""
+This file defines the experience replay of the tabular Q learning. The transitions (state, action, reward, next state,
+done) are stored in a fixed capacity ring buffer of typed numpy arrays, the states as flat state ids (see
+q_learning.state_encoders.StateEncoder), and the oldest transitions are overwritten once the buffer is full. A learner
+samples minibatches of transitions and applies all their updates at once (see apply_td_updates), so a transition is
+reused many times without simulating it again.
+"""
+import numpy as np
+
+from utils.random_utils import get_random_state
+
+
+def apply_td_updates(q_values, state_ids, actions, rewards, next_state_ids, dones, alpha, gamma):
+    """
+    Apply the Q learning updates of a batch of transitions with a few array operations. All the TD errors are computed
+    from the values before the batch, and the errors of the transitions of the same (state, action) are averaged, so
+    every value moves by at most one update (of alpha times the mean error) whatever the number of its transitions.
+
+    :param q_values: The (number of states, number of actions) Q values, updated in place
+    :param dones: Whether the transitions ended the episode (a crash), in which case nothing is bootstrapped
+    :return: The TD errors of the transitions
+    """
+    num_actions = q_values.shape[1]
+    next_state_values = np.where(dones, 0, q_values[next_state_ids].max(axis=1))
+    td_errors = rewards + gamma * next_state_values - q_values[state_ids, actions]
+    # The mean TD error of every distinct (state, action) of the batch
+    unique_indices, inverse_indices = np.unique(state_ids * num_actions + actions, return_inverse=True)
+    error_sums = np.bincount(inverse_indices, weights=td_errors, minlength=len(unique_indices))
+    counts = np.bincount(inverse_indices, minlength=len(unique_indices))
+    q_values[unique_indices // num_actions, unique_indices % num_actions] += alpha * error_sums / counts
+    return td_errors
+
+
+class ReplayBuffer:
+    def __init__(self, capacity, random_state=None):
+        """
+        :param capacity: The maximum number of transitions, the oldest transitions are overwritten after that
+        :param random_state: The seed (or numpy random generator) of the sampling of the minibatches
+        """
+        self.__capacity = capacity
+        self.__state_ids = np.zeros(capacity, dtype=np.int64)
+        self.__actions = np.zeros(capacity, dtype=np.int8)
+        self.__rewards = np.zeros(capacity, dtype=np.float32)
+        self.__next_state_ids = np.zeros(capacity, dtype=np.int64)
+        self.__dones = np.zeros(capacity, dtype=bool)
+        # The index of the next transition and the number of transitions stored
+        self.__position = 0
+        self.__size = 0
+        self.__random_state = get_random_state(random_state)
+
+    def get_capacity(self):
+        return self.__capacity
+
+    def get_size(self):
+        return self.__size
+
+    def get_random_state(self):
+        return self.__random_state
+
+    def add(self, state_id, action, reward, next_state_id, done):
+        position = self.__position
+        self.__state_ids[position] = state_id
+        self.__actions[position] = action
+        self.__rewards[position] = reward
+        self.__next_state_ids[position] = next_state_id
+        self.__dones[position] = done
+        self.__position = (position + 1) % self.__capacity
+        self.__size = min(self.__size + 1, self.__capacity)
+
+    def add_batch(self, state_ids, actions, rewards, next_state_ids, dones):
+        # Add a batch of transitions (one array per field). Only the last capacity transitions are kept when the batch
+        # is larger than the buffer
+        num_transitions = len(state_ids)
+        positions = (self.__position + np.arange(num_transitions)) % self.__capacity
+        if num_transitions > self.__capacity:
+            positions, transitions = positions[-self.__capacity:], slice(-self.__capacity, None)
+        else:
+            transitions = slice(None)
+        self.__state_ids[positions] = np.asarray(state_ids)[transitions]
+        self.__actions[positions] = np.asarray(actions)[transitions]
+        self.__rewards[positions] = np.asarray(rewards)[transitions]
+        self.__next_state_ids[positions] = np.asarray(next_state_ids)[transitions]
+        self.__dones[positions] = np.asarray(dones)[transitions]
+        self.__position = (self.__position + num_transitions) % self.__capacity
+        self.__size = min(self.__size + num_transitions, self.__capacity)
+
+    def get_transitions(self, indices):
+        # The (state ids, actions, rewards, next state ids, dones) arrays of the transitions at the given indices
+        return self.__state_ids[indices], self.__actions[indices], self.__rewards[indices], \
+               self.__next_state_ids[indices], self.__dones[indices]
+
+    def sample(self, batch_size):
+        # A minibatch of transitions drawn uniformly (with replacement) from the buffer
+        return self.get_transitions(self.__random_state.integers(self.__size, size=batch_size))
@@ -0,0 +1,156 @@
+"""
+This file defines the table driven state encoder of the tabular Q learning. Every feature of the state is discretized by
+looking up its value in an array of bin edges (np.digitize), and the discretized features are combined into one flat
+integer state id. It defines the states of QLearningGame.get_environment_state, and with the default bin edges the
+states are:
+
+    * the speed of the agent (low, medium, high)
+    * the state of the agent (walking, jumping, ducking)
+    * the distance from the end of the agent to the closest obstacle (near, in sight, far), separately for cacti and
+      birds, plus one value for no obstacle in sight
+    * the gap between the two closest obstacles (small, large), plus one value for a single obstacle
+    * the width of the closest obstacle (small, medium, large)
+    * the y position of the closest obstacle (ground, low, medium, high)
+
+A single environment is encoded with bisect on the same bin edges, which is faster than numpy for scalars, and a batch
+of environments (e.g. a VectorChromeTRexRush) is encoded with one call.
+"""
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from arena.vector_environments import DUCKING, EMPTY_SLOT, JUMPING, WALKING
+from arena_objects.obstacles import BIRD_ID
+
+SPEED_BINS = (8, 14)
+DISTANCE_BINS = (100, 200)
+GAP_BINS = (200,)
+WIDTH_BINS = (50, 100)
+Y_BINS = (10, 90, 200)
+NUM_AGENT_STATES = 3
+
+
+class StateEncoder:
+    def __init__(self, speed_bins=SPEED_BINS, distance_bins=DISTANCE_BINS, gap_bins=GAP_BINS, width_bins=WIDTH_BINS,
+                 y_bins=Y_BINS):
+        """
+        The bins of every feature are given by their increasing inner edges, a feature with n edges has n + 1 values.
+        A value equal to an edge belongs to the upper bin, except for the width, where it belongs to the lower bin.
+        """
+        self.__speed_bins = np.array(speed_bins, dtype=float)
+        self.__distance_bins = np.array(distance_bins, dtype=float)
+        self.__gap_bins = np.array(gap_bins, dtype=float)
+        self.__width_bins = np.array(width_bins, dtype=float)
+        self.__y_bins = np.array(y_bins, dtype=float)
+        # Python lists of the same edges for the encoding of a single environment
+        self.__bin_lists = [list(bins) for bins in (speed_bins, distance_bins, gap_bins, width_bins, y_bins)]
+
+        num_distances = len(distance_bins) + 1
+        self.__num_distances = num_distances
+        # The values of the distance: the cactus distances, then the bird distances and last not in sight
+        self.__not_in_sight = 2 * num_distances
+        # The values of the gap: the gaps, then a single obstacle in the environment
+        self.__single_obstacle = len(gap_bins) + 1
+        self.__state_shape = (len(speed_bins) + 1, NUM_AGENT_STATES, 2 * num_distances + 1, len(gap_bins) + 2,
+                              len(width_bins) + 1, len(y_bins) + 1)
+        self.__strides = tuple(int(np.prod(self.__state_shape[index + 1:])) for index in range(len(self.__state_shape)))
+
+    def get_state_shape(self):
+        # The number of values of every feature of the state
+        return self.__state_shape
+
+    def get_num_states(self):
+        return int(np.prod(self.__state_shape))
+
+    def get_state_id(self, state_indices):
+        # The flat state id of the indices of the features (the same as np.ravel_multi_index)
+        return sum(index * stride for index, stride in zip(state_indices, self.__strides))
+
+    def get_state_indices(self, state_ids):
+        return np.unravel_index(state_ids, self.__state_shape)
+
+    def encode(self, agent_speeds, agent_states, agent_end_x, closest_types, closest_x, closest_widths, closest_y,
+               second_closest_x):
+        """
+        Encode a batch of environments. All the arguments are arrays with one value per environment.
+
+        :param agent_states: The states of the agents (WALKING, JUMPING or DUCKING)
+        :param agent_end_x: The x coordinates of the right edges of the agents
+        :param closest_types: The types of the closest obstacles (CACTUS_ID or BIRD_ID, EMPTY_SLOT without obstacle)
+        :param second_closest_x: The x coordinates of the second closest obstacles (nan without a second obstacle)
+        :return: The flat state ids of the environments
+        """
+        closest_types = np.asarray(closest_types)
+        has_obstacle = closest_types != EMPTY_SLOT
+        distances = np.digitize(np.asarray(closest_x) - agent_end_x, self.__distance_bins)
+        distances = np.where(closest_types == BIRD_ID, distances + self.__num_distances, distances)
+        distances = np.where(has_obstacle, distances, self.__not_in_sight)
+
+        second_closest_x = np.asarray(second_closest_x)
+        gaps = np.digitize(second_closest_x - (np.asarray(closest_x) + closest_widths), self.__gap_bins)
+        gaps = np.where(has_obstacle & ~np.isnan(second_closest_x), gaps, self.__single_obstacle)
+
+        widths = np.where(has_obstacle, np.digitize(closest_widths, self.__width_bins, right=True), 0)
+        y_positions = np.where(has_obstacle, np.digitize(closest_y, self.__y_bins), 0)
+        return np.ravel_multi_index((np.digitize(agent_speeds, self.__speed_bins), np.asarray(agent_states),
+                                     distances, gaps, widths, y_positions), self.__state_shape)
+
+    def get_environment_state_indices(self, environment, agent):
+        """
+        :param environment: A ChromeTRexRush environment
+        :param agent: The agent playing in the environment
+        :return: The indices of the features of the state (one index per dimension of the state shape)
+        """
+        speed_bins, distance_bins, gap_bins, width_bins, y_bins = self.__bin_lists
+        agent_speed = bisect_right(speed_bins, agent.get_x_vel())
+        if agent.is_walking():
+            agent_state = WALKING
+        elif agent.is_jumping():
+            agent_state = JUMPING
+        else:
+            agent_state = DUCKING
+
+        # The obstacles of the environment are ordered by their distance to the agent
+        obstacles = environment.get_obstacles_by_distance()
+        if not obstacles:
+            return agent_speed, agent_state, self.__not_in_sight, self.__single_obstacle, 0, 0
+        closest_obstacle = obstacles[0]
+        closest_x, closest_width = closest_obstacle.get_x_pos(), closest_obstacle.get_width()
+        distance = bisect_right(distance_bins, closest_x - (agent.get_x_pos() + agent.get_width()))
+        if closest_obstacle.get_id() == BIRD_ID:
+            distance += self.__num_distances
+        gap = self.__single_obstacle
+        if len(obstacles) > 1:
+            gap = bisect_right(gap_bins, obstacles[1].get_x_pos() - (closest_x + closest_width))
+        return agent_speed, agent_state, distance, gap, bisect_left(width_bins, closest_width), \
+            bisect_right(y_bins, closest_obstacle.get_y_pos())
+
+    def encode_environment(self, environment, agent):
+        # The flat state id of a single ChromeTRexRush environment
+        return self.get_state_id(self.get_environment_state_indices(environment, agent))
+
+    def encode_vector_environment(self, vector_environment):
+        """
+        :param vector_environment: A VectorChromeTRexRush
+        :return: The flat state ids of all its environments
+        """
+        obstacle_x, obstacle_y, obstacle_width, _, obstacle_type = vector_environment.get_obstacles()
+        rows = np.arange(vector_environment.get_num_environments())
+        x = np.where(obstacle_type != EMPTY_SLOT, obstacle_x, np.inf)
+        # The two obstacles with the smallest x of every environment, the closest one first
+        if x.shape[1] > 1:
+            closest_slots = np.argpartition(x, 1, axis=1)[:, :2]
+            swap = x[rows, closest_slots[:, 0]] > x[rows, closest_slots[:, 1]]
+            closest_slots[swap] = closest_slots[swap][:, ::-1]
+            second_closest_x = x[rows, closest_slots[:, 1]]
+            second_closest_x = np.where(np.isfinite(second_closest_x), second_closest_x, np.nan)
+        else:
+            closest_slots = np.zeros((len(rows), 1), dtype=np.int64)
+            second_closest_x = np.full(len(rows), np.nan)
+        closest_slots = closest_slots[:, 0]
+        # The agents are always at x = 0, so their right edges are at their widths
+        agent_widths, _ = vector_environment.get_agent_dimensions()
+        return self.encode(vector_environment.get_agent_x_velocities(), vector_environment.get_agent_states(),
+                           agent_widths, obstacle_type[rows, closest_slots], obstacle_x[rows, closest_slots],
+                           obstacle_width[rows, closest_slots], obstacle_y[rows, closest_slots], second_closest_x)
+
@@ -0,0 +1,145 @@
+"""
+This file defines the vectorized tabular Q learning: many environments of a VectorChromeTRexRush played in lockstep by
+a single process, with one Q function. Every frame:
+
+    * the states of all the environments are encoded at once (see q_learning.state_encoders.StateEncoder)
+    * the epsilon greedy actions of all the environments are selected with a single fancy indexed argmax
+    * all the TD updates are applied in one batched operation, which averages the updates of the environments in the
+      same (state, action) (see q_learning.replay_buffers.apply_td_updates)
+
+The states and rewards are the ones of QLearningGame: the rewards of the VectorChromeTRexRush are the action and crash
+rewards of the QLearningAgent (Agent.get_current_action_reward), and only a crash ends an episode without bootstrapping.
+The environments also update their statistics (add an obstacle, increase the score and level) at the interval of a
+headless QLearningGame episode by default, rather than at the one of the genetic algorithm, so that the Q function is
+learnt on the same game as the one it is played on. The other parameters of the environments (e.g. bird_add_threshold)
+have the defaults of ChromeTRexRush, and should be given the values of the environment of the QLearningGame when they
+differ (the main of the games module uses bird_add_threshold=-1).
+An environment is reset as soon as its episode ends, so all the environments are always playing.
+"""
+import time
+
+import numpy as np
+
+from arena.vector_environments import VectorChromeTRexRush
+from arena_objects.agent import QLearningAgent
+from games import QLearningGame
+from q_learning.q_stores import create_q_store, get_flat_q_values
+from q_learning.replay_buffers import apply_td_updates
+from q_learning.state_encoders import StateEncoder
+from utils.random_utils import get_random_state, split_seed
+
+
+class VectorQLearning:
+    def __init__(self, num_environments, q_function=None, gamma=0.9, alpha=0.2, epsilon=0.01, state_encoder=None,
+                 environment_parameters=None, max_episode_frames=None, random_state=None):
+        """
+        :param num_environments: The number of environments played in lockstep
+        :param q_function: The Q values, a dense array or a q_learning.q_stores.QStore of the state shape of the state
+                           encoder and the number of actions, updated in place. A new zero QStore by default
+        :param epsilon: The probability of a random action (the same as the QLearningAgent by default)
+        :param environment_parameters: Keyword arguments of the VectorChromeTRexRush. The obstacle_add_interval is the
+                                       statistics update interval of a headless QLearningGame unless it is given
+        :param max_episode_frames: The maximum number of frames of an episode. An episode stopped by the limit is
+                                   truncated, its last transition is still bootstrapped
+        :param random_state: The seed of the run, split into the seeds of the environments and of the actions
+        """
+        environment_seed, actions_seed = split_seed(random_state, 2)
+        agent = QLearningAgent()
+        self.__state_encoder = state_encoder if state_encoder is not None else StateEncoder()
+        if q_function is None:
+            q_function = create_q_store(self.__state_encoder.get_state_shape(),
+                                        len(agent.get_action_name_to_action_dict()))
+        self.__q_function = q_function
+        self.__q_values = get_flat_q_values(q_function)
+        environment_parameters = {'obstacle_add_interval': QLearningGame.get_statistics_update_interval(),
+                                  **(environment_parameters or {})}
+        self.__environment = VectorChromeTRexRush(agent, num_environments, random_state=environment_seed,
+                                                  **environment_parameters)
+        self.__gamma = gamma
+        self.__alpha = alpha
+        self.__epsilon = epsilon
+        self.__max_episode_frames = max_episode_frames
+        self.__random_state = get_random_state(actions_seed)
+        self.__state_ids = self.__state_encoder.encode_vector_environment(self.__environment)
+        self.__episode_statistics = []
+        self.__simulated_frames = 0
+        self.__run_time = 0
+
+    def get_environment(self):
+        return self.__environment
+
+    def get_state_encoder(self):
+        return self.__state_encoder
+
+    def get_q_function(self):
+        return self.__q_function
+
+    def get_episode_statistics(self):
+        # The statistics of every finished episode, in the order they finished
+        return self.__episode_statistics
+
+    def get_simulated_frames(self):
+        # The number of frames simulated in all the environments together (the number of transitions learnt)
+        return self.__simulated_frames
+
+    def get_frames_per_second(self):
+        return self.__simulated_frames / self.__run_time if self.__run_time else 0
+
+    def get_actions(self, state_ids):
+        # The epsilon greedy actions of all the environments
+        q_values = self.__q_values[state_ids]
+        best_actions = np.argmax(q_values, axis=1)
+        random_actions = self.__random_state.integers(q_values.shape[1], size=len(state_ids))
+        return np.where(self.__random_state.random(len(state_ids)) < self.__epsilon, random_actions, best_actions)
+
+    def step(self):
+        """
+        Play one frame in all the environments, learn from all their transitions and reset the environments whose
+        episode ended.
+
+        :return: The number of episodes which ended
+        """
+        environment = self.__environment
+        state_ids = self.__state_ids
+        actions = self.get_actions(state_ids)
+        _, rewards, crashed = environment.step(actions)
+        next_state_ids = self.__state_encoder.encode_vector_environment(environment)
+        apply_td_updates(self.__q_values, state_ids, actions, rewards, next_state_ids, crashed, self.__alpha,
+                         self.__gamma)
+        self.__simulated_frames += len(state_ids)
+
+        ended = crashed
+        if self.__max_episode_frames is not None:
+            ended = crashed | (environment.get_frame_counters() >= self.__max_episode_frames)
+        ended_indices = np.flatnonzero(ended)
+        if len(ended_indices):
+            scores, total_rewards = environment.get_current_scores(), environment.get_total_rewards()
+            frame_counters = environment.get_frame_counters()
+            for index in ended_indices:
+                self.__episode_statistics.append({'environment': int(index), 'score': int(scores[index]),
+                                                  'total_reward': float(total_rewards[index]),
+                                                  'truncated': not crashed[index],
+                                                  'simulated_frames': int(frame_counters[index])})
+            environment.reset(ended_indices)
+            next_state_ids = self.__state_encoder.encode_vector_environment(environment)
+        self.__state_ids = next_state_ids
+        return len(ended_indices)
+
+    def train(self, num_episodes, verbose=True):
+        """
+        :param num_episodes: The number of episodes to finish (over all the environments)
+        :return: The Q function
+        """
+        start_time = time.perf_counter()
+        num_ended_episodes = 0
+        num_printed_episodes = 0
+        num_environments = self.__environment.get_num_environments()
+        while num_ended_episodes < num_episodes:
+            num_ended_episodes += self.step()
+            if verbose and num_ended_episodes - num_printed_episodes >= num_environments:
+                num_printed_episodes = num_ended_episodes
+                recent_scores = [episode['score'] for episode in self.__episode_statistics[-num_environments:]]
+                print(f'Episodes: {len(self.__episode_statistics)}', f'Mean score: {np.mean(recent_scores):.2f}',
+                      f'Simulated frames: {self.__simulated_frames}')
+        self.__run_time += time.perf_counter() - start_time
+        return self.__q_function
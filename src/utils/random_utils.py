@@ -0,0 +1,33 @@
+import numpy as np
+
+
+def get_random_state(seed=None):
+    """
+    Get a numpy random generator. Every environment, agent and optimizer owns its own generator so that runs can be
+    reproduced from seeds, even when they are spread over multiple processes.
+
+    :param seed: None (fresh entropy), an int, a numpy SeedSequence or an already constructed numpy Generator (which
+                 is returned as it is)
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+
+def split_seed(seed, num_streams):
+    """
+    Split a root seed into independent child seeds, one for every worker (or environment, agent, ...). The children of
+    the same root seed are always the same, so a single root seed reproduces a whole multi-process run. The children
+    are SeedSequence objects, which can be sent to other processes and split again.
+
+    :param seed: None (fresh entropy), an int, a numpy SeedSequence or a numpy Generator (the entropy of the children is
+                 drawn from it, so the generator advances)
+    """
+    if isinstance(seed, np.random.Generator):
+        seed = seed.integers(2 ** 63, size=4).tolist()
+    seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return seed_sequence.spawn(num_streams)
+
+
+def split_random_state(seed, num_streams):
+    return [get_random_state(child_seed) for child_seed in split_seed(seed, num_streams)]
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules of the repository are imported from the src directory (and the arena objects from their own directory)
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path[:0] = [SOURCE_DIRECTORY, os.path.join(SOURCE_DIRECTORY, 'arena_objects')]
@@ -0,0 +1,35 @@
+import numpy as np
+
+from arena.environments import ChromeTRexRush
+from arena_objects.agent import GeneticAlgorithmAgent
+from games import GeneticAlgorithmGame
+from utils.random_utils import get_random_state, split_seed
+
+
+def play_game(num_iterations, checkpoint_file_path, weights_directory_path):
+    environment_seed, agents_seed, game_seed = split_seed(42, 3)
+    agents_random_state = get_random_state(agents_seed)
+    agents = [GeneticAlgorithmAgent(agents_random_state.standard_normal((4, 7))) for _ in range(12)]
+    game = GeneticAlgorithmGame(agents, num_iterations, ChromeTRexRush(high_score_file_path='',
+                                                                       random_state=environment_seed),
+                                num_best_agents=4, random_state=game_seed)
+    game.play_game(weights_parent_directory=str(weights_directory_path),
+                   checkpoint_file_path=str(checkpoint_file_path))
+    return game
+
+
+def test_resumed_run_reproduces_straight_run(tmp_path, capsys):
+    straight_game = play_game(4, tmp_path / 'straight.npz', tmp_path / 'straight')
+    straight_output = capsys.readouterr().out
+    play_game(2, tmp_path / 'resumed.npz', tmp_path / 'resumed')
+    resumed_game = play_game(4, tmp_path / 'resumed.npz', tmp_path / 'resumed')
+    resumed_output = capsys.readouterr().out
+
+    def get_scores(output):
+        return [line for line in output.splitlines() if line.startswith('Score')]
+    assert len(get_scores(straight_output)) == 4
+    assert get_scores(resumed_output) == get_scores(straight_output)
+    assert [agent_reward for agent_reward, _ in resumed_game.get_best_agents()] == \
+           [agent_reward for agent_reward, _ in straight_game.get_best_agents()]
+    for straight_agent, resumed_agent in zip(straight_game.get_agents(), resumed_game.get_agents()):
+        np.testing.assert_array_equal(resumed_agent.get_weights(), straight_agent.get_weights())
@@ -0,0 +1,47 @@
+import numpy as np
+
+from arena.collisions import get_agents_x_interval, get_crash_mask
+from arena.obstacle_store import ObstacleStore
+from arena_objects.obstacles import CACTUS_ID, OBSTACLE_VELOCITY
+
+
+def get_brute_force_crash_mask(agent_boxes, obstacle_boxes):
+    return np.array([any(agent_x_min <= obstacle_x_max and obstacle_x_min <= agent_x_max and
+                         agent_y_min <= obstacle_y_max and obstacle_y_min <= agent_y_max
+                         for obstacle_x_min, obstacle_y_min, obstacle_x_max, obstacle_y_max in obstacle_boxes)
+                     for agent_x_min, agent_y_min, agent_x_max, agent_y_max in agent_boxes], dtype=bool)
+
+
+def get_boxes(x, y, width, height):
+    return np.stack([x, y, x + width, y + height], axis=1)
+
+
+def test_crash_mask_matches_brute_force():
+    random_state = np.random.default_rng(0)
+    for _ in range(50):
+        num_agents, num_obstacles = random_state.integers(1, 20), random_state.integers(0, 20)
+        # Integer coordinates, so that many boxes only touch each other
+        agent_boxes = get_boxes(random_state.integers(0, 5, num_agents), random_state.integers(0, 60, num_agents),
+                                random_state.integers(1, 60, num_agents), random_state.integers(1, 60, num_agents))
+        obstacle_boxes = get_boxes(random_state.integers(-50, 100, num_obstacles),
+                                   random_state.integers(0, 100, num_obstacles),
+                                   random_state.integers(1, 60, num_obstacles),
+                                   random_state.integers(1, 60, num_obstacles))
+        np.testing.assert_array_equal(get_crash_mask(agent_boxes, obstacle_boxes),
+                                      get_brute_force_crash_mask(agent_boxes, obstacle_boxes))
+
+
+def test_broad_phase_matches_brute_force():
+    # The broad phase of the obstacle store (over both segments of a wrapped ring) keeps every obstacle the agents hit
+    random_state = np.random.default_rng(1)
+    obstacle_store = ObstacleStore(initial_capacity=8)
+    for _ in range(200):
+        if len(obstacle_store) < 8 and random_state.random() < 0.3:
+            obstacle_store.add(CACTUS_ID, (800, 0), OBSTACLE_VELOCITY, (0.0, 0.0),
+                               tuple(random_state.integers(10, 80, 2)))
+        obstacle_store.update(random_state.uniform(5, 15))
+        obstacle_store.remove_out_of_environment_obstacles()
+        agent_boxes = get_boxes(np.zeros(5), random_state.uniform(0, 80, 5), np.full(5, 44.0), np.full(5, 47.0))
+        obstacle_boxes = obstacle_store.get_bounding_boxes_in_x_range(*get_agents_x_interval(agent_boxes))
+        np.testing.assert_array_equal(get_crash_mask(agent_boxes, obstacle_boxes),
+                                      get_brute_force_crash_mask(agent_boxes, obstacle_store.get_bounding_boxes()))
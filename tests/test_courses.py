@@ -0,0 +1,29 @@
+import numpy as np
+
+from arena.courses import COURSE_DTYPE, CourseGenerator, CourseTape
+from arena.environments import ChromeTRexRush
+from arena_objects.agent import GeneticAlgorithmAgent
+from arena_objects.obstacles import BIRD_DIMENSION, BIRD_ID
+from games import GeneticAlgorithmGame
+
+
+def test_course_tape_replays_the_course():
+    course = CourseGenerator(random_state=0).generate_course(2000)
+    course_tape = CourseTape(course)
+    due_obstacles = [course_tape.get_due_obstacles(frame) for frame in range(2001)]
+    assert course_tape.has_ended()
+    np.testing.assert_array_equal(np.concatenate(due_obstacles), course)
+    assert all(np.all(obstacles['frame'] == frame) for frame, obstacles in enumerate(due_obstacles))
+
+
+def test_exhausted_course_truncates_the_episode():
+    # A single bird flying above the agent, which never jumps (all its actions are equally good, so it does nothing)
+    course = np.array([(1, BIRD_ID, BIRD_DIMENSION[0], BIRD_DIMENSION[1], 300)], dtype=COURSE_DTYPE)
+    environment = ChromeTRexRush(high_score_file_path='', course=course)
+    agent = GeneticAlgorithmAgent(np.zeros((4, 7)))
+    game = GeneticAlgorithmGame([agent], 1, environment)
+    num_frames = game.run_headless_iteration()
+    assert environment.is_course_exhausted()
+    assert agent.is_truncated() and not agent.has_crashed()
+    # The episode ends once the bird has left the environment
+    assert num_frames < 2 * environment.get_environment_width() / agent.get_x_vel()
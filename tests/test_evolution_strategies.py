@@ -0,0 +1,19 @@
+import numpy as np
+
+from genetic_algorithm.evolution_strategies import EvolutionStrategiesTrainer, get_centered_ranks
+
+
+def test_centered_ranks():
+    np.testing.assert_allclose(get_centered_ranks(np.array([3.0, -1.0, 10.0, 0.0, 2.0])), [0.25, -0.5, 0.5, -0.25, 0])
+
+
+def test_gradient_ascends_a_linear_reward():
+    # The rewards of the perturbations increase along a direction, so the estimated gradient points along it
+    trainer = EvolutionStrategiesTrainer(num_perturbations=200, sigma=0.1, random_state=0)
+    direction = np.random.default_rng(1).standard_normal((4, 7))
+    perturbations = trainer.get_perturbations()
+    assert len(perturbations) == 200
+    np.testing.assert_array_equal(perturbations[100:], -perturbations[:100])
+    gradient = trainer.get_gradient(perturbations, np.einsum('paf,af->p', perturbations, direction))
+    cosine = np.sum(gradient * direction) / (np.linalg.norm(gradient) * np.linalg.norm(direction))
+    assert cosine > 0.8
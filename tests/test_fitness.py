@@ -0,0 +1,59 @@
+import numpy as np
+
+from genetic_algorithm.fitness import CachedFitnessEvaluator, SuccessiveHalvingEvaluator
+
+
+class ScriptedEvaluator:
+    # Gives the rewards of a table (one row per call, one column per agent), the agent being the first weight
+    def __init__(self, rewards):
+        self.__rewards = rewards
+        self.__num_calls = 0
+
+    def evaluate(self, population_weights, environment_parameters, course_seed, pace_weights=None):
+        agents = population_weights[:, 0, 0].astype(int)
+        rewards = np.array(self.__rewards[self.__num_calls], dtype=float)[agents]
+        self.__num_calls += 1
+        return rewards, 0, 0, np.zeros(len(agents), dtype=bool)
+
+
+def test_eliminated_agents_rank_below_survivors():
+    # Agent 0 is eliminated after a good first course, while the survivors do badly on the second one, so its partial
+    # mean (1) is higher than the means of the survivors (-2.5 and -2)
+    population_weights = np.arange(4, dtype=float)[:, np.newaxis, np.newaxis] * np.ones((4, 4, 7))
+    evaluator = SuccessiveHalvingEvaluator(ScriptedEvaluator([[1, 5, 4, 0], [0, -10, -8, 0]]), num_rounds=2,
+                                           courses_per_round=1, elimination_fraction=0.5, min_survivors=2)
+    fitness, _, _, _ = evaluator.evaluate(population_weights, {}, 0)
+    assert list(evaluator.get_num_episodes()) == [1, 2, 2, 1]
+    assert list(np.argsort(-fitness)) == [2, 1, 0, 3]
+    np.testing.assert_allclose(fitness[[1, 2]], [-2.5, -2])
+
+
+class TimeLimitedEvaluator:
+    # Every agent gets its first weight as reward, and the agents with a negative first weight are truncated by the
+    # time limit
+    def __init__(self):
+        self.__num_evaluated_agents = 0
+
+    def get_num_evaluated_agents(self):
+        return self.__num_evaluated_agents
+
+    @staticmethod
+    def get_episode_limits():
+        return {'max_episode_frames': None, 'max_episode_time': 1.0}
+
+    def evaluate(self, population_weights, environment_parameters, course_seed, pace_weights=None):
+        self.__num_evaluated_agents += len(population_weights)
+        rewards = population_weights[:, 0, 0]
+        return rewards, 0, 0, rewards < 0
+
+
+def test_time_truncated_rewards_are_not_cached():
+    population_weights = np.array([-1, 1, 2], dtype=float)[:, np.newaxis, np.newaxis] * np.ones((3, 4, 7))
+    fitness_evaluator = TimeLimitedEvaluator()
+    evaluator = CachedFitnessEvaluator(fitness_evaluator)
+    for _ in range(2):
+        rewards, _, _, truncated = evaluator.evaluate(population_weights, {}, 0)
+        np.testing.assert_array_equal(rewards, [-1, 1, 2])
+        np.testing.assert_array_equal(truncated, [True, False, False])
+    # Only the truncated agent is simulated again
+    assert fitness_evaluator.get_num_evaluated_agents() == 4
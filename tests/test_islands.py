@@ -0,0 +1,16 @@
+import pytest
+
+from genetic_algorithm.islands import IslandModel
+
+
+def test_failed_island_raises():
+    # The agents cannot play with weights of the wrong shape, so both islands fail (their neighbour would otherwise
+    # wait for their migrants forever)
+    island_model = IslandModel(2, 10, 3, migration_interval=1, weights_shape=(3, 3), random_state=0)
+    with pytest.raises(RuntimeError, match='Island . failed'):
+        island_model.run()
+
+
+def test_invalid_topology():
+    with pytest.raises(ValueError):
+        IslandModel(2, 10, 3, topology='star')
@@ -0,0 +1,13 @@
+import numpy as np
+
+from utils.random_utils import split_seed
+
+
+def test_split_generator_seed():
+    # A generator is split like the other seeds, into children reproduced by a generator of the same seed
+    children = split_seed(np.random.default_rng(3), 2)
+    same_children = split_seed(np.random.default_rng(3), 2)
+    assert all(isinstance(child, np.random.SeedSequence) for child in children)
+    assert [child.generate_state(2).tolist() for child in children] == \
+           [child.generate_state(2).tolist() for child in same_children]
+    assert children[0].generate_state(2).tolist() != children[1].generate_state(2).tolist()
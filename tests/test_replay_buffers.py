@@ -0,0 +1,45 @@
+import numpy as np
+
+from q_learning.replay_buffers import ReplayBuffer, apply_td_updates
+
+
+def test_td_updates_of_distinct_transitions():
+    # Without duplicates, the batch is the same as the updates of the transitions one by one from the same values
+    random_state = np.random.default_rng(0)
+    q_values = random_state.random((50, 4))
+    state_ids, actions = random_state.permutation(50)[:20], random_state.integers(0, 4, 20)
+    rewards, next_state_ids = random_state.random(20), random_state.integers(0, 50, 20)
+    dones = random_state.random(20) < 0.3
+    expected_q_values = q_values.copy()
+    for state_id, action, reward, next_state_id, done in zip(state_ids, actions, rewards, next_state_ids, dones):
+        next_state_value = 0 if done else q_values[next_state_id].max()
+        expected_q_values[state_id, action] += 0.2 * (reward + 0.9 * next_state_value - q_values[state_id, action])
+    apply_td_updates(q_values, state_ids, actions, rewards, next_state_ids, dones, 0.2, 0.9)
+    np.testing.assert_allclose(q_values, expected_q_values)
+
+
+def test_td_updates_of_duplicate_transitions_are_averaged():
+    q_values = np.arange(8, dtype=float).reshape(2, 4)
+    initial_q_values = q_values.copy()
+    td_errors = apply_td_updates(q_values, np.array([1, 1, 1]), np.array([1, 1, 2]), np.array([1.0, 3.0, 0.0]),
+                                 np.array([0, 0, 0]), np.array([True, True, True]), 0.5, 0.9)
+    np.testing.assert_allclose(td_errors, [1 - 5, 3 - 5, -6])
+    # The two transitions of (1, 1) move the value once, by the mean of their errors
+    assert q_values[1, 1] == initial_q_values[1, 1] + 0.5 * -3
+    assert q_values[1, 2] == initial_q_values[1, 2] + 0.5 * -6
+    q_values[1, 1:3] = initial_q_values[1, 1:3]
+    np.testing.assert_array_equal(q_values, initial_q_values)
+
+
+def test_ring_buffer_keeps_the_last_transitions():
+    replay_buffer = ReplayBuffer(5, random_state=0)
+    replay_buffer.add_batch(np.arange(3), np.arange(3), np.arange(3), np.arange(3), np.zeros(3, dtype=bool))
+    replay_buffer.add(3, 3, 3, 3, True)
+    assert replay_buffer.get_size() == 4
+    # A batch larger than the buffer only keeps its last transitions
+    replay_buffer.add_batch(np.arange(10, 17), np.arange(7) % 4, np.arange(7), np.arange(7), np.ones(7, dtype=bool))
+    assert replay_buffer.get_size() == 5
+    assert sorted(replay_buffer.get_transitions(np.arange(5))[0]) == [12, 13, 14, 15, 16]
+    replay_buffer.add_batch(np.arange(20, 22), [0, 1], [0, 0], [0, 0], [False, False])
+    assert sorted(replay_buffer.get_transitions(np.arange(5))[0]) == [14, 15, 16, 20, 21]
+    assert set(replay_buffer.sample(100)[0]) == {14, 15, 16, 20, 21}
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from arena.environments import ChromeTRexRush
+from arena.vector_environments import EMPTY_SLOT
+from arena_objects.agent import QLearningAgent
+from arena_objects.obstacles import BIRD_ID, CACTUS_ID, OBSTACLE_VELOCITY
+from games import QLearningGame
+from q_learning.state_encoders import DISTANCE_BINS, GAP_BINS, WIDTH_BINS, Y_BINS, StateEncoder
+
+
+def get_environment_features(environment, agent):
+    # The arguments of StateEncoder.encode for a single ChromeTRexRush environment
+    obstacles = environment.get_obstacles_by_distance()
+    closest_obstacle = obstacles[0] if obstacles else None
+    agent_state = 1 if agent.is_jumping() else 2 if agent.is_ducking() else 0
+    return (agent.get_x_vel(), agent_state, agent.get_x_pos() + agent.get_width(),
+            closest_obstacle.get_id() if closest_obstacle else EMPTY_SLOT,
+            closest_obstacle.get_x_pos() if closest_obstacle else 0,
+            closest_obstacle.get_width() if closest_obstacle else 0,
+            closest_obstacle.get_y_pos() if closest_obstacle else 0,
+            obstacles[1].get_x_pos() if len(obstacles) > 1 else np.nan)
+
+
+def test_played_states_agree():
+    # The states of an episode encoded one by one and as a single batch
+    q_function = np.random.default_rng(0).random(StateEncoder().get_state_shape() + (4,))
+    game = QLearningGame(QLearningAgent(random_state=1), ChromeTRexRush(high_score_file_path='', random_state=2),
+                         q_function)
+    encoder = game.get_state_encoder()
+    state_ids, features = [], []
+    for frame in range(5000):
+        if game.get_agent().has_crashed():
+            game.get_environment().reset_environment()
+            game.get_agent().reset_agent()
+        state_ids.append(encoder.encode_environment(game.get_environment(), game.get_agent()))
+        features.append(get_environment_features(game.get_environment(), game.get_agent()))
+        game.simulate_frame()
+        # Obstacles are added more often than in a QLearningGame episode, to go through more states
+        if frame % 20 == 0:
+            game.update_environment_statistics()
+    batch_state_ids = encoder.encode(*[np.array(feature) for feature in zip(*features)])
+    np.testing.assert_array_equal(batch_state_ids, state_ids)
+    assert len(np.unique(state_ids)) > 10
+
+
+@pytest.mark.parametrize('obstacle_type', [CACTUS_ID, BIRD_ID])
+@pytest.mark.parametrize('edge_offset', [-1, 0, 1])
+def test_bin_edge_states_agree(obstacle_type, edge_offset):
+    # Obstacles placed on (and next to) every bin edge of the distance, gap, width and y features
+    agent = QLearningAgent()
+    agent_end_x = agent.get_x_pos() + agent.get_width()
+    encoder = StateEncoder()
+    for distance_edge, gap_edge, width_edge, y_edge in zip(DISTANCE_BINS, GAP_BINS * 2, WIDTH_BINS, Y_BINS):
+        environment = ChromeTRexRush(high_score_file_path='')
+        closest_x = agent_end_x + distance_edge + edge_offset
+        width = width_edge + edge_offset
+        obstacle_store = environment.get_obstacle_store()
+        obstacle_store.add(obstacle_type, (closest_x, y_edge + edge_offset), OBSTACLE_VELOCITY, (0.0, 0.0), (width, 40))
+        obstacle_store.add(CACTUS_ID, (closest_x + width + gap_edge + edge_offset, 0), OBSTACLE_VELOCITY, (0.0, 0.0),
+                           (20, 40))
+        features = get_environment_features(environment, agent)
+        assert encoder.encode(*[np.array([feature]) for feature in features])[0] == \
+               encoder.encode_environment(environment, agent)
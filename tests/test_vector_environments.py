@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from arena.environments import ChromeTRexRush
+from arena.vector_environments import EMPTY_SLOT, VectorChromeTRexRush
+from arena_objects.agent import GeneticAlgorithmAgent
+from arena_objects.obstacles import OBSTACLE_VELOCITY
+from games import GeneticAlgorithmGame
+
+
+@pytest.mark.parametrize('max_obstacles', [1, 8])
+def test_vector_environment_matches_game(max_obstacles):
+    # A single agent plays the same episode in a GeneticAlgorithmGame and in a vector environment. The obstacles of the
+    # vector environment are copied to the ChromeTRexRush as they are added, as the two draw them differently from
+    # their random generators
+    weights = np.random.default_rng(1).standard_normal((4, 7))
+    vector_environment = VectorChromeTRexRush(GeneticAlgorithmAgent(weights), 1, max_obstacles=max_obstacles,
+                                              random_state=2)
+    environment = ChromeTRexRush(high_score_file_path='')
+    agent = GeneticAlgorithmAgent(weights)
+    game = GeneticAlgorithmGame([agent], 1, environment)
+    obstacle_store = environment.get_obstacle_store()
+    num_frames = 0
+    while not agent.is_done() and num_frames < 2000:
+        np.testing.assert_allclose(vector_environment.get_observations()[0], game.get_environment_state(agent))
+        action = np.argmax(weights @ vector_environment.get_observations()[0])
+        _, _, crashed = vector_environment.step([action])
+        game.simulate_frame()
+        if num_frames % 45 == 0:
+            obstacle_x, obstacle_y, obstacle_width, obstacle_height, obstacle_type = vector_environment.get_obstacles()
+            for slot in np.flatnonzero((obstacle_type[0] != EMPTY_SLOT) &
+                                       (obstacle_x[0] == vector_environment.get_environment_width())):
+                obstacle_store.add(obstacle_type[0, slot], (obstacle_x[0, slot], obstacle_y[0, slot]),
+                                   OBSTACLE_VELOCITY, (0.0, 0.0), (obstacle_width[0, slot], obstacle_height[0, slot]))
+            environment.increase_score()
+            environment.increase_level()
+        num_frames += 1
+        assert crashed[0] == agent.has_crashed()
+        assert vector_environment.get_agent_y_positions()[0] == agent.get_y_pos()
+        assert vector_environment.get_agent_x_velocities()[0] == agent.get_x_vel()
+        assert vector_environment.get_total_rewards()[0] == pytest.approx(agent.get_total_reward())
+        assert np.count_nonzero(vector_environment.get_obstacles()[4]) == len(obstacle_store)
+    assert agent.has_crashed()
+    assert vector_environment.get_current_scores()[0] == environment.get_current_score()
+    # Several obstacles were in the environment at the same time, so a single slot has to grow
+    assert vector_environment.get_max_obstacles() > 1